@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""
+Benchmarks for move_model and rename_app on generated Django projects of configurable size.
+
+Every size combination gets its own project in a temporary directory: <apps> apps with <models> models each,
+<migrations> migrations per app, cross-app FK/M2M links with the given density and <rows> extra rows in
+django_content_type and django_migrations. Models of app_0 are then moved to bench_target and the bench_rename
+app is renamed to bench_renamed, each scenario on a fresh copy of the migrated SQLite database.
+
+    python benchmarks/bench.py --apps 10,50 --models 10 --migrations 5 --density 0.3 --rows 10000
+
+Results go to a JSON file with wall time and the --profile report of every phase (wall and CPU time, peak memory,
+loader builds, state renders, written files), pass a previous file with --compare
+to get the ratios and a non-zero exit code when anything got slower than --threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+HELPER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'django-migration-helper')
+
+MANAGE_PY = """#!/usr/bin/env python
+import os
+import sys
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bench_project.settings")
+    from django.core.management import execute_from_command_line
+    execute_from_command_line(sys.argv)
+"""
+
+SETTINGS_PY = """import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET_KEY = 'benchmark'
+DEBUG = False
+USE_TZ = True
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'migration_helper',
+%(apps)s
+]
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+}
+"""
+
+APPS_PY = """from django.apps import AppConfig
+
+
+class BenchConfig(AppConfig):
+    name = %(name)r
+%(label)s"""
+
+
+class Project(object):
+    """
+    Layout of a generated project, models are kept as specs so both stages (before and after the move
+    and rename) can be rendered from the same data.
+    """
+
+    def __init__(self, apps, models, migrations, density, move, seed=0):
+        rnd = random.Random(seed)
+        self.app_labels = ['app_%d' % i for i in range(apps)]
+        self.migrations = max(migrations, 1)
+        self.moved = ['Model0_%d' % j for j in range(min(move, models))]
+        self.specs = {}  # app_label -> [(model name, [(kind, app_label, model name)], [extra fields])]
+        for i, app_label in enumerate(self.app_labels + ['bench_rename']):
+            prefix = 'Rename' if app_label == 'bench_rename' else 'Model%d_' % i
+            self.specs[app_label] = []
+            for j in range(models):
+                relations = []
+                if app_label != 'bench_rename' and i:
+                    for kind in ('fk', 'm2m'):
+                        if rnd.random() < (density if kind == 'fk' else density / 2):
+                            other = rnd.randrange(i)
+                            relations.append((kind, 'app_%d' % other, 'Model%d_%d' % (other, rnd.randrange(models))))
+                self.specs[app_label].append(('%s%d' % (prefix, j), relations, []))
+            for k in range(2, self.migrations + 1):
+                self.specs[app_label][k % models][2].append(k)
+
+    def location(self, app_label, model, stage):
+        if stage == 'move' and app_label == 'app_0' and model in self.moved:
+            return 'bench_target'
+        if stage == 'rename' and app_label == 'bench_rename':
+            return 'bench_renamed'
+        return app_label
+
+    def write(self, root):
+        os.makedirs(os.path.join(root, 'bench_project'))
+        write_file(os.path.join(root, 'manage.py'), MANAGE_PY)
+        write_file(os.path.join(root, 'bench_project', '__init__.py'), '')
+        write_file(os.path.join(root, 'bench_project', 'settings.py'), SETTINGS_PY % {
+            'apps': '\n'.join("    '%s.apps.BenchConfig'," % app for app in sorted(self.specs) + ['bench_target']),
+        })
+        for app_label in list(self.specs) + ['bench_target']:
+            os.makedirs(os.path.join(root, app_label, 'migrations'))
+            write_file(os.path.join(root, app_label, '__init__.py'), '')
+            write_file(os.path.join(root, app_label, 'migrations', '__init__.py'), '')
+        for app_label, models in self.specs.items():
+            for number, operations, dependencies in self.migration_files(app_label, models):
+                write_file(os.path.join(root, app_label, 'migrations', '%04d_bench.py' % number), (
+                    "from django.db import migrations, models\nimport django.db.models.deletion\n\n\n"
+                    "class Migration(migrations.Migration):\n\n    dependencies = %r\n\n    operations = [\n%s    ]\n"
+                ) % (dependencies, ''.join('        %s,\n' % operation for operation in operations)))
+        self.write_stage(root, 'before')
+
+    def write_stage(self, root, stage):
+        models = {app_label: [] for app_label in list(self.specs) + ['bench_target']}  # by app directory
+        for app_label, specs in self.specs.items():
+            for name, relations, extras in specs:
+                models[self.location(app_label, name, stage).replace('bench_renamed', 'bench_rename')].append(
+                    (name, relations, extras)
+                )
+        for directory, specs in models.items():
+            lines = ['from django.db import models\n']
+            for name, relations, extras in specs:
+                lines.append('\nclass %s(models.Model):\n    name = models.CharField(max_length=30)\n' % name)
+                for n, (kind, other_app, other) in enumerate(relations):
+                    to = '%s.%s' % (self.location(other_app, other, stage), other)
+                    if kind == 'fk':
+                        lines.append("    fk_%d = models.ForeignKey(%r, models.CASCADE, related_name='+')\n" % (n, to))
+                    else:
+                        lines.append("    m2m_%d = models.ManyToManyField(%r, related_name='+')\n" % (n, to))
+                for k in extras:
+                    lines.append("    extra_%d = models.CharField(max_length=10, default='')\n" % k)
+            write_file(os.path.join(root, directory, 'models.py'), '\n'.join(lines))
+        label = "    label = 'bench_renamed'\n" if stage == 'rename' else ''
+        for app_label in list(self.specs) + ['bench_target']:
+            write_file(os.path.join(root, app_label, 'apps.py'), APPS_PY % {'name': app_label, 'label': label * (
+                app_label == 'bench_rename')})
+        if stage == 'rename':  # resolve the string occurrences, as rename_app expects
+            directory = os.path.join(root, 'bench_rename', 'migrations')
+            for name in os.listdir(directory):
+                if name.endswith('.py'):
+                    path = os.path.join(directory, name)
+                    with open(path) as migration_file:
+                        content = migration_file.read()
+                    write_file(path, content.replace("'bench_rename'", "'bench_renamed'"))
+
+    def migration_files(self, app_label, models):
+        dependencies = sorted(set(
+            (other_app, '0001_bench') for name, relations, extras in models for kind, other_app, other in relations
+        ))
+        operations = []
+        for name, relations, extras in models:
+            fields = ["('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, "
+                      "verbose_name='ID'))", "('name', models.CharField(max_length=30))"]
+            for n, (kind, other_app, other) in enumerate(relations):
+                if kind == 'fk':
+                    fields.append("('fk_%d', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, "
+                                  "related_name='+', to='%s.%s'))" % (n, other_app, other))
+                else:
+                    fields.append("('m2m_%d', models.ManyToManyField(related_name='+', to='%s.%s'))"
+                                  % (n, other_app, other))
+            operations.append('migrations.CreateModel(name=%r, fields=[%s])' % (name, ', '.join(fields)))
+        yield 1, operations, dependencies
+        for k in range(2, self.migrations + 1):
+            name = models[k % len(models)][0]
+            yield k, ["migrations.AddField(model_name=%r, name='extra_%d', field=models.CharField(default='', "
+                      "max_length=10))" % (name.lower(), k)], [(app_label, '%04d_bench' % (k - 1))]
+
+
+def write_file(path, content):
+    with open(path, 'w') as output:
+        output.write(content)
+
+
+def run_driver(root, argv):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, HELPER_DIR, os.environ.get('PYTHONPATH', '')]))
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--driver'] + argv,
+        cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    if process.returncode:
+        raise RuntimeError('%s failed:\n%s' % (' '.join(argv), process.stderr))
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def fill_tables(database, project, rows):
+    labels = project.app_labels + ['bench_rename']
+    connection = sqlite3.connect(database)
+    with connection:
+        connection.executemany(
+            'INSERT INTO django_content_type (app_label, model) VALUES (?, ?)',
+            (('bench_rename' if i % 2 else labels[i % len(labels)], 'fake%d' % i) for i in range(rows)),
+        )
+        connection.executemany(
+            'INSERT INTO django_migrations (app, name, applied) VALUES (?, ?, ?)',
+            (('bench_rename' if i % 2 else labels[i % len(labels)], 'fake_%d' % i, '2017-01-01') for i in range(rows)),
+        )
+    connection.close()
+
+
+def benchmark(sizes, repeat, workdir):
+    project = Project(sizes['apps'], sizes['models'], sizes['migrations'], sizes['density'], sizes['move'])
+    template = os.path.join(workdir, 'template')
+    project.write(template)
+    run_driver(template, ['migrate', '--noinput', '--verbosity', '0'])
+    fill_tables(os.path.join(template, 'db.sqlite3'), project, sizes['rows'])
+
+    scenarios = [
+        ('move_model --dry-run', 'move', ['move_model'] + project.moved + ['app_0', 'bench_target', '--dry-run']),
+        ('move_model', 'move', ['move_model'] + project.moved + ['app_0', 'bench_target']),
+        ('move_model --migrate', 'move', ['move_model'] + project.moved + ['app_0', 'bench_target', '--migrate']),
+        ('rename_app', 'rename', ['rename_app', 'bench_rename', 'bench_renamed']),
+    ]
+    results = []
+    for (scenario, stage, argv), attempt in itertools.product(scenarios, range(repeat)):
+        root = os.path.join(workdir, 'run')
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.copytree(template, root)
+        project.write_stage(root, stage)
+        result = run_driver(root, argv + ['--noinput', '--profile', os.path.join(root, 'profile.json')])
+        result.update(scenario=scenario, attempt=attempt, sizes=sizes)
+        results.append(result)
+        print('  {:<24} {:>8.3f}s  {}'.format(scenario, result['wall'], '  '.join(
+            '{}={:.3f}s'.format(phase['name'], phase['seconds']) for phase in result['phases']
+        )))
+    return results
+
+
+def drive(argv):
+    """
+    Runs inside the generated project, times a single management command and prints the result as JSON.
+    """
+    start = time.perf_counter()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bench_project.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    setup = time.perf_counter() - start
+
+    output = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # makemigrations writer prints straight to sys.stdout
+    start = time.perf_counter()
+    call_command(*argv, stdout=sys.stdout)
+    end = time.perf_counter()
+    sys.stdout = output
+    phases = []
+    if '--profile' in argv:
+        with open(argv[argv.index('--profile') + 1]) as report:
+            phases = json.load(report)['phases']
+    for phase in phases:
+        phase['seconds'] = phase.pop('wall')
+    print(json.dumps({'setup': setup, 'wall': end - start, 'phases': phases}))
+
+
+def compare(results, previous, threshold):
+    def key(result):
+        return result['scenario'], tuple(sorted(result['sizes'].items()))
+
+    def best(items):
+        walls = {}
+        for result in items:
+            walls[key(result)] = min(walls.get(key(result), float('inf')), result['wall'])
+        return walls
+
+    current, before = best(results), best(previous['results'])
+    regressions = 0
+    for item, wall in sorted(current.items()):
+        if item in before:
+            ratio = wall / before[item] if before[item] else float('inf')
+            regressions += ratio > threshold
+            print('  {:<24} {:>8.3f}s -> {:>8.3f}s  x{:.2f}{}'.format(
+                item[0], before[item], wall, ratio, '  REGRESSION' if ratio > threshold else ''
+            ))
+    return regressions
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def main():
+    if sys.argv[1:2] == ['--driver']:
+        return drive(sys.argv[2:])
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int_list, default=[10],
+                        help='Number of apps, comma separated list for a series.')
+    parser.add_argument('--models', type=int_list, default=[10], help='Models per app.')
+    parser.add_argument('--migrations', type=int_list, default=[5], help='Historical migrations per app.')
+    parser.add_argument('--density', type=float, default=0.3, help='Chance of a cross-app FK per model, half for M2M.')
+    parser.add_argument('--rows', type=int_list, default=[1000],
+                        help='Extra rows in django_content_type and django_migrations.')
+    parser.add_argument('--move', type=int, default=1, help='Number of models moved by move_model.')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs of every scenario.')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the results.')
+    parser.add_argument('--compare', default=None, help='Previous results file to compare with.')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Slowdown ratio reported as a regression.')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated projects.')
+    options = parser.parse_args()
+
+    import django
+    results = []
+    for apps, models, migrations, rows in itertools.product(options.apps, options.models, options.migrations,
+                                                            options.rows):
+        sizes = dict(apps=apps, models=models, migrations=migrations, rows=rows, density=options.density,
+                     move=options.move)
+        print('apps={apps} models={models} migrations={migrations} rows={rows}'.format(**sizes))
+        workdir = tempfile.mkdtemp(prefix='migration_helper_bench_')
+        try:
+            results.extend(benchmark(sizes, options.repeat, workdir))
+        finally:
+            if not options.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'results': results,
+    }
+    with open(options.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    if options.compare:
+        with open(options.compare) as previous:
+            return 1 if compare(results, json.load(previous), options.threshold) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
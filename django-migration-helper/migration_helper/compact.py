@@ -0,0 +1,207 @@
+from collections import OrderedDict
+
+from django.db.migrations import Migration, operations, SeparateDatabaseAndState
+from django.db.migrations.graph import MigrationGraph
+from django.db.migrations.optimizer import MigrationOptimizer
+
+# everything move_model writes: table renames, state-only creates and deletes, re-pointed relation fields
+HELPER_OPERATIONS = (SeparateDatabaseAndState, operations.AlterModelTable, operations.AlterField)
+# what the autodetector puts next to the state-only creates and deletes
+STATE_OPERATIONS = (
+    operations.CreateModel, operations.DeleteModel, operations.AddField, operations.RemoveField,
+    operations.AlterField, operations.AlterModelTable, operations.AlterUniqueTogether, operations.AlterIndexTogether,
+)
+# move_model names the migrations of every phase <number>_<name>, older versions left them auto-named
+HELPER_MIGRATION_NAMES = {
+    'alter model tables': 'helper_rename_tables',
+    'create models': 'helper_create_models',
+    'resolve relations': 'helper_move_relations',
+    'delete models': 'helper_delete_models',
+}
+
+
+def is_helper_migration(migration):
+    """
+    True for migrations shaped like the ones move_model writes: made only of its operations, with a
+    SeparateDatabaseAndState or a table renamed to another app's name among them. Migrations named after one of
+    its phases may be plain AlterFields, like the re-pointed relations. Squashed migrations and migrations which
+    are not atomic or have run_before are never compacted.
+    """
+    if not migration.operations or not migration.atomic or migration.replaces or migration.run_before:
+        return False
+    if not all(_helper_operation(operation) for operation in migration.operations):
+        return False
+    number, _, name = migration.name.partition('_')
+    return (number.isdigit() and name in HELPER_MIGRATION_NAMES.values()) or any(
+        isinstance(operation, SeparateDatabaseAndState) or _moved_table(migration.app_label, operation)
+        for operation in migration.operations
+    )
+
+
+def find_runs(graph, app_labels):
+    """
+    Returns runs of consecutive helper migrations of every app, each of which can be replaced by a single
+    migration: no migration outside the run depends on one of its members while another member depends on it,
+    which would make the replacement depend on itself, unless the migrations in between only change the state,
+    see bridge_dependencies. Runs have at least two migrations with at least one SeparateDatabaseAndState among them.
+    """
+    runs = []
+    for app_label in app_labels:
+        leaves = graph.leaf_nodes(app_label)
+        if len(leaves) != 1:
+            continue  # no app is compacted while it has conflicting migrations
+        run = []
+        for key in [key for key in graph.forwards_plan(leaves[0]) if key[0] == app_label]:
+            migration = graph.nodes[key]
+            parents = set(parent.key for parent in graph.node_map[key].parents)
+            follows = run and set(parent for parent in parents if parent[0] == app_label) == {run[-1]}
+            if is_helper_migration(migration) and follows and not _closes_cycle(graph, run + [key], parents):
+                run.append(key)
+                continue
+            _add_run(graph, runs, run)
+            run = [key] if is_helper_migration(migration) else []
+        _add_run(graph, runs, run)
+    return runs
+
+
+def squash_run(graph, run):
+    """
+    Returns the migration replacing the run: all operations in order, adjacent state-only
+    SeparateDatabaseAndState operations merged and their state operations optimized, so state-only
+    create/delete pairs fold away, then the whole list optimized like squashmigrations does. The new
+    dependencies of its bridges are kept as `bridges`, see bridge_dependencies.
+    """
+    app_label = run[0][0]
+    migrations = [graph.nodes[key] for key in run]
+    result = []
+    for migration in migrations:
+        for operation in migration.operations:
+            if _state_only(operation) and result and _state_only(result[-1]):
+                result[-1] = SeparateDatabaseAndState(
+                    state_operations=result[-1].state_operations + operation.state_operations,
+                )
+            else:
+                result.append(operation)
+    optimizer = MigrationOptimizer()
+    folded = []
+    for operation in result:
+        if _state_only(operation):
+            state_operations = optimizer.optimize(list(operation.state_operations), app_label)
+            if not state_operations:
+                continue
+            operation = SeparateDatabaseAndState(state_operations=state_operations)
+        folded.append(operation)
+
+    squashed = Migration('%s_squashed_%s' % (run[0][1], run[-1][1]), app_label)
+    squashed.operations = optimizer.optimize(folded, app_label)
+    squashed.replaces = list(run)
+    squashed.dependencies = []
+    for migration in migrations:
+        for dependency in migration.dependencies:
+            if tuple(dependency) not in run and dependency not in squashed.dependencies:
+                squashed.dependencies.append(dependency)
+    squashed.bridges = bridge_dependencies(graph, run)
+    return squashed
+
+
+def bridge_dependencies(graph, run):
+    """
+    Returns the new dependencies of the bridges of a run: state-only migrations of other apps which depend on a
+    member and which a later member depends on, like the created models and the relations of a single move.
+    They change nothing in the database, so they are re-pointed to what the run depends on up to that member
+    and applied before the replacement, which then depends on them.
+
+    :return: {bridge key: [dependencies]}
+    """
+    members = set(run)
+    external, replacements = [], {}
+    for key in run:
+        for parent in sorted(parent.key for parent in graph.node_map[key].parents):
+            if parent not in members and parent not in external:
+                external.append(parent)
+        replacements[key] = list(external)
+    bridges = OrderedDict()
+    for key in sorted(_bridges(graph, run, external)):
+        dependencies = []
+        for dependency in graph.nodes[key].dependencies:
+            for new in replacements.get(tuple(dependency), [dependency]):
+                if new not in dependencies:
+                    dependencies.append(new)
+        bridges[key] = dependencies
+    return bridges
+
+
+def compacted_graph(graph, squashes):
+    """
+    Builds the graph a fresh database would get once the squashed migrations and their re-pointed bridges are on
+    disk: replaced migrations are left out and every other dependency on them points to their replacement.
+    """
+    replaced = dict((key, (squash.app_label, squash.name)) for squash in squashes for key in squash.replaces)
+    nodes = dict((key, migration) for key, migration in graph.nodes.items() if key not in replaced)
+    parents = dict(
+        (key, set(parent.key for parent in graph.node_map[key].parents)) for key in nodes
+    )
+    for squash in squashes:
+        for key, dependencies in getattr(squash, 'bridges', {}).items():
+            parents[key] = set(parent for parent in parents[key] if parent not in squash.replaces).union(
+                tuple(dependency) for dependency in dependencies if tuple(dependency) in graph.nodes
+            )
+    for squash in squashes:
+        key = (squash.app_label, squash.name)
+        nodes[key] = squash
+        parents[key] = set(parent.key for member in squash.replaces for parent in graph.node_map[member].parents)
+    compacted = MigrationGraph()
+    for key, migration in nodes.items():
+        compacted.add_node(key, migration)
+    for key, migration in nodes.items():
+        for parent in parents[key]:
+            parent = replaced.get(parent, parent)
+            if parent != key:
+                compacted.add_dependency(migration, key, parent, skip_validation=True)
+    compacted.validate_consistency()
+    return compacted
+
+
+def _add_run(graph, runs, run):
+    if len(run) > 1 and any(
+        isinstance(operation, SeparateDatabaseAndState) for key in run for operation in graph.nodes[key].operations
+    ):
+        runs.append(run)
+
+
+def _closes_cycle(graph, run, parents):
+    # a parent outside the run descending from a member would have to be applied both before and after it,
+    # unless everything in between only changes the state and can be applied before the run
+    return any(
+        not (is_helper_migration(graph.nodes[key]) and all(
+            _state_only(operation) for operation in graph.nodes[key].operations
+        )) for key in _bridges(graph, run, parents)
+    )
+
+
+def _bridges(graph, run, parents):
+    # migrations descending from a member which a parent outside the run descends from (or is)
+    members = set(run)
+    descendants = set(key for member in run for key in graph.backwards_plan(member)) - members
+    return set(key for parent in parents if parent not in members for key in graph.forwards_plan(parent)
+               if key in descendants)
+
+
+def _helper_operation(operation):
+    if isinstance(operation, SeparateDatabaseAndState):
+        return all(isinstance(database_operation, operations.AlterModelTable)
+                   for database_operation in operation.database_operations) and \
+            all(isinstance(state_operation, STATE_OPERATIONS) for state_operation in operation.state_operations)
+    return isinstance(operation, HELPER_OPERATIONS)
+
+
+def _moved_table(app_label, operation):
+    # a table renamed to the name another app gives the model, <target_app>_<model>
+    if not isinstance(operation, operations.AlterModelTable) or not operation.table:
+        return False
+    prefix, _, rest = operation.table.rpartition('_%s' % operation.name_lower)
+    return not rest and bool(prefix) and prefix != app_label
+
+
+def _state_only(operation):
+    return isinstance(operation, SeparateDatabaseAndState) and not operation.database_operations
@@ -0,0 +1,99 @@
+import time
+
+from django.apps import apps
+from django.db import router, transaction
+
+
+def move_content_type(using, base_app, target_app, model, chunk_size=2000, pause=0, progress=None):
+    """
+    Moves the ContentType of a model from base_app to target_app. The row is updated in place, so permissions,
+    admin log entries and generic relations keep pointing at it. If target_app already got its own ContentType,
+    permissions are merged into its ones, every row pointing at the old ContentType is re-pointed in chunks
+    and the old ContentType is deleted.
+
+    :param pause: seconds to sleep after every chunk, so big tables are never locked for long
+    :param progress: called as progress(model, field, updated) after every chunk
+    :return: 'renamed', 'merged' or None if base_app has no ContentType for the model
+    """
+    content_types = apps.get_model('contenttypes', 'ContentType')._base_manager.db_manager(using)
+    old = content_types.filter(app_label=base_app, model=model).first()
+    if old is None:
+        return None
+    new = content_types.filter(app_label=target_app, model=model).first()
+    if new is None:
+        content_types.filter(pk=old.pk).update(app_label=target_app)
+        return 'renamed'
+
+    if apps.is_installed('django.contrib.auth'):
+        _merge_permissions(using, old, new, chunk_size, pause, progress)
+    for reference_model, field in references(apps.get_model('contenttypes', 'ContentType'), using):
+        repoint(reference_model, field, old.pk, new.pk, using, chunk_size, pause, progress)
+    content_types.filter(pk=old.pk).delete()
+    return 'merged'
+
+
+def references(target, using):
+    """
+    Yields (model, field) for every concrete foreign key to target on the `using` database,
+    including the ones of auto-created M2M through models and GenericForeignKey content type fields.
+    """
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.proxy or not router.allow_migrate_model(using, model):
+            continue
+        for field in model._meta.local_fields:
+            if field.remote_field is not None and field.remote_field.model is target:
+                yield model, field
+
+
+def repoint(model, field, old_pk, new_pk, using, chunk_size=2000, pause=0, progress=None):
+    # rows leave the filter once updated, so every chunk is a short indexed query and its own transaction
+    manager = model._base_manager.db_manager(using)
+    pending = manager.filter(**{field.attname: old_pk}).order_by('pk').values_list('pk', flat=True)
+    updated = 0
+    while True:
+        pks = list(pending[:chunk_size])
+        if not pks:
+            return updated
+        with transaction.atomic(using=using):
+            updated += manager.filter(pk__in=pks).update(**{field.attname: new_pk})
+        if progress:
+            progress(model, field, updated)
+        if pause:
+            time.sleep(pause)
+
+
+def count_references(target, pk, using):
+    return sum(
+        model._base_manager.db_manager(using).filter(**{field.attname: pk}).count()
+        for model, field in references(target, using)
+    )
+
+
+def _merge_permissions(using, old, new, chunk_size, pause, progress):
+    permission_model = apps.get_model('auth', 'Permission')
+    permissions = permission_model._base_manager.db_manager(using)
+    existing = dict(permissions.filter(content_type=new).values_list('codename', 'pk'))
+    for old_permission in permissions.filter(content_type=old):
+        new_pk = existing.get(old_permission.codename)
+        if new_pk is None:
+            permissions.filter(pk=old_permission.pk).update(content_type=new)
+            continue
+        for model, field in references(permission_model, using):
+            if model._meta.auto_created:
+                # users and groups having both permissions keep the new one, the old row would break uniqueness
+                owner = next(other for other in model._meta.local_fields
+                             if other.remote_field is not None and other is not field)
+                rows = model._base_manager.db_manager(using)
+                holders = rows.filter(**{field.attname: new_pk}).order_by(owner.attname).values_list(
+                    owner.attname, flat=True
+                )
+                last = None
+                while True:
+                    chunk = list((holders if last is None else holders.filter(**{owner.attname + '__gt': last}))
+                                 [:chunk_size])
+                    if not chunk:
+                        break
+                    rows.filter(**{field.attname: old_permission.pk, owner.attname + '__in': chunk}).delete()
+                    last = chunk[-1]
+            repoint(model, field, old_permission.pk, new_pk, using, chunk_size, pause, progress)
+        permissions.filter(pk=old_permission.pk).delete()
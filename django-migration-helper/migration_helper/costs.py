@@ -0,0 +1,205 @@
+from collections import namedtuple
+
+from django.db import DatabaseError
+from django.db.migrations import operations, SeparateDatabaseAndState
+
+# scans and rewrites of tables this big are flagged, they're worth splitting or scheduling apart
+HIGH_COST_ROWS = 100000
+# SQLite has no row estimates, rows are counted up to this many
+SQLITE_COUNT_LIMIT = 1000000
+
+# what every effect reads or writes, and the lock it holds, by vendor
+EFFECTS = {
+    'rename': 'renamed in the catalog, no rows read',
+    'alter': 'altered in the catalog, no rows read',
+    'scan': 'every row is read',
+    'rewrite': 'every row is rewritten',
+}
+LOCKS = {
+    'postgresql': {
+        'rename': 'ACCESS EXCLUSIVE', 'alter': 'ACCESS EXCLUSIVE', 'scan': 'SHARE ROW EXCLUSIVE',
+        'rewrite': 'ACCESS EXCLUSIVE',
+    },
+    'mysql': {
+        'rename': 'exclusive metadata lock', 'alter': 'exclusive metadata lock',
+        'scan': 'shared metadata lock, writes blocked', 'rewrite': 'shared metadata lock, writes blocked',
+    },
+    'sqlite': dict((effect, 'database write lock') for effect in ('rename', 'alter', 'scan', 'rewrite')),
+}
+
+TableStats = namedtuple('TableStats', 'rows size approximate capped')
+Cost = namedtuple('Cost', 'table effect lock stats')
+
+
+def table_stats(connection, tables):
+    """
+    Returns {table: TableStats} from the catalog statistics of the backend: reltuples and the total relation
+    size on PostgreSQL, information_schema.TABLES on MySQL, both approximate. SQLite counts rows up to
+    SQLITE_COUNT_LIMIT (capped is True when there are more) and reads sizes from dbstat when it's compiled in.
+    Tables which don't exist are left out.
+    """
+    tables = sorted(set(tables))
+    if not tables:
+        return {}
+    stats = {}
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid) FROM pg_class c '
+                'WHERE c.relkind = %%s AND pg_table_is_visible(c.oid) AND c.relname IN (%s)'
+                % ', '.join(['%s'] * len(tables)), ['r'] + tables,
+            )
+            for table, rows, size in cursor.fetchall():
+                stats[table] = TableStats(max(rows, 0), size, True, False)
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN (%s)' % ', '.join(['%s'] * len(tables)), tables,
+            )
+            for table, rows, size in cursor.fetchall():
+                stats[table] = TableStats(rows, size, True, False)
+        elif connection.vendor == 'sqlite':
+            existing = set(connection.introspection.table_names(cursor))
+            for table in tables:
+                if table not in existing:
+                    continue
+                cursor.execute('SELECT COUNT(*) FROM (SELECT 1 FROM %s LIMIT %d)' % (
+                    connection.ops.quote_name(table), SQLITE_COUNT_LIMIT,
+                ))
+                rows = cursor.fetchone()[0]
+                stats[table] = TableStats(rows, _sqlite_size(connection, table), False, rows >= SQLITE_COUNT_LIMIT)
+    return stats
+
+
+def estimate_migrations(connection, migrations, state):
+    """
+    Estimates the database operations of the migrations, applied in the given order on top of the state,
+    which is moved forward. Tables are looked up under their current names, before the renames of the
+    migrations. Returns [(migration, operation, [Cost] or None when nothing is known about the operation)],
+    with catalog statistics read once for all tables.
+    """
+    estimates = []
+    renamed = {}  # table name after a rename: table name now
+    for migration in migrations:
+        for operation in migration.operations:
+            database_operations = (
+                operation.database_operations if isinstance(operation, SeparateDatabaseAndState) else [operation]
+            )
+            from_state = state.clone()
+            for database_operation in database_operations:
+                to_state = from_state.clone()
+                database_operation.state_forwards(migration.app_label, to_state)
+                effects = operation_effects(
+                    connection, migration.app_label, database_operation, from_state.apps, to_state.apps,
+                )
+                if effects is not None:
+                    current = []
+                    for table, effect, new_table in effects:
+                        table = renamed.get(table, table)
+                        if new_table is not None:
+                            renamed[new_table] = table
+                        current.append((table, effect))
+                    effects = current
+                estimates.append((migration, database_operation, effects))
+                from_state = to_state
+            operation.state_forwards(migration.app_label, state)
+
+    stats = table_stats(connection, [
+        table for migration, operation, effects in estimates for table, effect in effects or ()
+    ])
+    locks = LOCKS.get(connection.vendor, {})
+    return [
+        (migration, operation, None if effects is None else [
+            Cost(table, effect, locks.get(effect), stats.get(table)) for table, effect in effects
+        ])
+        for migration, operation, effects in estimates
+    ]
+
+
+def rename_costs(connection, tables):
+    """
+    Returns a Cost for every (old name, new name) table rename, by the old name.
+    """
+    stats = table_stats(connection, [old_table for old_table, new_table in tables])
+    lock = LOCKS.get(connection.vendor, {}).get('rename')
+    return [Cost(old_table, 'rename', lock, stats.get(old_table)) for old_table, new_table in tables]
+
+
+def operation_effects(connection, app_label, operation, from_apps, to_apps):
+    """
+    Returns [(table, effect, new table name or None)] for the tables a database operation touches,
+    effects as in EFFECTS, or None for operations nothing is known about.
+    """
+    if isinstance(operation, operations.AlterModelTable):
+        old_model = from_apps.get_model(app_label, operation.name)
+        new_model = to_apps.get_model(app_label, operation.name)
+        new_fields = dict((field.name, field) for field in new_model._meta.local_many_to_many)
+        tables = [(old_model._meta.db_table, new_model._meta.db_table)] + [
+            (field.remote_field.through._meta.db_table, new_fields[field.name].remote_field.through._meta.db_table)
+            for field in old_model._meta.local_many_to_many
+            if field.name in new_fields and field.remote_field.through._meta.auto_created
+        ]
+        return [(old_table, 'rename', new_table) for old_table, new_table in tables if old_table != new_table]
+    if isinstance(operation, operations.AlterField):
+        model = from_apps.get_model(app_label, operation.model_name)
+        old_field = model._meta.get_field(operation.name)
+        new_field = to_apps.get_model(app_label, operation.model_name)._meta.get_field(operation.name)
+        if old_field.many_to_many:
+            through = old_field.remote_field.through
+            if not through._meta.auto_created:
+                return []
+            # the foreign key of the through table is altered
+            return [(through._meta.db_table, 'rewrite' if connection.vendor != 'postgresql' else 'scan', None)]
+        return [(model._meta.db_table, _field_effect(connection, old_field, new_field), None)]
+    return None
+
+
+def format_cost(cost):
+    """
+    One line describing the cost of an operation on a table, starting with HIGH COST when it's flagged.
+    """
+    if cost.stats is None:
+        size = 'no statistics'
+    else:
+        prefix = '>' if cost.stats.capped else '~' if cost.stats.approximate else ''
+        size = '{}{:,} rows, {}'.format(prefix, cost.stats.rows, _format_size(cost.stats.size))
+    return '{}{}: {}; {}{}'.format(
+        'HIGH COST ' if is_high_cost(cost) else '', cost.table, size, EFFECTS[cost.effect],
+        '; {}'.format(cost.lock) if cost.lock else '',
+    )
+
+
+def is_high_cost(cost):
+    return cost.effect in ('scan', 'rewrite') and cost.stats is not None and cost.stats.rows >= HIGH_COST_ROWS
+
+
+def _field_effect(connection, old_field, new_field):
+    if connection.vendor == 'sqlite':
+        return 'rewrite'  # every altered field remakes the table
+    old_parameters, new_parameters = old_field.db_parameters(connection), new_field.db_parameters(connection)
+    if old_parameters['type'] != new_parameters['type']:
+        return 'rewrite'
+    if (old_field.null, old_field.unique, old_field.db_index) != (new_field.null, new_field.unique, new_field.db_index):
+        return 'scan'
+    if new_field.remote_field and new_field.db_constraint:
+        # the foreign key is added again and validated, MySQL copies the table to do so
+        return 'rewrite' if connection.vendor == 'mysql' else 'scan'
+    return 'alter'
+
+
+def _sqlite_size(connection, table):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+            return cursor.fetchone()[0]
+    except DatabaseError:  # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+        return None
+
+
+def _format_size(size):
+    if size is None:
+        return 'size unknown'
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return '{:.0f} {}'.format(size, unit) if unit == 'B' else '{:.1f} {}'.format(size, unit)
+        size /= 1024.0
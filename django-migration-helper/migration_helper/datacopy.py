@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+
+class ModelCopy(object):
+    """
+    Copies the rows of a model table from one database alias to another in primary key order, chunk by chunk,
+    so memory stays flat whatever the table size. Rows are inserted as they are stored, field by field
+    without save() or pre_save(). An interrupted copy resumes after the last copied primary key.
+
+    :param source_model: model reading the source table, e.g. from the migration state before moving
+    :param target_model: model of the table created on the target alias
+    :param checkpoint_path: file keeping the last copied primary key between runs
+    """
+
+    def __init__(self, source_model, target_model, source, target, chunk_size=2000, checkpoint_path=None):
+        self.source_model = source_model
+        self.target_model = target_model
+        self.source = source
+        self.target = target
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.fields = target_model._meta.concrete_fields
+        self.attnames = [field.attname for field in self.fields]
+        self.pk_index = self.attnames.index(target_model._meta.pk.attname)
+
+    def create_table(self):
+        connection = connections[self.target]
+        if self.target_model._meta.db_table in connection.introspection.table_names():
+            return False
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(self.target_model)
+        return True
+
+    def copy(self, progress=None):
+        """
+        Copies the rows not copied yet, calls progress(copied) after every chunk and returns the number of rows.
+        """
+        connection = connections[self.target]
+        insert_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            connection.ops.quote_name(self.target_model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in self.fields),
+            ', '.join(['%s'] * len(self.fields)),
+        )
+        last = self._resume_point()
+        copied = 0
+        for rows in self._chunks(self.source_model, self.source, last):
+            with transaction.atomic(using=self.target), connection.cursor() as cursor:
+                cursor.executemany(insert_sql, [
+                    [field.get_db_prep_save(value, connection=connection) for field, value in zip(self.fields, row)]
+                    for row in rows
+                ])
+            copied += len(rows)
+            self._write_checkpoint(rows[-1][self.pk_index])
+            if progress:
+                progress(copied)
+        return copied
+
+    def reset_sequences(self):
+        connection = connections[self.target]
+        statements = connection.ops.sequence_reset_sql(no_style(), [self.target_model])
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def verify(self):
+        """
+        Returns ((source count, source checksum), (target count, target checksum)), both read in chunks.
+        """
+        return self._checksum(self.source_model, self.source), self._checksum(self.target_model, self.target)
+
+    def _checksum(self, model, alias):
+        count, checksum = 0, hashlib.sha1()
+        for rows in self._chunks(model, alias):
+            count += len(rows)
+            for row in rows:
+                # values are normalized by the fields, backends may return e.g. different numeric types
+                checksum.update(repr([field.to_python(value) for field, value in zip(self.fields, row)]).encode())
+        return count, checksum.hexdigest()
+
+    def _chunks(self, model, alias, last=None):
+        # keyset pagination, every query is limited to a chunk and an interrupted copy continues after `last`
+        queryset = model._base_manager.db_manager(alias).order_by('pk').values_list(*self.attnames)
+        while True:
+            chunk = queryset if last is None else queryset.filter(pk__gt=last)
+            rows = list(chunk[:self.chunk_size].iterator())
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][self.pk_index]
+
+    def _resume_point(self):
+        checkpoint = None
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = self.target_model._meta.pk.to_python(json.load(checkpoint_file)['last_pk'])
+        # the checkpoint is written after every commit, rows committed just before an interruption are on the target
+        committed = self.target_model._base_manager.db_manager(self.target).order_by('-pk').values_list(
+            'pk', flat=True
+        ).first()
+        candidates = [pk for pk in (checkpoint, committed) if pk is not None]
+        return max(candidates) if candidates else None
+
+    def _write_checkpoint(self, last_pk):
+        if not self.checkpoint_path:
+            return
+        with open(self.checkpoint_path + '.tmp', 'w') as checkpoint_file:
+            json.dump({'table': self.target_model._meta.db_table, 'target': self.target, 'last_pk': last_pk},
+                      checkpoint_file, default=str)
+        os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
@@ -0,0 +1,77 @@
+from collections import OrderedDict, defaultdict
+
+from django.db.migrations.writer import MigrationWriter
+
+from migration_helper.relations import model_key, state_fields
+
+# relation targets may have moved as well, they are compared by model name only
+RELATION_KWARGS = ('to', 'through')
+
+
+def field_signature(app_label, name, field):
+    """
+    Describes a field by its name, class, arguments and options as migrations serialize them.
+    Relation targets are reduced to the model name, so a field pointing at a model moved along still matches.
+    """
+    field_name, path, args, kwargs = field.deconstruct()
+    options = []
+    for key, value in sorted(kwargs.items()):
+        if key in RELATION_KWARGS:
+            value = model_key(value, app_label)[1]
+        else:
+            value = _serialize(value)
+        options.append((key, value))
+    return name, path, tuple(_serialize(arg) for arg in args), tuple(options)
+
+
+def model_signature(app_label, fields):
+    return frozenset(field_signature(app_label, name, field) for name, field in fields)
+
+
+def discover_moves(state, live_apps):
+    """
+    Matches models which disappeared from an app of the migration state with models of the same name which
+    appeared in another app of the registry and have the same field signatures. Every model is signed once
+    and looked up in a hash index, so the time grows linearly with the number of changed models.
+
+    :return: (moves, differing, ambiguous), moves as {(base_app, target_app): [model names]},
+        differing as [(old key, new key)] of same-named models whose fields changed,
+        ambiguous as [(new key, [old keys])] of models matching several disappeared ones
+    """
+    live = dict(
+        ((model._meta.app_label, model._meta.model_name), model) for model in live_apps.get_models()
+        if not model._meta.proxy
+    )
+    installed = set(config.label for config in live_apps.get_app_configs())
+    disappeared = defaultdict(list)  # model name: [old keys]
+    for key, model_state in state.models.items():
+        if key[0] in installed and key not in live and not model_state.options.get('proxy'):
+            disappeared[key[1]].append(key)
+
+    index = defaultdict(list)  # (model name, signature): [old keys]
+    for model_name, keys in disappeared.items():
+        for key in keys:
+            index[model_name, model_signature(key[0], state_fields(state.models[key]))].append(key)
+
+    moves, differing, ambiguous = OrderedDict(), [], []
+    for key in sorted(live):
+        if key in state.models or key[1] not in disappeared:
+            continue
+        model = live[key]
+        fields = [(field.name, field) for field in model._meta.local_fields + model._meta.local_many_to_many]
+        matched = index.get((key[1], model_signature(key[0], fields)), [])
+        if len(matched) == 1:
+            moves.setdefault((matched[0][0], key[0]), []).append(key[1])
+        elif matched:
+            ambiguous.append((key, sorted(matched)))
+        else:
+            differing.extend((old_key, key) for old_key in disappeared[key[1]])
+    return moves, differing, ambiguous
+
+
+def _serialize(value):
+    # the way the value is written to a migration file, a stable text for callables, validators and the like
+    try:
+        return MigrationWriter.serialize(value)[0]
+    except ValueError:
+        return repr(value)
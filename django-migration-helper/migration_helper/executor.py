@@ -0,0 +1,107 @@
+import time
+
+from django.db.migrations import SeparateDatabaseAndState
+from django.db.migrations.exceptions import InvalidMigrationPlan
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.recorder import MigrationRecorder
+
+
+class InMemoryMigrationExecutor(MigrationExecutor):
+    """
+    MigrationExecutor working on an already loaded graph, nothing is loaded from disk again.
+    """
+
+    def __init__(self, connection, loader, progress_callback=None):
+        self.connection = connection
+        self.loader = loader
+        self.recorder = MigrationRecorder(self.connection)
+        self.progress_callback = progress_callback
+
+    def apply_nodes(self, nodes, state, applied=(), lock_guard=None):
+        """
+        Applies exactly the given (app_label, name) nodes, in graph order, on top of the project state
+        they were generated from. Returns the new state and [(node, seconds)] for every applied migration.
+
+        :param applied: nodes already applied on this database, they only move the state forward
+        :param lock_guard: LockGuard every migration is applied with, from a copy of the state so it can be retried
+        """
+        plan = self._plan_nodes(nodes)
+        self.recorder.ensure_schema()
+        state.apps  # rendered once, every migration below only reloads the models it touches
+        timings = []
+        for migration, backwards in plan:
+            if (migration.app_label, migration.name) in applied:
+                state = migration.mutate_state(state, preserve=False)
+                continue
+            start = time.perf_counter()
+            if lock_guard is not None and lock_guard.enabled:
+                state = lock_guard.run('%s.%s' % (migration.app_label, migration.name), lambda: self.apply_migration(
+                    state.clone(), migration,
+                ))
+            else:
+                state = self.apply_migration(state, migration)
+            timings.append(((migration.app_label, migration.name), time.perf_counter() - start))
+        return state, timings
+
+    def rehearse_nodes(self, nodes, state, rehearsal):
+        """
+        Applies the nodes like apply_nodes, every operation as a step of the rehearsal and the deferred SQL
+        of every migration as another one, all inside the migration's transaction. Returns the new state.
+        """
+        plan = self._plan_nodes(nodes)
+        self.recorder.ensure_schema()
+        state.apps
+        for migration, backwards in plan:
+            label = '%s.%s' % (migration.app_label, migration.name)
+            with self.connection.schema_editor(atomic=migration.atomic) as schema_editor:
+                for operation in migration.operations:
+                    old_state = state.clone()
+                    operation.state_forwards(migration.app_label, state)
+                    with rehearsal.step('%s: %s' % (label, _describe(operation))):
+                        operation.database_forwards(migration.app_label, schema_editor, old_state, state)
+                if schema_editor.deferred_sql:
+                    # run here instead of on exit, so it is timed while its locks are still held
+                    with rehearsal.step('%s: deferred SQL' % label):
+                        for statement in schema_editor.deferred_sql:
+                            schema_editor.execute(statement)
+                    schema_editor.deferred_sql = []
+            for app_label, name in migration.replaces or [(migration.app_label, migration.name)]:
+                self.recorder.record_applied(app_label, name)
+        return state
+
+    def collect_nodes_sql(self, nodes, state):
+        """
+        Returns {node: [statements]} with the SQL every node would run, the given state is left untouched.
+        """
+        state = state.clone()
+        statements = {}
+        for migration, backwards in self._plan_nodes(nodes):
+            with self.connection.schema_editor(collect_sql=True, atomic=migration.atomic) as schema_editor:
+                state = migration.apply(state, schema_editor, collect_sql=True)
+            statements[(migration.app_label, migration.name)] = schema_editor.collected_sql
+        return statements
+
+    def _plan_nodes(self, nodes):
+        # the given nodes are planned even when applied already, e.g. by an interrupted run
+        applied = set(self.loader.applied_migrations) - set(nodes)
+        plan = []
+        for node in nodes:
+            for key in self.loader.graph.forwards_plan(node):
+                if key not in applied:
+                    plan.append((self.loader.graph.nodes[key], False))
+                    applied.add(key)
+        unexpected = set((migration.app_label, migration.name) for migration, backwards in plan) - set(nodes)
+        if unexpected:
+            raise InvalidMigrationPlan(
+                "Migrations %s are not applied yet and would have to be applied as well."
+                % ', '.join('%s.%s' % key for key in sorted(unexpected))
+            )
+        return plan
+
+
+def _describe(operation):
+    # SeparateDatabaseAndState only describes itself as a combination, its database side is what runs here
+    if isinstance(operation, SeparateDatabaseAndState):
+        return '; '.join(database_operation.describe() for database_operation in operation.database_operations
+                         ) or 'State only'
+    return operation.describe()
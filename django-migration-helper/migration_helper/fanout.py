@@ -0,0 +1,128 @@
+import io
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+class Target(namedtuple('Target', 'alias schema')):
+    """
+    A database alias, optionally narrowed to a PostgreSQL schema, written as alias or alias:schema.
+    """
+
+    def __str__(self):
+        return self.alias if self.schema is None else '%s:%s' % (self.alias, self.schema)
+
+
+TargetResult = namedtuple('TargetResult', 'target ok seconds output error')
+
+
+def parse_targets(database, schemas=None):
+    """
+    Parses --database and --schemas into targets, in the given order and without duplicates.
+
+    :param database: an alias, comma separated aliases or alias:schema pairs, or "all" for every alias
+    :param schemas: comma separated PostgreSQL schemas, every alias given without a schema runs in each of them
+    """
+    items = list(connections) if database == 'all' else [item.strip() for item in database.split(',') if item.strip()]
+    schemas = [schema.strip() for schema in (schemas or '').split(',') if schema.strip()]
+    targets = []
+    for item in items:
+        alias, _, schema = item.partition(':')
+        if alias not in connections:
+            raise ValueError("Database '%s' is not defined in DATABASES." % alias)
+        if schema:
+            expanded = [Target(alias, schema)]
+        elif schemas:
+            expanded = [Target(alias, name) for name in schemas]
+        else:
+            expanded = [Target(alias, None)]
+        for target in expanded:
+            if target.schema is not None and connections[alias].vendor != 'postgresql':
+                raise ValueError("Schemas are only supported on PostgreSQL, '%s' is %s." % (
+                    alias, connections[alias].vendor,
+                ))
+            if target not in targets:
+                targets.append(target)
+    if not targets:
+        raise ValueError('No database given.')
+    return targets
+
+
+@contextmanager
+def use_target(target):
+    """
+    Points the connection of the current thread at the target schema, the connection is closed afterwards
+    so the next user gets the default search_path again.
+    """
+    if target.schema is None:
+        yield connections[target.alias]
+        return
+    connection = connections[target.alias]
+    with connection.cursor() as cursor:
+        cursor.execute('SET search_path TO %s' % connection.ops.quote_name(target.schema))
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+def run_targets(targets, function, workers=4, done=None):
+    """
+    Runs function(target, stdout) for every target in a pool of at most `workers` threads. Django connections
+    are per thread, so every target gets its own. A failing target doesn't stop the others, its error is kept.
+
+    :param done: called as done(result) in the calling thread as soon as a target finishes
+    :return: [TargetResult] in the order of targets
+    """
+
+    def run(target):
+        stdout = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with use_target(target):
+                function(target, stdout)
+        except Exception as error:
+            return TargetResult(target, False, time.perf_counter() - start, stdout.getvalue(),
+                                '%s: %s' % (type(error).__name__, error))
+        finally:
+            # pooled threads are reused, the next target must not inherit this connection
+            connections[target.alias].close()
+        return TargetResult(target, True, time.perf_counter() - start, stdout.getvalue(), None)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(targets)))) as pool:
+        futures = [pool.submit(run, target) for target in targets]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.target] = result
+            if done:
+                done(result)
+    return [results[target] for target in targets]
+
+
+def target_output(result):
+    """
+    Returns the heading of a finished target followed by everything it wrote.
+    """
+    heading = '  %s %s in %.3fs.' % (result.target, 'done' if result.ok else 'failed', result.seconds)
+    return '\n'.join(line for line in [heading, result.output.rstrip('\n'), result.error and '    ' + result.error]
+                     if line)
+
+
+def summary(results):
+    lines = ['  {:<30} {:>8} {:>9}'.format('target', 'status', 'time [s]')]
+    for result in results:
+        lines.append('  {:<30} {:>8} {:>9.3f}  {}'.format(
+            str(result.target), 'ok' if result.ok else 'failed', result.seconds, result.error or '',
+        ).rstrip())
+    return '\n'.join(lines)
+
+
+def failed_targets(results):
+    """
+    Returns the failed targets as a --database value retrying exactly them.
+    """
+    return ','.join(str(result.target) for result in results if not result.ok)
@@ -0,0 +1,94 @@
+import json
+import os
+from collections import OrderedDict
+
+from django.db.migrations import Migration
+from django.db.migrations.writer import MigrationWriter
+
+JOURNAL_VERSION = 1
+
+
+class Journal(object):
+    """
+    Keeps the progress of a move in a JSON file: the migrations the graph ended with when it started, every
+    finished phase with the migrations it wrote and the values later phases need, and the migrations of the
+    phase being written. A run with the same journal continues after the last finished phase.
+
+    :param inputs: command arguments the journal belongs to, a journal of other arguments is refused
+    """
+
+    def __init__(self, path, **inputs):
+        self.path = path
+        self.inputs = inputs
+        self.leaves = None
+        self.phases = OrderedDict()
+        self.pending = []
+        if os.path.exists(path):
+            self._read()
+
+    @property
+    def started(self):
+        return self.leaves is not None
+
+    def done(self, phase):
+        return phase in self.phases
+
+    def nodes(self):
+        """
+        Migrations written by the finished phases, in the order they were written.
+        """
+        return [node for phase in self.phases.values() for node in phase['nodes']]
+
+    def start(self, leaves):
+        self.leaves = sorted(leaves)
+        self._write()
+
+    def expect(self, nodes):
+        # recorded before the files are written, so files of an interrupted phase can be found and removed
+        self.pending.extend(nodes)
+        self._write()
+
+    def finish(self, phase, nodes=(), **values):
+        self.phases[phase] = {'nodes': list(nodes), 'values': values}
+        self.pending = []
+        self._write()
+
+    def discard_pending(self):
+        """
+        Removes the migration files written by a phase which didn't finish, returns their paths.
+        """
+        removed = []
+        for app_label, name in self.pending:
+            path = MigrationWriter(Migration(name, app_label)).path
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+        self.pending = []
+        self._write()
+        return removed
+
+    def _read(self):
+        with open(self.path) as journal_file:
+            journal = json.load(journal_file)
+        if journal.get('version') != JOURNAL_VERSION:
+            raise ValueError('%s is not a journal of version %s.' % (self.path, JOURNAL_VERSION))
+        if journal['inputs'] != json.loads(json.dumps(self.inputs)):
+            raise ValueError('%s records another move: %s.' % (self.path, ', '.join(
+                '%s=%s' % (key, value) for key, value in sorted(journal['inputs'].items())
+            )))
+        self.leaves = [tuple(node) for node in journal['leaves']]
+        for name, phase in journal['phases']:
+            self.phases[name] = {'nodes': [tuple(node) for node in phase['nodes']], 'values': phase['values']}
+        self.pending = [tuple(node) for node in journal['pending']]
+
+    def _write(self):
+        journal = {
+            'version': JOURNAL_VERSION,
+            'inputs': self.inputs,
+            'leaves': self.leaves,
+            'phases': list(self.phases.items()),
+            'pending': self.pending,
+        }
+        with open(self.path + '.tmp', 'w') as journal_file:
+            json.dump(journal, journal_file, indent=2)
+        os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,356 @@
+import ast
+import hashlib
+import json
+import os
+import pickle
+import stat
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module, reload
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db.migrations import Migration, swappable_dependency
+from django.db.migrations.exceptions import BadMigrationError
+from django.db.migrations.loader import MIGRATIONS_MODULE_NAME, MigrationLoader
+
+CACHE_VERSION = 2
+# per app caches live apart from the project state cache, an app may be labelled anything
+APPS_CACHE_DIR = 'apps'
+MIGRATION_ATTRIBUTES = ('dependencies', 'operations', 'replaces', 'run_before', 'initial', 'atomic')
+# everything the graph is built from, operations aside
+GRAPH_ATTRIBUTES = ('dependencies', 'replaces', 'run_before', 'initial', 'atomic')
+# trees with at least this many migration files are parsed in a process pool
+PARALLEL_PARSE_FILES = 2000
+
+# migrations.swappable_dependency(settings.<setting>) in a parsed file, resolved against the settings later
+Swappable = namedtuple('Swappable', 'setting')
+
+
+class MigrationsPackageMixin(object):
+
+    def _import_migrations_module(self, app_label):
+        # same rules as MigrationLoader.load_disk, only the migrations package itself is imported
+        module_name, explicit = self._migrations_module(app_label)
+        if module_name is None:
+            return None
+        was_loaded = module_name in sys.modules
+        try:
+            module = import_module(module_name)
+        except ImportError as e:
+            if ((explicit and self.ignore_no_migrations) or (
+                    not explicit and "No module named" in str(e) and MIGRATIONS_MODULE_NAME in str(e))):
+                return None
+            raise
+        if getattr(module, '__file__', None) is None or not hasattr(module, '__path__'):
+            return None
+        if was_loaded:
+            reload(module)
+        return module
+
+    def _migrations_module(self, app_label):
+        # (module name, explicitly set in MIGRATION_MODULES), Django < 1.11 returns the module name alone
+        result = self.migrations_module(app_label)
+        return result if isinstance(result, tuple) else (result, False)
+
+
+class CachedMigrationLoader(MigrationsPackageMixin, MigrationLoader):
+    """
+    MigrationLoader keeping the migration graph and the project state in ``cache_dir``.
+
+    Every app has its own JSON cache file in ``cache_dir/apps`` with the graph attributes of its migrations, keyed
+    by the path, mtime and content hash of its migration files, so only apps whose files changed are imported
+    again; the operations of a cached migration are imported from its file when they are first used. The project
+    state at the leaf nodes is pickled once for the whole graph and reused as long as no app changed.
+
+    Unpickling runs code, so ``cache_dir`` must be trusted: it is created readable by its owner only, and a
+    directory owned by another user or writable by others raises ValueError.
+    """
+
+    def __init__(self, connection, cache_dir, load=True, ignore_no_migrations=False):
+        self.cache_dir = cache_dir
+        self.fingerprints = {}
+        _private_directory(cache_dir)
+        _private_directory(os.path.join(cache_dir, APPS_CACHE_DIR))
+        super().__init__(connection, load=load, ignore_no_migrations=ignore_no_migrations)
+
+    def load_disk(self):
+        self.disk_migrations = {}
+        self.unmigrated_apps = set()
+        self.migrated_apps = set()
+        for app_config in apps.get_app_configs():
+            module = self._import_migrations_module(app_config.label)
+            if module is None:
+                self.unmigrated_apps.add(app_config.label)
+                continue
+            self.migrated_apps.add(app_config.label)
+            fingerprint = self._fingerprint(os.path.dirname(module.__file__))
+            self.fingerprints[app_config.label] = fingerprint
+            names = set(os.path.basename(path)[:-3] for path, mtime, digest in fingerprint)
+            migrations = self._read_cache(os.path.join(APPS_CACHE_DIR, app_config.label), self._app_key(fingerprint),
+                                          serializer=json)
+            if migrations is None or set(migrations) != names:
+                self._load_app(app_config.label, module.__name__, fingerprint)
+                continue
+            for name, attributes in migrations.items():
+                self.disk_migrations[app_config.label, name] = CachedMigration(
+                    name, app_config.label, module.__name__, dict(
+                        (attribute, _graph_value(attribute, value)) for attribute, value in attributes.items()
+                    ),
+                )
+
+    def project_state(self, nodes=None, at_end=True):
+        if nodes is not None or not at_end:
+            return super().project_state(nodes=nodes, at_end=at_end)
+        key = _digest((sorted(self.fingerprints.items()), sorted(self.graph.nodes), sorted(self.unmigrated_apps)))
+        state = self._read_cache('project_state', key)
+        if state is None:
+            state = super().project_state()
+            self._write_cache('project_state', key, state)
+        return state
+
+    @staticmethod
+    def _fingerprint(directory):
+        files = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.py') and name[0] not in '_.~':
+                path = os.path.join(directory, name)
+                with open(path, 'rb') as migration_file:
+                    digest = hashlib.sha1(migration_file.read()).hexdigest()
+                files.append((path, os.path.getmtime(path), digest))
+        return tuple(files)
+
+    @staticmethod
+    def _app_key(fingerprint):
+        # swappable dependencies are cached as resolved when the files were imported
+        return _digest((fingerprint, settings.AUTH_USER_MODEL))
+
+    def _load_app(self, app_label, module_name, fingerprint):
+        migrations = {}
+        cacheable = True
+        for path, mtime, digest in fingerprint:
+            name = os.path.basename(path)[:-3]
+            migration_module = import_module('%s.%s' % (module_name, name))
+            if not hasattr(migration_module, 'Migration'):
+                raise BadMigrationError("Migration %s in app %s has no Migration class" % (name, app_label))
+            migration = migration_module.Migration(name, app_label)
+            self.disk_migrations[app_label, name] = migration
+            # migrations overriding anything but the plain attributes can't be restored from cache
+            cacheable &= set(vars(type(migration))) <= set(MIGRATION_ATTRIBUTES + ('__module__', '__doc__'))
+            migrations[name] = dict((attribute, _graph_json(getattr(migration, attribute)))
+                                    for attribute in GRAPH_ATTRIBUTES)
+        if cacheable:
+            self._write_cache(os.path.join(APPS_CACHE_DIR, app_label), self._app_key(fingerprint), migrations,
+                              serializer=json)
+
+    def _cache_path(self, name, serializer):
+        return os.path.join(self.cache_dir, '%s.%s' % (name, serializer.__name__))
+
+    def _read_cache(self, name, key, serializer=pickle):
+        try:
+            with open(self._cache_path(name, serializer), 'rb') as cache_file:
+                data = cache_file.read()
+            version, cached_key, value = serializer.loads(data.decode() if serializer is json else data)
+        except Exception:  # missing, stale or unreadable cache is just a miss
+            return None
+        if (tuple(version), cached_key) != ((CACHE_VERSION, django.get_version()), key):
+            return None
+        return value
+
+    def _write_cache(self, name, key, value, serializer=pickle):
+        path = self._cache_path(name, serializer)
+        try:
+            if serializer is json:
+                data = json.dumps([(CACHE_VERSION, django.get_version()), key, value]).encode()
+            else:
+                data = pickle.dumps(((CACHE_VERSION, django.get_version()), key, value), pickle.HIGHEST_PROTOCOL)
+        except Exception:  # e.g. lambdas in RunPython, such apps are simply not cached
+            return
+        with open(path + '.tmp', 'wb') as cache_file:
+            cache_file.write(data)
+        os.replace(path + '.tmp', path)
+
+
+class CachedMigration(Migration):
+    """
+    Migration restored from the graph attributes in the cache, its operations are imported from its file the
+    first time they are used.
+    """
+
+    def __init__(self, name, app_label, module_name, attributes):
+        self.name = name
+        self.app_label = app_label
+        self.module_name = module_name
+        self.dependencies = []
+        self.run_before = []
+        self.replaces = []
+        self._operations = None
+        self.__dict__.update(attributes)
+
+    @property
+    def operations(self):
+        if self._operations is None:
+            migration_module = import_module('%s.%s' % (self.module_name, self.name))
+            self._operations = migration_module.Migration(self.name, self.app_label).operations
+        return self._operations
+
+    @operations.setter
+    def operations(self, value):
+        self._operations = value
+
+
+class AstMigrationLoader(MigrationsPackageMixin, MigrationLoader):
+    """
+    MigrationLoader reading only the names, dependencies, replaces, run_before, initial and atomic of migrations,
+    parsed from their files without importing them, so no model or field code is imported. That's all
+    conflict detection, history checks and plans need; the migrations have no operations, so project_state()
+    raises ValueError. Files which can't be read statically (no plain Migration class, attributes which aren't
+    literals) are imported as usual. Big trees are parsed in a process pool.
+
+    :param workers: processes parsing files, the number of CPUs by default
+    """
+
+    def __init__(self, connection, load=True, ignore_no_migrations=False, workers=None):
+        self.workers = workers
+        self.imported = []  # (app_label, name) of the migrations which had to be imported
+        super().__init__(connection, load=load, ignore_no_migrations=ignore_no_migrations)
+
+    def load_disk(self):
+        self.disk_migrations = {}
+        self.unmigrated_apps = set()
+        self.migrated_apps = set()
+        files = []
+        for app_config in apps.get_app_configs():
+            module = self._import_migrations_module(app_config.label)
+            if module is None:
+                self.unmigrated_apps.add(app_config.label)
+                continue
+            self.migrated_apps.add(app_config.label)
+            directory = os.path.dirname(module.__file__)
+            for name in sorted(os.listdir(directory)):
+                if name.endswith('.py') and name[0] not in '_.~':
+                    files.append((app_config.label, module.__name__, name[:-3], os.path.join(directory, name)))
+
+        paths = [path for app_label, module_name, name, path in files]
+        if len(paths) >= PARALLEL_PARSE_FILES and (self.workers or os.cpu_count() or 1) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                parsed = list(pool.map(read_migration_file, paths, chunksize=64))
+        else:
+            parsed = [read_migration_file(path) for path in paths]
+
+        for (app_label, module_name, name, path), attributes in zip(files, parsed):
+            if attributes is None:
+                migration_module = import_module('%s.%s' % (module_name, name))
+                if not hasattr(migration_module, 'Migration'):
+                    raise BadMigrationError("Migration %s in app %s has no Migration class" % (name, app_label))
+                self.disk_migrations[app_label, name] = migration_module.Migration(name, app_label)
+                self.imported.append((app_label, name))
+                continue
+            migration = Migration(name, app_label)
+            for attribute, value in attributes.items():
+                setattr(migration, attribute, _graph_value(attribute, value))
+            self.disk_migrations[app_label, name] = migration
+
+    def project_state(self, nodes=None, at_end=True):
+        # a state built from migrations without operations would silently lack every model
+        raise ValueError('The migration graph was read without operations, project states need a MigrationLoader.')
+
+
+def read_migration_file(path):
+    """
+    Returns {attribute: value} of the GRAPH_ATTRIBUTES the Migration class of the file sets, read from its
+    syntax tree, or None when the file must be imported: it doesn't parse, has no plain module level
+    Migration class, or the class has methods or attributes which aren't literals.
+    """
+    with open(path, 'rb') as migration_file:
+        try:
+            tree = ast.parse(migration_file.read(), path)
+        except SyntaxError:
+            return None  # importing it raises the error the way MigrationLoader does
+    classes = [node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == 'Migration']
+    if len(classes) != 1 or classes[0].decorator_list or not all(
+        (isinstance(base, ast.Attribute) and base.attr == 'Migration') or
+        (isinstance(base, ast.Name) and base.id == 'Migration')
+        for base in classes[0].bases
+    ):
+        return None
+    # module level code touching the class after it's defined
+    if any(isinstance(child, ast.Name) and child.id == 'Migration'
+           for node in tree.body if node is not classes[0] for child in ast.walk(node)):
+        return None
+    attributes = {}
+    for node in classes[0].body:
+        if isinstance(node, ast.Assign):
+            names = [target.id for target in node.targets if isinstance(target, ast.Name)]
+            if len(names) != len(node.targets):
+                return None
+            for name in set(names) & set(GRAPH_ATTRIBUTES):
+                try:
+                    attributes[name] = _literal(node.value)
+                except ValueError:
+                    return None
+        elif not isinstance(node, (ast.Expr, ast.Pass)):  # docstrings; methods and the like may change anything
+            return None
+    return attributes
+
+
+def _graph_value(attribute, value):
+    # keys of dependencies, run_before and replaces as MigrationLoader expects them, parsed swappable ones
+    # resolved against the current settings, {'swappable': model} of the JSON cache restored as they were
+    if attribute in ('dependencies', 'run_before'):
+        return [
+            swappable_dependency(getattr(settings, key.setting)) if isinstance(key, Swappable) else
+            swappable_dependency(key['swappable']) if isinstance(key, dict) else tuple(key)
+            for key in value
+        ]
+    if attribute == 'replaces':
+        return [tuple(key) for key in value]
+    return value
+
+
+def _graph_json(value):
+    # graph attribute of an imported migration for the JSON cache, swappable dependencies keep their model
+    if isinstance(value, (list, tuple)):
+        if getattr(value, 'setting', None):
+            return {'swappable': value.setting}
+        return [_graph_json(element) for element in value]
+    return value
+
+
+def _digest(value):
+    return hashlib.sha1(repr(value).encode()).hexdigest()
+
+
+def _private_directory(path):
+    # created for the owner only; an existing one must not let anybody else plant cache files
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        return
+    status = os.stat(path)
+    if status.st_uid != os.getuid() or status.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ValueError("Cache directory %s must be owned by the current user and not writable by others, "
+                         "cached project states are unpickled from it." % path)
+
+
+def _literal(node):
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_literal(element) for element in node.elts]
+    if (isinstance(node, ast.Call) and len(node.args) == 1 and not node.keywords and
+            getattr(node.func, 'attr', getattr(node.func, 'id', None)) == 'swappable_dependency' and
+            isinstance(node.args[0], ast.Attribute) and isinstance(node.args[0].value, ast.Name) and
+            node.args[0].value.id == 'settings'):
+        return Swappable(node.args[0].attr)
+    return ast.literal_eval(node)  # ValueError for anything which isn't a literal
+
+
+def same_graph(graph, other):
+    """
+    True when both graphs have the same nodes and edges.
+    """
+    return set(graph.nodes) == set(other.nodes) and all(
+        set(parent.key for parent in graph.node_map[key].parents) ==
+        set(parent.key for parent in other.node_map[key].parents)
+        for key in graph.nodes
+    )
@@ -0,0 +1,108 @@
+import random
+import time
+
+from django.db import OperationalError, transaction
+
+# errors raised when a lock wasn't granted in time, by vendor
+LOCK_TIMEOUT_PGCODE = '55P03'  # lock_not_available
+MYSQL_LOCK_WAIT_TIMEOUT = 1205
+
+
+class LockGuard(object):
+    """
+    Runs DDL steps with a lock timeout, a step whose lock isn't granted in time is aborted and tried again
+    after a jittered exponential backoff, so it never queues the queries behind it for long.
+
+    PostgreSQL sets lock_timeout for the step inside a savepoint, SQLite the busy timeout and MySQL
+    lock_wait_timeout of the session, both restored afterwards. A disabled guard (no timeout) runs every
+    step once, as it is.
+
+    :param timeout: seconds to wait for a lock
+    :param retries: attempts after the first one, the last lock timeout error is raised
+    :param backoff: seconds to wait before the first retry, doubled for every further one
+    """
+
+    def __init__(self, connection, timeout=None, retries=5, backoff=1.0):
+        self.connection = connection
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.attempts = []  # [(label, attempts, seconds waited)]
+
+    @property
+    def enabled(self):
+        return self.timeout is not None
+
+    def run(self, label, function):
+        """
+        Returns function() run under the lock timeout, retried as long as it only fails on it.
+        """
+        if not self.enabled:
+            return function()
+        waited = 0
+        for attempt in range(1, self.retries + 2):
+            try:
+                result = self._attempt(function)
+            except OperationalError as error:
+                if not self.is_lock_timeout(error) or attempt > self.retries:
+                    self.attempts.append((label, attempt, waited))
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                time.sleep(delay)
+                waited += delay
+            else:
+                self.attempts.append((label, attempt, waited))
+                return result
+
+    def is_lock_timeout(self, error):
+        vendor = self.connection.vendor
+        if vendor == 'postgresql':
+            return getattr(error.__cause__, 'pgcode', None) == LOCK_TIMEOUT_PGCODE
+        if vendor == 'sqlite':
+            return 'locked' in str(error)
+        if vendor == 'mysql':
+            return bool(error.args) and error.args[0] == MYSQL_LOCK_WAIT_TIMEOUT
+        return False
+
+    def _attempt(self, function):
+        vendor = self.connection.vendor
+        if vendor == 'postgresql':
+            # an error aborts the transaction, the savepoint keeps what ran before; SET LOCAL ends with it
+            with transaction.atomic(using=self.connection.alias):
+                with self.connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '%dms'" % (self.timeout * 1000))
+                return function()
+        if vendor == 'sqlite':
+            setting, value = 'busy_timeout', int(self.timeout * 1000)
+        elif vendor == 'mysql':
+            setting, value = 'lock_wait_timeout', max(1, int(self.timeout))
+        else:
+            return function()
+        previous = self._session_setting(setting)
+        self._set_session_setting(setting, value)
+        try:
+            return function()
+        finally:
+            self._set_session_setting(setting, previous)
+
+    def _session_setting(self, setting):
+        with self.connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % setting if self.connection.vendor == 'sqlite'
+                           else 'SELECT @@SESSION.%s' % setting)
+            return cursor.fetchone()[0]
+
+    def _set_session_setting(self, setting, value):
+        with self.connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s = %d' % (setting, value) if self.connection.vendor == 'sqlite'
+                           else 'SET SESSION %s = %d' % (setting, value))
+
+    def report(self):
+        """
+        Lines describing every step run under the guard and how many attempts it needed.
+        """
+        return [
+            '    {} attempt{}{}: {}'.format(
+                attempts, '' if attempts == 1 else 's', ', {:.1f}s waited'.format(waited) if waited else '', label,
+            )
+            for label, attempts, waited in self.attempts
+        ]
@@ -0,0 +1,82 @@
+import copy
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.migrations.loader import MigrationLoader
+
+from migration_helper.compact import compacted_graph, find_runs, squash_run
+from migration_helper.plan import migration_entry, write_migration
+
+
+class Command(BaseCommand):
+    """
+    Squashes the runs of migrations move_model left in every app (table renames, state-only creates and deletes,
+    re-pointed relations) into one migration per run, with `replaces` so databases which applied the originals
+    keep them as applied. State-only migrations of other apps a run depends on through are rewritten to depend
+    on what the run depends on. Nothing is written unless the project state built from the squashed graph equals
+    the current one.
+
+    :param app_labels: apps to compact, all apps with migrations by default
+    :param --dry-run: if passed no migration files will be written, just show the runs which would be squashed
+    """
+
+    help = "Squashes the migrations left by previous moves into replacing migrations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'app_labels', nargs='*',
+            help='Apps to compact, all apps with migrations by default.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', dest='dry_run', default=False,
+            help="Just show which migrations would be squashed; don't write them.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        for app_label in options['app_labels']:
+            try:
+                apps.get_app_config(app_label)
+            except LookupError as error:
+                raise CommandError(error)
+
+        # no connection, squashed migrations are used as if nothing was applied, like on a new database
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        app_labels = options['app_labels'] or sorted(loader.migrated_apps)
+        runs = find_runs(loader.graph, app_labels)
+        if not runs:
+            self.stdout.write("No migrations to compact.") if self.verbosity else None
+            return
+        squashes = [squash_run(loader.graph, run) for run in runs]
+
+        # the graph with the squashed migrations must end in exactly the same state
+        compacted = compacted_graph(loader.graph, squashes)
+        state = compacted.make_state(nodes=compacted.leaf_nodes(), at_end=True, real_apps=list(loader.unmigrated_apps))
+        if state != loader.project_state():
+            raise CommandError("The squashed migrations would change the project state, nothing was written.")
+        state.apps  # and it renders
+
+        for run, squash in zip(runs, squashes):
+            self.stdout.write(self.style.MIGRATE_HEADING("{}.{}{}".format(
+                squash.app_label, squash.name, " (dry run)" if options['dry_run'] else "",
+            ))) if self.verbosity else None
+            self.stdout.write("    replaces {}, {} operations instead of {}.".format(
+                ', '.join(name for app_label, name in run), len(squash.operations),
+                sum(len(loader.graph.nodes[key].operations) for key in run),
+            )) if self.verbosity else None
+            for key in squash.bridges:
+                self.stdout.write("    re-points {}.{} to be applied before it.".format(*key)
+                                  ) if self.verbosity else None
+            if not options['dry_run']:
+                path = write_migration(migration_entry(squash))
+                self.stdout.write("    {}".format(path)) if self.verbosity else None
+                for key, dependencies in squash.bridges.items():
+                    # state-only, the migration is the same but for its dependencies
+                    bridge = copy.copy(loader.graph.nodes[key])
+                    bridge.dependencies = dependencies
+                    path = write_migration(migration_entry(bridge))
+                    self.stdout.write("    {}".format(path)) if self.verbosity else None
+        self.stdout.write(
+            "The project state is unchanged. Delete the replaced migrations and the `replaces` once every "
+            "database applied them, as with squashmigrations."
+        ) if self.verbosity else None
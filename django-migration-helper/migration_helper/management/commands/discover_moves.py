@@ -0,0 +1,108 @@
+import json
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.migrations.loader import MigrationLoader
+
+from migration_helper.discovery import discover_moves
+from migration_helper.loader import CachedMigrationLoader
+from migration_helper.management.commands.refactor import Command as RefactorCommand
+
+
+class Command(BaseCommand):
+    """
+    Finds the models moved between apps since the last migrations: models which disappeared from an app of
+    the migration state and appeared under the same name and with the same fields in another app.
+
+    :param --script: saves the moves as a refactor script
+    :param --run: runs the moves right away, like refactor does with a script
+    :param --migrate: with --run, migrations of all moves are applied after the last one
+    :param --dry-run: with --run, nothing is written nor changed in the database
+    :param --database: database alias to perform operation on, unless different than default
+    :param --cache-dir: directory for caching loaded migrations and project state between runs, it must be trusted
+    :param --zero-ddl: every move alters relation fields only in state when their database schema stays the same
+    """
+
+    help = "Finds models moved between apps and prints, saves or runs the moves."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--script', action='store', dest='script', default=None,
+            help='Saves the moves found as a JSON refactor script.',
+        )
+        parser.add_argument(
+            '--run', action='store_true', dest='run', default=False,
+            help='Runs the moves found in one process, the same way refactor runs a script.',
+        )
+        parser.add_argument(
+            '--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
+            help='Nominates a database to synchronize. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            '--cache-dir', action='store', dest='cache_dir', default=None,
+            help='Caches loaded migrations and the project state in this directory, '
+                 'only apps with changed migration files are loaded again. The state is pickled, so the '
+                 'directory must be trusted; it is created private to the current user.',
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false', dest='interactive', default=True,
+            help='Tells Django to NOT prompt the user for input of any kind.',
+        )
+        parser.add_argument(
+            '--zero-ddl', action='store_true', dest='zero_ddl', default=False,
+            help='Moves with --zero-ddl, see move_model.',
+        )
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument(
+            '--dry-run', action='store_true', dest='dry_run', default=False,
+            help="With --run, just show what every move would do; don't write migrations nor change the database.",
+        )
+        group.add_argument(
+            '--migrate', action='store_true', dest='migrate', default=False,
+            help='With --run, applies the migrations of all moves after the last one.',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if (options['dry_run'] or options['migrate']) and not options['run']:
+            raise CommandError("--dry-run and --migrate need --run.")
+
+        # model states only, the migration state is never rendered
+        connection = connections[options['database']]
+        if options['cache_dir']:
+            try:
+                loader = CachedMigrationLoader(connection, options['cache_dir'], ignore_no_migrations=True)
+            except ValueError as error:
+                raise CommandError(error)
+        else:
+            loader = MigrationLoader(connection, ignore_no_migrations=True)
+        moves, differing, ambiguous = discover_moves(loader.project_state(), apps)
+
+        for (base_app, target_app), models in moves.items():
+            self.stdout.write("move_model {} {} {}".format(' '.join(models), base_app, target_app))
+        for old_key, new_key in differing:
+            self.stderr.write("{}.{} disappeared and {}.{} appeared, but their fields differ.".format(
+                old_key[0], old_key[1], new_key[0], new_key[1],
+            )) if self.verbosity else None
+        for new_key, old_keys in ambiguous:
+            self.stderr.write("{}.{} matches {}, move it by hand.".format(
+                new_key[0], new_key[1], ', '.join('{}.{}'.format(*key) for key in old_keys),
+            )) if self.verbosity else None
+        if not moves:
+            self.stdout.write("No moved models found.") if self.verbosity else None
+            return
+
+        steps = [
+            ('move_model', dict(models=models, base_app=base_app, target_app=target_app, zero_ddl=options['zero_ddl']))
+            for (base_app, target_app), models in moves.items()
+        ]
+        if options['script']:
+            with open(options['script'], 'w') as script_file:
+                json.dump({'steps': [{name: step_options} for name, step_options in steps]}, script_file, indent=2)
+            self.stdout.write("Script saved to {}.".format(options['script'])) if self.verbosity else None
+        if options['run']:
+            refactor = RefactorCommand(no_color=options.get('no_color', False))
+            refactor.stdout, refactor.stderr = self.stdout, self.stderr  # already wrapped, written through as is
+            refactor._run(steps, dict(options, profile=None, profile_dump=None))
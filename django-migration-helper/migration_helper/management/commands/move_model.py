@@ -1,38 +1,89 @@
+import copy
+import fnmatch
+import os
 import sys
+from collections import OrderedDict
+from contextlib import ExitStack
+from itertools import chain
 
 from django.apps import apps
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand, CommandError, OutputWrapper
 from django.core.management.commands.makemigrations import Command as MakeMigrationCommand
-from django.core.management.commands.migrate import Command as MigrateCommand
-from django.db import connections, DEFAULT_DB_ALIAS, router
+from django.db import connections, DEFAULT_DB_ALIAS, router, transaction
 from django.db.migrations.autodetector import MigrationAutodetector
-from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.exceptions import InconsistentMigrationHistory, InvalidMigrationPlan
 from django.db.migrations.loader import MigrationLoader
 from django.db.migrations import operations, SeparateDatabaseAndState
 from django.db.migrations.questioner import InteractiveMigrationQuestioner, NonInteractiveMigrationQuestioner
-from django.db.migrations.state import ProjectState
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.migrations.state import ModelState, ProjectState
+
+from migration_helper.compact import HELPER_MIGRATION_NAMES
+from migration_helper.contenttypes import count_references, move_content_type
+from migration_helper.costs import estimate_migrations, format_cost, is_high_cost
+from migration_helper.datacopy import ModelCopy
+from migration_helper.executor import InMemoryMigrationExecutor
+from migration_helper.fanout import failed_targets, parse_targets, run_targets, summary, target_output, use_target
+from migration_helper.journal import Journal
+from migration_helper.loader import AstMigrationLoader, CachedMigrationLoader, same_graph
+from migration_helper.locks import LockGuard
+from migration_helper.plan import build_migration, migration_entry, read_plan, write_migration, write_plan
+from migration_helper.profiling import PhaseProfiler
+from migration_helper.rehearsal import cloned_database, Rehearsal
+from migration_helper.relations import build_reverse_index, referencing_fields, relation_closure
+from migration_helper.schema import field_db_signature
+from migration_helper.sqlreport import SQLRecorder
+
+
+# attributes a phase leaves for the next ones, kept in the journal
+JOURNAL_VALUES = {
+    'alter model tables': ('alter_table_migration', 'table_map'),
+    'create models': ('create_model_migration',),
+    'resolve relations': ('relation_migrations',),
+}
 
 
 class Command(BaseCommand):
     """
-    Command for moving model with existing data attached in database from one app to another.
+    Command for moving models with existing data attached in database from one app to another.
     http://stackoverflow.com/questions/30601107/move-models-between-django-1-8-apps-with-required-foreignkey-references
 
-    :param model: model name
+    :param models: model names or glob patterns, all of them are moved with a single set of migrations
     :param base_app: app where the model was located before moving
     :param target_app: app where the model will be located after moving
 
-    :param --migrate: if passed migrations will be applied immediately after seting migration files
-    :param --dry-run: if passed no migration files will be written, just show the operations
-    :param --database: database alias to perform operation on, unless different than default
+    :param --migrate: if passed only the new migrations will be applied immediately after seting migration files
+    :param --dry-run: if passed no migration files will be written, just show the operations and their estimated
+        cost from the table statistics
+    :param --rehearse: like --dry-run, then applies the migrations to a throwaway copy of the database and
+        reports the time and locks of every operation
+    :param --database: database alias to perform operation on, unless different than default; with --migrate
+        also comma separated aliases, alias:schema pairs or "all", migrations are generated against the first one
+        and applied to every one of them in parallel
+    :param --schemas: comma separated PostgreSQL schemas, the migrations are applied in each of them
+    :param --workers: number of databases or schemas migrated at once
+    :param --cache-dir: directory for caching loaded migrations and project state between runs, it must be trusted
+    :param --zero-ddl: relation fields which stay the same in the database are altered only in state
+    :param --profile: prints time, memory, loader builds and state renders for every phase, optionally saves them
+    :param --profile-dump: directory for cProfile dumps of every phase
+    :param --sql-report: prints the longest SQL statements run on the database, optionally saves all of them
+    :param --emit-plan: saves the generated migrations and their SQL as a plan
+    :param --from-plan: writes or applies the migrations of a saved plan instead of generating them
+    :param --chunk-size: rows per chunk when models routed to another database are copied there
+    :param --checkpoint-dir: directory for files keeping the progress of every copy, so it can be resumed
+    :param --chunk-pause: seconds to wait between chunks of rows updated or copied
+    :param --lock-timeout: seconds every migration waits for its locks with --migrate before it's tried again
+    :param --lock-retries: number of times a migration aborted by --lock-timeout is tried again
+    :param --lock-backoff: seconds to wait before the first retry, doubled for every further one
+    :param --journal: file recording every finished phase, running the same command again continues after them
     """
 
-    help = "Creates migrations for moving model from base_app to target_app"
+    help = "Creates migrations for moving models from base_app to target_app"
 
     def add_arguments(self, parser):
         parser.add_argument(
-            'model',
-            help='Name of a model to be transferred',
+            'models', nargs='+',
+            help='Names of models to be transferred, glob patterns (e.g. "Order*") are accepted.',
         )
         parser.add_argument(
             'base_app',
@@ -44,13 +95,89 @@ class Command(BaseCommand):
         )
         parser.add_argument(
             '--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
-            help='Nominates a database to synchronize. Defaults to the "default" database.',
+            help='Nominates a database to synchronize. Defaults to the "default" database. With --migrate '
+                 'a comma separated list of aliases or alias:schema pairs, or "all", is accepted.',
+        )
+        parser.add_argument(
+            '--schemas', action='store', dest='schemas', default=None,
+            help='Comma separated PostgreSQL schemas, migrations are applied in every one of them.',
+        )
+        parser.add_argument(
+            '--workers', action='store', dest='workers', type=int, default=4,
+            help='Number of databases or schemas migrated at once.',
+        )
+        parser.add_argument(
+            '--cache-dir', action='store', dest='cache_dir', default=None,
+            help='Caches loaded migrations and the project state in this directory, '
+                 'only apps with changed migration files are loaded again. The state is pickled, so the '
+                 'directory must be trusted; it is created private to the current user.',
         )
         parser.add_argument(
             '--noinput', '--no-input',
             action='store_false', dest='interactive', default=True,
             help='Tells Django to NOT prompt the user for input of any kind.',
         )
+        parser.add_argument(
+            '--zero-ddl', action='store_true', dest='zero_ddl', default=False,
+            help='Alters relational fields only in the migration state when their database schema '
+                 'does not change, so the table renames are the only DDL.',
+        )
+        parser.add_argument(
+            '--profile', action='store', dest='profile', nargs='?', const='', default=None, metavar='REPORT',
+            help='Prints a profile of every phase, the report is also saved as JSON if a path is given.',
+        )
+        parser.add_argument(
+            '--profile-dump', action='store', dest='profile_dump', default=None, metavar='DIR',
+            help='Writes a cProfile dump of every phase to this directory.',
+        )
+        parser.add_argument(
+            '--sql-report', action='store', dest='sql_report', nargs='?', const='', default=None, metavar='REPORT',
+            help='Records every SQL statement with its phase, duration, rows and whether it held schema locks, '
+                 'prints the longest ones and saves all of them as JSON if a path is given.',
+        )
+        parser.add_argument(
+            '--chunk-size', action='store', dest='chunk_size', type=int, default=2000,
+            help='Rows copied at once when the router sends target_app models to another database.',
+        )
+        parser.add_argument(
+            '--checkpoint-dir', action='store', dest='checkpoint_dir', default=None,
+            help='Keeps the last copied primary key of every copy in this directory, an interrupted copy '
+                 'continues from there.',
+        )
+        parser.add_argument(
+            '--chunk-pause', action='store', dest='chunk_pause', type=float, default=0,
+            help='Seconds to wait after every chunk of re-pointed content type references, so big tables '
+                 'are never locked for long.',
+        )
+        parser.add_argument(
+            '--lock-timeout', action='store', dest='lock_timeout', type=float, default=None, metavar='SECONDS',
+            help='Aborts DDL waiting longer than this for its locks and tries it again later, so it never queues '
+                 'the queries behind it for long (lock_timeout on PostgreSQL, lock_wait_timeout on MySQL, '
+                 'the busy timeout on SQLite).',
+        )
+        parser.add_argument(
+            '--lock-retries', action='store', dest='lock_retries', type=int, default=5,
+            help='Attempts after the first one for DDL aborted by --lock-timeout.',
+        )
+        parser.add_argument(
+            '--lock-backoff', action='store', dest='lock_backoff', type=float, default=1.0, metavar='SECONDS',
+            help='Wait before the first retry, doubled for every further one and jittered.',
+        )
+        parser.add_argument(
+            '--journal', action='store', dest='journal', default=None, metavar='JOURNAL',
+            help='Records the migrations and progress of every phase in this file, running the same command '
+                 'with it again continues from the first unfinished phase.',
+        )
+        plan_group = parser.add_mutually_exclusive_group()
+        plan_group.add_argument(
+            '--emit-plan', action='store', dest='emit_plan', default=None, metavar='PLAN',
+            help='Saves the operations, dependencies, names and SQL of the generated migrations to this file.',
+        )
+        plan_group.add_argument(
+            '--from-plan', action='store', dest='from_plan', default=None, metavar='PLAN',
+            help='Writes (or applies with --migrate) the migrations of a saved plan after checking it still '
+                 'fits the migration graph, the autodetector is not run.',
+        )
         group = parser.add_mutually_exclusive_group()
         group.add_argument(
             '--dry-run', action='store_true', dest='dry_run', default=False,
@@ -58,80 +185,404 @@ class Command(BaseCommand):
         )
         group.add_argument(
             '--migrate', action='store_true', dest='migrate', default=False,
-            help='Tells Django to run migrations immediately after the migration files are set.',
+            help='Applies the generated migrations, and no other, immediately after the migration files are set.',
+        )
+        group.add_argument(
+            '--rehearse', action='store_true', dest='rehearse', default=False,
+            help="Doesn't write migrations, applies them to a throwaway copy of the database (SQLite or "
+                 "PostgreSQL) and reports the time and locks of every operation.",
         )
 
     def handle(self, *args, **options):
+        self._setup(options)
+        self.profiler = PhaseProfiler(enabled=options['profile'] is not None, dump_dir=options['profile_dump'])
+        self.sql_recorder = SQLRecorder(
+            connections[self.database], phase=lambda: self.profiler.name, enabled=options['sql_report'] is not None
+        )
+        with use_target(self.targets[0]), self.sql_recorder.recording():
+            if self.from_plan:
+                self._replay()
+            else:
+                self._move()
+
+        if self.profiler.enabled:
+            self.stdout.write(self.profiler.summary())
+            if options['profile']:
+                self.profiler.write_report(options['profile'])
+        if self.sql_recorder.enabled:
+            self.stdout.write(self.sql_recorder.summary())
+            if options['sql_report']:
+                self.sql_recorder.write_report(options['sql_report'])
+        self.stdout.write(self.style.NOTICE("  Done.")) if self.verbosity else None
+
+    def _setup(self, options):
         # parse options
-        self.model = options['model']
+        self.model_patterns = options['models']
         self.base_app = options['base_app']
         self.target_app = options['target_app']
 
         self.migrate = options['migrate']
-        self.database = options['database']
+        try:
+            self.targets = parse_targets(options['database'], options.get('schemas'))
+        except ValueError as error:
+            raise CommandError(error)
+        self.database = self.targets[0].alias
+        self.workers = options.get('workers', 4)
+        self.cache_dir = options['cache_dir']
+        self.zero_ddl = options['zero_ddl']
+        self.emit_plan = options['emit_plan']
+        self.from_plan = options['from_plan']
+        self.chunk_size = options.get('chunk_size', 2000)
+        self.checkpoint_dir = options.get('checkpoint_dir')
+        self.chunk_pause = options.get('chunk_pause', 0)
+        self.lock_options = dict(
+            timeout=options.get('lock_timeout'),
+            retries=options.get('lock_retries', 5),
+            backoff=options.get('lock_backoff', 1.0),
+        )
 
         self.interactive = options['interactive']
         self.verbosity = options['verbosity']
-        self.dry_run = options['dry_run']
+        self.rehearse = options.get('rehearse', False)
+        self.dry_run = options['dry_run'] or self.rehearse  # a rehearsal writes nothing either
+        self.fan_out = len(self.targets) > 1
+        if self.fan_out and self.rehearse:
+            raise CommandError("--rehearse copies a single database.")
+        if self.fan_out and not (self.migrate or self.dry_run):
+            raise CommandError("Migrations are written once, several databases need --migrate to apply them.")
+        if self.fan_out and options.get('sql_report') is not None:
+            raise CommandError("--sql-report records a single database.")
+        self.journal = None
+        if options.get('journal'):
+            if self.dry_run or self.from_plan:
+                raise CommandError("--journal records written migrations, it can't be used with --dry-run, "
+                                   "--rehearse or --from-plan.")
+            try:
+                self.journal = Journal(
+                    options['journal'], models=self.model_patterns, base_app=self.base_app,
+                    target_app=self.target_app, database=options['database'], zero_ddl=self.zero_ddl,
+                )
+            except (IOError, ValueError) as error:
+                raise CommandError(error)
 
-        self._verify_input()
+        self._verify_apps()
 
         # predefining couple of things
         self.app_labels = set(config.label for config in apps.get_app_configs())
         self.questioner = InteractiveMigrationQuestioner if self.interactive else NonInteractiveMigrationQuestioner
         self.writer = self._get_writer()
 
-        self._check_db_state()
+    def _move(self):
+        if self.journal is not None:
+            for path in self.journal.discard_pending():
+                self.stdout.write("  Removed {}, its phase didn't finish.".format(path)) if self.verbosity else None
+        with self.profiler.phase('check db state'):
+            self._check_db_state()
+            if self.journal is not None:
+                self._check_journal()
+        with self.profiler.phase('load state'):
+            self._load_state()
+            self.models = self._resolve_models()
+            self._scope_states([(self.base_app, self.target_app, self.models)])
+            self._prepare_move()
+        self._generate()
+        if self.migrate:
+            self._migrate()
 
+    def _generate(self):
         self.stdout.write(self.style.NOTICE("  Moving {} from {} to {}.".format(
-            self.model,
+            ', '.join(self.models),
             self.base_app,
             self.target_app,
         ))) if self.verbosity else None
 
         # [1] First migration for base_app, manually AlterModelTable + SeparateDatabaseAndState
-        self.stdout.write(self.style.NOTICE("  Alter {} Model Table.".format(self.model))) if self.verbosity else None
+        self.stdout.write(self.style.NOTICE("  Alter Model Tables.")) if self.verbosity else None
+        self._run_phase('alter model tables', self._alter_model_tables)
+
+        # [2] Migrations for target_app, create model
+        self.stdout.write(self.style.NOTICE("  Create models in {}.".format(self.target_app))
+                          ) if self.verbosity else None
+        self._run_phase('create models', self._create_models)
+
+        # [3] Resolving all Relational Fields in other apps
+        self.stdout.write(self.style.NOTICE("  Resolving relational fields.")
+                          ) if self.verbosity else None
+        self._run_phase('resolve relations', self._resolve_relations)
+
+        # [4] Delete model from state in base_app
+        self.stdout.write(self.style.NOTICE("  Delete models in {}.".format(self.base_app))
+                          ) if self.verbosity else None
+        self._run_phase('delete models', self._delete_models)
+
+        if self.emit_plan:
+            with self.profiler.phase('emit plan'):
+                self._emit_plan()
+
+        if self.dry_run and self.verbosity:
+            self.stdout.write(self.style.NOTICE("  Estimated costs."))
+            with self.profiler.phase('estimate costs'):
+                self._show_costs()
+        if self.copies and self.dry_run:
+            for model_copy in chain.from_iterable(self.copies.values()):
+                self.stdout.write("    {} would be copied to database '{}'.".format(
+                    model_copy.target_model._meta.db_table, model_copy.target,
+                )) if self.verbosity else None
+        if self.dry_run and not self.rehearse and apps.is_installed('django.contrib.contenttypes'):
+            self._show_content_types()
+        if self.rehearse:
+            self.stdout.write(self.style.NOTICE("  Rehearsing on a copy of '{}'.".format(self.database))
+                              ) if self.verbosity else None
+            with self.profiler.phase('rehearse'):
+                self._rehearse()
+
+    def _migrate(self, content_types=None):
+        # [5] Apply the written migrations on top of initial_state and move the content types, of this move by
+        # default; refactor applies the migrations of all its moves at once and passes their content types
+        if self.fan_out:
+            self.stdout.write(self.style.NOTICE("  Applying migrations on {} databases.".format(len(self.targets)))
+                              ) if self.verbosity else None
+            self._run_phase('apply migrations', lambda: self._migrate_targets(content_types))
+            return
+        if self.copies:
+            self.stdout.write(self.style.NOTICE("  Copying data.")) if self.verbosity else None
+            self._run_phase('copy data', self._copy_data)
+        self.stdout.write(self.style.NOTICE("  Applying migrations.")
+                          ) if self.verbosity else None
+        self._run_phase('apply migrations', self._apply_migrations)
+        if apps.is_installed('django.contrib.contenttypes'):
+            self.stdout.write(self.style.NOTICE("  Moving content types.")) if self.verbosity else None
+            self._run_phase('content types', lambda: self._move_content_types(content_types))
+
+    def _run_phase(self, name, function):
+        # with --journal a phase finished by an earlier run is taken from the journal instead of run again
+        if self.journal is not None and self.journal.done(name):
+            self._replay_phase(name)
+            return
+        written = len(self.written_nodes)
+        with self.profiler.phase(name):
+            function()
+        if self.journal is not None:
+            self.journal.finish(name, nodes=self.written_nodes[written:], **dict(
+                (attribute, getattr(self, attribute)) for attribute in JOURNAL_VALUES.get(name, ())
+            ))
+
+    def _replay_phase(self, name):
+        phase = self.journal.phases[name]
+        for node in phase['nodes']:
+            self.written_nodes.append(node)
+            self.from_state = self.loader.graph.nodes[node].mutate_state(self.from_state, preserve=False)
+        values = phase['values']
+        if 'table_map' in values:
+            self.table_map = OrderedDict(values['table_map'])
+        if 'alter_table_migration' in values:
+            self.alter_table_migration = values['alter_table_migration']
+        if 'create_model_migration' in values:
+            self.create_model_migration = values['create_model_migration']
+        if 'relation_migrations' in values:
+            self.relation_migrations = [tuple(node) for node in values['relation_migrations']]
+        self.stdout.write("    Finished by an earlier run{}.".format(
+            ', ' + ', '.join('{}.{}'.format(*node) for node in phase['nodes']) if phase['nodes'] else '',
+        )) if self.verbosity else None
+
+    def _check_journal(self):
+        # the graph without the journaled migrations must still end where the move started
+        nodes = set(self.journal.nodes())
+        graph = self.loader.graph
+        missing = sorted(nodes - set(graph.nodes))
+        if missing:
+            raise CommandError("Migration {}.{} recorded in {} doesn't exist anymore, delete the journal and the "
+                               "migrations of the move to start over.".format(
+                                   missing[0][0], missing[0][1], self.journal.path,
+                               ))
+        leaves = sorted(key for key in graph.nodes if key not in nodes and all(
+            child.key in nodes for child in graph.node_map[key].children
+        ))
+        if not self.journal.started:
+            self.journal.start(leaves)
+        elif leaves != self.journal.leaves:
+            raise CommandError("{} was started on top of other migrations, delete the journal and the "
+                               "migrations of the move to start over.".format(self.journal.path))
+        else:
+            self.stdout.write(self.style.NOTICE("  Resuming from {}, finished: {}.".format(
+                self.journal.path, ', '.join(self.journal.phases) or 'nothing',
+            ))) if self.verbosity else None
+        self.initial_leaves = leaves
+
+    def _replay(self):
+        with self.profiler.phase('check db state'):
+            self._check_db_state()
+        with self.profiler.phase('validate plan'):
+            self._validate_plan()
+
+        self.stdout.write(self.style.NOTICE("  Moving {} from {} to {} as planned in {}.".format(
+            ', '.join(self.models),
+            self.base_app,
+            self.target_app,
+            self.from_plan,
+        ))) if self.verbosity else None
+        with self.profiler.phase('write migrations'):
+            self._write_planned_migrations()
+
+        # plans made before content types were recorded move them like a move without a plan does
+        content_types = self.plan.get('content_types', self.models) if apps.is_installed(
+            'django.contrib.contenttypes'
+        ) else []
+        if self.migrate and self.fan_out:
+            self.stdout.write(self.style.NOTICE("  Applying migrations on {} databases.".format(len(self.targets)))
+                              ) if self.verbosity else None
+            with self.profiler.phase('apply migrations'):
+                self._migrate_targets([(self.base_app, self.target_app, content_types)])
+        elif self.migrate:
+            self.stdout.write(self.style.NOTICE("  Applying migrations.")
+                              ) if self.verbosity else None
+            with self.profiler.phase('apply migrations'):
+                self._apply_migrations()
+            if content_types:
+                self.stdout.write(self.style.NOTICE("  Moving content types.")) if self.verbosity else None
+                with self.profiler.phase('content types'):
+                    self._move_content_types([(self.base_app, self.target_app, content_types)])
+        elif self.dry_run and content_types:
+            self._show_content_types(content_types)
+
+    def _load_state(self):
+        # graph and both states are loaded once, every phase below works on them in memory; a resumed move
+        # starts from the state before its journaled migrations, they are replayed phase by phase
+        self._ensure_full_loader()
+        if self.journal is not None and self.journal.phases:
+            self.from_state = self.loader.project_state(nodes=self.initial_leaves)
+        else:
+            self.from_state = self.loader.project_state()
+
+    def _scope_states(self, moves):
+        # only the moved models and their relation closure are kept in both states and rendered
+        closure = relation_closure(self.from_state, set(
+            (app_label, model) for base_app, target_app, models in moves
+            for app_label in (base_app, target_app) for model in models
+        ), apps)
+        self.from_state = ProjectState(
+            models=dict((key, model_state) for key, model_state in self.from_state.models.items() if key in closure),
+            real_apps=[app_label for app_label in self.from_state.real_apps
+                       if any(key[0] == app_label for key in closure)],
+        )
+        to_models = {}
+        for app_label, model_name in closure:
+            try:
+                to_models[app_label, model_name] = ModelState.from_model(apps.get_model(app_label, model_name))
+            except LookupError:
+                pass
+        self.to_state = ProjectState(models=to_models)
+        self.old_apps = self.from_state.concrete_apps  # rendered once, later reloaded model by model
+        self.new_apps = self.to_state.apps
+
+    def _prepare_move(self):
+        # from_state is mutated by every written migration, --migrate applies them on top of this copy
+        self.initial_state = self.from_state.clone() if self.migrate or self.emit_plan or self.dry_run else None
+        self.written_nodes = []
+
+        self._verify_input()
+        # models the router sends to another database are copied there along with their auto-created M2M
+        # tables, the model table first; their tables are not renamed
+        self.copies = OrderedDict()
+        for model in self.models:
+            alias = router.db_for_write(apps.get_model(self.target_app, model)) or DEFAULT_DB_ALIAS
+            if alias == self.database:
+                continue
+            self.copies[model] = [
+                ModelCopy(
+                    source_model, target_model, self.database, alias,
+                    chunk_size=self.chunk_size,
+                    checkpoint_path=os.path.join(self.checkpoint_dir, '{}.{}.json'.format(
+                        alias, target_model._meta.db_table,
+                    )) if self.checkpoint_dir else None,
+                )
+                for source_model, target_model in [(
+                    self.old_apps.get_model(self.base_app, model), self.new_apps.get_model(self.target_app, model),
+                )] + list(self._through_models(model))
+            ]
+        if self.copies and self.rehearse:
+            raise CommandError("{} are routed to another database, their copy can't be rehearsed.".format(
+                ', '.join(self.copies),
+            ))
+        if self.copies and self.fan_out:
+            raise CommandError("{} are routed to another database, they can't be moved on several databases "
+                               "at once.".format(', '.join(self.copies)))
+        if self.copies and not (self.migrate or self.dry_run):
+            raise CommandError("{} are routed to another database, run with --migrate so the data is copied "
+                               "before the migrations are applied.".format(', '.join(self.copies)))
+        # fields pointing at the moved models, before and after moving, only these are compared in step 3
+        self.relation_index = build_reverse_index(self.from_state, self.to_state)
+        self.moved_fields = referencing_fields(self.relation_index, [
+            (app_label, model) for app_label in (self.base_app, self.target_app) for model in self.models
+        ])
+
+    def _alter_model_tables(self):
+        # physical table renames, models with db_table already set keep their table; AlterModelTable renames
+        # the auto-created M2M tables of a model along with it, they are listed to show every table it touches
+        self.table_map = OrderedDict()
+        renamed = []
+        for model in self.models:
+            if model in self.copies:
+                continue
+            old_model = self.old_apps.get_model(self.base_app, model)
+            new_model = self.new_apps.get_model(self.target_app, model)
+            tables = [(old_model._meta.db_table, new_model._meta.db_table)] + [
+                (old_through._meta.db_table, new_through._meta.db_table)
+                for old_through, new_through in self._through_models(model)
+            ]
+            tables = [(old_table, new_table) for old_table, new_table in tables if old_table != new_table]
+            if tables:
+                renamed.append(model)
+                self.table_map.update(tables)
+        for old_table, new_table in self.table_map.items():
+            message = "    Would rename table {} to {}." if self.dry_run else "    Renames table {} to {}."
+            self.stdout.write(message.format(old_table, new_table)
+                              ) if self.verbosity >= 2 or self.dry_run and self.verbosity else None
+        if not self.table_map:
+            self.alter_table_migration = self.loader.graph.leaf_nodes(self.base_app)[0][1]
+            return
         autodetector = self._get_autodetector(specified_apps=(self.base_app, ))
         autodetector.add_operation(
             # this has to be done manually, autodetector.generate_altered_db_table doesn't work
             self.base_app,
             SeparateDatabaseAndState(
                 database_operations=[operations.AlterModelTable(
-                    name=self.model,
-                    table=self.target_app + '_' + self.model
-                )]
+                    name=model,
+                    table=self.new_apps.get_model(self.target_app, model)._meta.db_table
+                ) for model in renamed]
             )
         )
         autodetector._build_migration_list()  # accessing private methods, ugly but saves a lot of code
-        changes = autodetector.arrange_for_graph(changes=autodetector.migrations, graph=self.loader.graph)
-        first_base_app_migration_name = changes[self.base_app][0].name  # save migration name for later dependencies
+        changes = self._arrange(autodetector, 'alter model tables')
+        self.alter_table_migration = changes[self.base_app][0].name  # save migration name for later dependencies
         self._write_migration_files(changes)
 
-        # [2] Migrations for target_app, create model
-        self.stdout.write(self.style.NOTICE("  Create model {} in {}.".format(self.model, self.target_app))
-                          ) if self.verbosity else None
+    def _create_models(self):
         autodetector = self._get_autodetector(specified_apps=(self.target_app, ))
-        autodetector.new_model_keys = [(self.target_app, self.model)]  # overwrite it just for target_app
+        # overwrite it just for target_app
+        autodetector.new_model_keys = [(self.target_app, model) for model in self.models]
 
         autodetector.generate_created_models()
+        autodetector._sort_migrations()  # related fields between moved models come as separate AddField operations
         autodetector._build_migration_list()
 
-        create_operation = autodetector.migrations[self.target_app][0].operations
-        assert len(create_operation) == 1, "Step two went wrong."
-        autodetector.migrations[self.target_app][0].operations \
-            = [SeparateDatabaseAndState(state_operations=create_operation)]
+        for migration in autodetector.migrations[self.target_app]:
+            migration.operations = [SeparateDatabaseAndState(state_operations=migration.operations)]
 
-        autodetector.migrations[self.target_app][0].dependencies.append((self.base_app, first_base_app_migration_name))
-        changes = autodetector.arrange_for_graph(changes=autodetector.migrations, graph=self.loader.graph)
-        first_target_app_migration_name = changes[self.target_app][0].name  # save migration name for later dependencies
+        autodetector.migrations[self.target_app][0].dependencies.append((self.base_app, self.alter_table_migration))
+        changes = self._arrange(autodetector, 'create models')
+        self.create_model_migration = changes[self.target_app][-1].name  # save migration name for later dependencies
         self._write_migration_files(changes)
 
-        # [3] Resolving all Relational Fields in other apps
-        self.stdout.write(self.style.NOTICE("  Resolving relational fields.".format(self.model))
-                          ) if self.verbosity else None
-        autodetector = self._get_autodetector(specified_apps=self.app_labels)
+    def _resolve_relations(self):
+        autodetector = self._get_autodetector(
+            specified_apps=self.app_labels,
+            model_keys=set((app_label, model) for app_label, model, field in self.moved_fields),
+        )
 
         autodetector._prepare_field_lists()
+        autodetector.old_field_keys &= self.moved_fields
+        autodetector.new_field_keys &= self.moved_fields
         autodetector._generate_through_model_map()
         autodetector.generate_altered_fields()  # this performs regular operation, since we only want altered relations
         autodetector._sort_migrations()
@@ -139,56 +590,317 @@ class Command(BaseCommand):
 
         for app, migrations in autodetector.migrations.items():  # fill dependencies
             for migration in migrations:
+                if self.zero_ddl:
+                    migration.operations = self._state_only_relations(app, migration.operations)
                 migration.dependencies.extend((
-                    (self.base_app, first_base_app_migration_name),
-                    (self.target_app, first_target_app_migration_name)
+                    (self.base_app, self.alter_table_migration),
+                    (self.target_app, self.create_model_migration)
                 ))
 
-        changes = autodetector.arrange_for_graph(graph=self.loader.graph, changes=autodetector.migrations)
-        third_step_migrations = [(app, mig.name) for app, migrations in changes.items() for mig in migrations]
+        changes = self._arrange(autodetector, 'resolve relations')
+        self.relation_migrations = [(app, mig.name) for app, migrations in changes.items() for mig in migrations]
         self._write_migration_files(changes)
 
-        # [4] Delete model from state in base_app
-        self.stdout.write(self.style.NOTICE("  Delete {} in {}.".format(self.model, self.base_app))
-                          ) if self.verbosity else None
-        autodetector = self._get_autodetector(specified_apps=(self.base_app,))
+    def _delete_models(self):
+        # only the moved models, others missing from base_app may be moved by a later command
+        autodetector = self._get_autodetector(
+            specified_apps=(self.base_app,), model_keys=set((self.base_app, model) for model in self.models),
+        )
         autodetector.generate_deleted_models()
+        autodetector._sort_migrations()
         autodetector._build_migration_list()
 
-        create_operation = autodetector.migrations[self.base_app][0].operations
-        autodetector.migrations[self.base_app][0].operations \
-            = [SeparateDatabaseAndState(state_operations=create_operation)]
-        autodetector.migrations[self.base_app][0].dependencies.extend(third_step_migrations)
+        for migration in autodetector.migrations[self.base_app]:
+            migration.operations = [SeparateDatabaseAndState(state_operations=migration.operations)]
+        autodetector.migrations[self.base_app][0].dependencies.extend(self.relation_migrations)
 
-        changes = autodetector.arrange_for_graph(changes=autodetector.migrations, graph=self.loader.graph)
+        changes = self._arrange(autodetector, 'delete models')
         self._write_migration_files(changes)
 
-        # [5] If user passed --migrate flag, apply migrations.
+    def _arrange(self, autodetector, phase):
+        # numbered like makemigrations does, named after the phase so compact_moves can tell them from others
+        return autodetector.arrange_for_graph(
+            changes=autodetector.migrations, graph=self.loader.graph, migration_name=HELPER_MIGRATION_NAMES[phase],
+        )
+
+    def _emit_plan(self):
+        executor = InMemoryMigrationExecutor(connections[self.database], self.loader)
+        try:
+            statements = executor.collect_nodes_sql(self.written_nodes, self.initial_state)
+        except InvalidMigrationPlan as error:
+            raise CommandError(error)
+        write_plan(
+            self.emit_plan, 'move_model',
+            base_app=self.base_app,
+            target_app=self.target_app,
+            models=self.models,
+            copies=list(self.copies),
+            vendor=connections[self.database].vendor,
+            tables=list(self.table_map),
+            content_types=self.models if apps.is_installed('django.contrib.contenttypes') else [],
+            # the plan only fits a graph whose apps end with the same migrations
+            leaves={app_label: sorted(name for app, name in self.initial_leaves if app == app_label)
+                    for app_label in set(app_label for app_label, name in self.written_nodes)},
+            migrations=[migration_entry(self.loader.graph.nodes[node], statements[node])
+                        for node in self.written_nodes],
+        )
+        self.stdout.write("    Plan saved to {}.".format(self.emit_plan)) if self.verbosity else None
+
+    def _validate_plan(self):
+        try:
+            self.plan = read_plan(self.from_plan, 'move_model')
+        except (IOError, ValueError) as error:
+            raise CommandError(error)
+        self.models = self.plan['models']
+        patterns = [pattern.lower() for pattern in self.model_patterns]
+        if (self.plan['base_app'], self.plan['target_app']) != (self.base_app, self.target_app) or any(
+            not fnmatch.filter(self.models, pattern) for pattern in patterns
+        ) or any(
+            not any(fnmatch.fnmatchcase(model, pattern) for pattern in patterns) for model in self.models
+        ):
+            raise CommandError("{} moves {} from {} to {}.".format(
+                self.from_plan, ', '.join(self.models), self.plan['base_app'], self.plan['target_app'],
+            ))
+        self._verify_input()
+        connection = connections[self.database]
+        if self.plan['vendor'] != connection.vendor:
+            raise CommandError("{} was made for {}, not {}.".format(self.from_plan, self.plan['vendor'],
+                                                                    connection.vendor))
+        missing = set(self.plan.get('tables', ())) - set(connection.introspection.table_names())
+        if missing:
+            raise CommandError("Tables {} of {} don't exist.".format(', '.join(sorted(missing)), self.from_plan))
+        if self.plan.get('copies') and self.migrate:
+            raise CommandError("{} moves {} to another database, the data copy can't be replayed. Run move_model "
+                               "without --from-plan.".format(self.from_plan, ', '.join(self.plan['copies'])))
+
+        graph = self.loader.graph
+        for app_label, names in sorted(self.plan['leaves'].items()):
+            leaves = sorted(name for app, name in graph.leaf_nodes(app_label))
+            if leaves != names:
+                raise CommandError("{} was made on top of {} migrations {}, the current ones are {}. "
+                                   "Make a new plan.".format(self.from_plan, app_label, names, leaves))
+        for entry in self.plan['migrations']:
+            if (entry['app_label'], entry['name']) in graph.nodes:
+                raise CommandError("Migration {}.{} of {} already exists.".format(
+                    entry['app_label'], entry['name'], self.from_plan,
+                ))
+
+    def _write_planned_migrations(self):
+        self.from_state = None  # nothing is generated, the state is only needed by --migrate
         if self.migrate:
-            self.stdout.write(self.style.NOTICE("  Applying migrations.".format(self.model))
-                              ) if self.verbosity else None
-            MigrateCommand().handle(
-                app_label='',
-                migration_name='',
-                verbosity=self.verbosity,
-                interactive=self.interactive,
-                database=self.database,
-                fake=False,
-                fake_initial=False,
-                run_syncdb=False
+            self._ensure_full_loader()
+        self.initial_state = self.loader.project_state() if self.migrate else None
+        self.written_nodes = []
+        changes = OrderedDict()
+        for entry in self.plan['migrations']:
+            if self.dry_run:
+                self.stdout.write("    {}.{}".format(entry['app_label'], entry['name'])) if self.verbosity else None
+                for statement in entry['sql'] if self.verbosity >= 2 else ():
+                    self.stdout.write("      " + statement)
+            else:
+                path = write_migration(entry)
+                self.stdout.write("    {}".format(path)) if self.verbosity else None
+                self.profiler.count('migration_files')
+            changes.setdefault(entry['app_label'], []).append(build_migration(entry))
+        self._register_migrations(changes)
+
+    def _show_costs(self):
+        # nothing runs, the tables touched by every operation are looked up in the catalog statistics
+        estimates = estimate_migrations(
+            connections[self.database], [self.loader.graph.nodes[node] for node in self.written_nodes],
+            self.initial_state.clone(),
+        )
+        flagged = 0
+        for migration, operation, costs in estimates:
+            self.stdout.write("    {}.{}: {}".format(migration.app_label, migration.name, operation.describe()))
+            if costs is None:
+                self.stdout.write("      No estimate for this operation.")
+            for cost in costs or ():
+                if is_high_cost(cost):
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING("      " + format_cost(cost)))
+                else:
+                    self.stdout.write("      " + format_cost(cost))
+        if flagged:
+            self.stdout.write(self.style.WARNING(
+                "    {} operation{} flagged for scanning or rewriting big tables, consider moving their "
+                "models in separate steps.".format(flagged, '' if flagged == 1 else 's')
+            ))
+
+    def _copy_data(self):
+        for model_copy in chain.from_iterable(self.copies.values()):
+            table = model_copy.target_model._meta.db_table
+            if model_copy.create_table():
+                self.stdout.write("    Created {} on database '{}'.".format(table, model_copy.target)
+                                  ) if self.verbosity else None
+            model_copy.copy(progress=lambda copied: self.stdout.write(
+                "    {} rows copied to {}.".format(copied, table)
+            ) if self.verbosity >= 2 else None)
+            model_copy.reset_sequences()
+            source, target = model_copy.verify()
+            if source != target:
+                raise CommandError(
+                    "{} on database '{}' doesn't match its source: {} rows (checksum {}) there, {} rows "
+                    "(checksum {}) on '{}'. No migration was applied.".format(
+                        table, model_copy.target, target[0], target[1], source[0], source[1], self.database,
+                    )
+                )
+            self.stdout.write("    {} rows copied to {} on database '{}', counts and checksums match. {} stays on "
+                              "database '{}' until you drop it.".format(
+                                  source[0], table, model_copy.target,
+                                  model_copy.source_model._meta.db_table, self.database,
+                              )) if self.verbosity else None
+
+    def _through_models(self, model):
+        # auto-created M2M through models of a moved model, before and after moving, matched by field name
+        new_fields = dict(
+            (field.name, field) for field in self.new_apps.get_model(self.target_app, model)._meta.local_many_to_many
+        )
+        for old_field in self.old_apps.get_model(self.base_app, model)._meta.local_many_to_many:
+            new_field = new_fields.get(old_field.name)
+            if (new_field is not None and old_field.remote_field.through._meta.auto_created and
+                    new_field.remote_field.through._meta.auto_created):
+                yield old_field.remote_field.through, new_field.remote_field.through
+
+    def _move_content_types(self, moves=None):
+        # [(base_app, target_app, models)], this move by default
+        def progress(model, field, updated):
+            self.stdout.write("    {} rows of {}.{} re-pointed.".format(updated, model._meta.db_table, field.column)
+                              ) if self.verbosity >= 2 else None
+
+        for base_app, target_app, models in moves or [(self.base_app, self.target_app, self.models)]:
+            for model in models:
+                result = move_content_type(self.database, base_app, target_app, model,
+                                           chunk_size=self.chunk_size, pause=self.chunk_pause, progress=progress)
+                if result and self.verbosity:
+                    self.stdout.write("    Content type {}.{} {} {} {}.".format(
+                        base_app, model, result, 'to' if result == 'renamed' else 'into', target_app,
+                    ))
+        apps.get_model('contenttypes', 'ContentType').objects.clear_cache()
+
+    def _show_content_types(self, models=None):
+        content_type_model = apps.get_model('contenttypes', 'ContentType')
+        content_types = content_type_model._base_manager.db_manager(self.database)
+        for model in self.models if models is None else models:
+            old = content_types.filter(app_label=self.base_app, model=model).first()
+            if old is None:
+                continue
+            if not content_types.filter(app_label=self.target_app, model=model).exists():
+                self.stdout.write("    Content type {}.{} would be renamed.".format(self.base_app, model)
+                                  ) if self.verbosity else None
+            else:
+                self.stdout.write("    Content type {}.{} would be merged into {}.{}, {} rows re-pointed.".format(
+                    self.base_app, model, self.target_app, model,
+                    count_references(content_type_model, old.pk, self.database),
+                )) if self.verbosity else None
+
+    def _apply_migrations(self, applied=None):
+        # only the migrations written above, planned and applied on the graph and state already in memory;
+        # those an interrupted run applied already only move the state forward
+        applied = self.loader.applied_migrations if applied is None else applied
+        executor = InMemoryMigrationExecutor(connections[self.database], self.loader)
+        lock_guard = LockGuard(connections[self.database], **self.lock_options)
+        try:
+            state, timings = executor.apply_nodes(self.written_nodes, self.initial_state, applied=applied,
+                                                  lock_guard=lock_guard)
+        except InvalidMigrationPlan as error:
+            raise CommandError(error)
+        attempts = dict((label, count) for label, count, waited in lock_guard.attempts)
+        for (app_label, name), seconds in timings:
+            count = attempts.get('{}.{}'.format(app_label, name), 1)
+            self.stdout.write("    Applied {}.{} in {:.3f}s{}.".format(
+                app_label, name, seconds,
+                ', {} attempt{}'.format(count, '' if count == 1 else 's') if lock_guard.enabled else '',
+            )) if self.verbosity else None
+
+    def _rehearse(self):
+        # the migrations and content type moves of --migrate, on a copy which is dropped afterwards
+        with ExitStack() as stack:
+            try:
+                alias, seconds = stack.enter_context(cloned_database(self.database))
+            except ValueError as error:
+                raise CommandError(error)
+            rehearsal = Rehearsal(connections[alias])
+            executor = InMemoryMigrationExecutor(connections[alias], self.loader)
+            try:
+                executor.rehearse_nodes(self.written_nodes, self.initial_state.clone(), rehearsal)
+            except InvalidMigrationPlan as error:
+                raise CommandError(error)
+            if apps.is_installed('django.contrib.contenttypes'):
+                command = copy.copy(self)
+                command.database = alias
+                command.verbosity = 0
+                # in one transaction, so the tables it writes to are still locked when the step ends
+                with transaction.atomic(using=alias), rehearsal.step('content types'):
+                    command._move_content_types()
+        for line in rehearsal.report() if self.verbosity else ():
+            self.stdout.write(line)
+        self.stdout.write("    {:.3f}s in total on a copy made in {:.3f}s, the copy was dropped.".format(
+            rehearsal.seconds, seconds,
+        )) if self.verbosity else None
+
+    def _migrate_targets(self, content_types=None):
+        # migrations were generated against the first target, every target applies them on its own connection
+        def migrate(target, stdout):
+            command = copy.copy(self)
+            command.stdout = OutputWrapper(stdout)
+            command.database = target.alias
+            # an unrendered copy, threads never share rendered models
+            command.initial_state = ProjectState(
+                models=dict((key, model_state.clone()) for key, model_state in self.initial_state.models.items()),
+                real_apps=list(self.initial_state.real_apps),
             )
-        self.stdout.write(self.style.NOTICE("  Done.")) if self.verbosity else None
+            applied = MigrationRecorder(connections[target.alias]).applied_migrations()
+            behind = sorted(set(self.loader.applied_migrations) - set(applied) - set(self.written_nodes))
+            if behind:
+                raise CommandError("{} migrations applied on {} are not applied here, e.g. {}.{}.".format(
+                    len(behind), self.targets[0], behind[0][0], behind[0][1],
+                ))
+            command._apply_migrations(applied=applied)
+            if apps.is_installed('django.contrib.contenttypes'):
+                command._move_content_types(content_types)
+
+        results = run_targets(self.targets, migrate, workers=self.workers, done=lambda result: self.stdout.write(
+            target_output(result)
+        ) if self.verbosity else None)
+        self.stdout.write(summary(results))
+        failed = failed_targets(results)
+        if failed:
+            # the migration files are written by now, the failed databases only miss applying them
+            raise CommandError("{} of {} databases failed: {}. The migrations are written, apply them there with "
+                               "migrate.".format(len(failed.split(',')), len(results), failed))
 
-    def _check_db_state(self):
+    def _state_only_relations(self, app_label, migration_operations):
+        # relations whose SQL is the same once tables are renamed are moved to state_operations
+        schema_editor = connections[self.database].schema_editor(collect_sql=True)
+        result = []
+        for operation in migration_operations:
+            if isinstance(operation, operations.AlterField):
+                old_model = self.old_apps.get_model(app_label, operation.model_name)
+                new_model = self.new_apps.get_model(app_label, operation.model_name)
+                old_signature = field_db_signature(
+                    schema_editor, old_model, old_model._meta.get_field(operation.name), self.table_map
+                )
+                new_signature = field_db_signature(schema_editor, new_model, new_model._meta.get_field(operation.name))
+                if old_signature == new_signature:
+                    if result and isinstance(result[-1], SeparateDatabaseAndState):
+                        result[-1].state_operations.append(operation)
+                    else:
+                        result.append(SeparateDatabaseAndState(state_operations=[operation]))
+                    continue
+            result.append(operation)
+        return result
+
+    def _check_db_state(self, loader=None):
         # check if all previous migrations are applied
         connection = connections[self.database]
-        executor = MigrationExecutor(connection)
-        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
-        if plan:
+        # Only names and edges are read for the checks, migrations are loaded fully once states are needed.
+        self.loader = loader or self._get_preflight_loader(connection)
+        journaled = set(self.journal.nodes()) if self.journal is not None else set()
+        if set(self.loader.graph.nodes) - set(self.loader.applied_migrations) - journaled:
             raise CommandError('You have unapplied migrations! \nPlease apply them with "python manage.py migrate"'
                                ' before running "move_model".')
-        # Load the current graph state.
-        self.loader = self._get_loader()
+        self.initial_leaves = self.loader.graph.leaf_nodes()
         # Raise an error if any migrations are applied before their dependencies.
         if (connection.settings_dict['ENGINE'] != 'django.db.backends.dummy' and any(
                 # At least one model must be migrated to the database.
@@ -196,7 +908,7 @@ class Command(BaseCommand):
                 for app_label in self.app_labels
                 for model in apps.get_app_config(app_label).get_models()
         )):
-            self.loader.check_consistent_history(connection)
+            self._check_consistent_history(connection)
 
         conflicts = self.loader.detect_conflicts()
         if conflicts:
@@ -210,18 +922,39 @@ class Command(BaseCommand):
                 "'python manage.py makemigrations --merge'" % name_str
             )
 
-    def _get_autodetector(self, specified_apps):
-        self.loader = self._get_loader()  # Reload the current graph state.
+    def _check_consistent_history(self, connection):
+        # MigrationLoader.check_consistent_history reads the recorder again, this checks the applied set loaded above
+        applied = self.loader.applied_migrations
+        graph = self.loader.graph
+        for migration in applied:
+            if migration not in graph.nodes:
+                continue
+            for parent in graph.node_map[migration].parents:
+                parent = parent.key
+                if parent in applied:
+                    continue
+                if parent in self.loader.replacements and all(
+                    replaced in applied for replaced in self.loader.replacements[parent].replaces
+                ):
+                    continue
+                raise InconsistentMigrationHistory(
+                    "Migration {}.{} is applied before its dependency {}.{} on database '{}'.".format(
+                        migration[0], migration[1], parent[0], parent[1], connection.alias,
+                    )
+                )
+
+    def _get_autodetector(self, specified_apps, model_keys=None):
+        # model_keys limits the models autodetector knows about, all models by default
         autodetector = MigrationAutodetector(
-            self.loader.project_state(),
-            ProjectState.from_apps(apps),
+            self.from_state,
+            self.to_state,
             self.questioner(specified_apps=specified_apps),
         )
         # parameters below must be instantiated generating changes
         # they imitate the content of operations keeping the logic
         autodetector.generated_operations = {}
-        autodetector.old_apps = autodetector.from_state.concrete_apps
-        autodetector.new_apps = autodetector.to_state.apps
+        autodetector.old_apps = self.old_apps
+        autodetector.new_apps = self.new_apps
         autodetector.old_model_keys = []
         autodetector.old_proxy_keys = []
         autodetector.old_unmanaged_keys = []
@@ -234,6 +967,8 @@ class Command(BaseCommand):
 
         # these two loops are from autodetector._detect_changes
         for al, mn in sorted(autodetector.from_state.models.keys()):
+            if model_keys is not None and (al, mn) not in model_keys:
+                continue
             model = autodetector.old_apps.get_model(al, mn)
             if not model._meta.managed:
                 autodetector.old_unmanaged_keys.append((al, mn))
@@ -243,6 +978,8 @@ class Command(BaseCommand):
                 else:
                     autodetector.old_model_keys.append((al, mn))
         for al, mn in sorted(autodetector.to_state.models.keys()):
+            if model_keys is not None and (al, mn) not in model_keys:
+                continue
             model = autodetector.new_apps.get_model(al, mn)
             if not model._meta.managed:
                 autodetector.new_unmanaged_keys.append((al, mn))
@@ -256,17 +993,57 @@ class Command(BaseCommand):
                     autodetector.new_model_keys.append((al, mn))
         return autodetector
 
-    @staticmethod
-    def _get_loader():
-        return MigrationLoader(None, ignore_no_migrations=True)
+    def _get_preflight_loader(self, connection):
+        return AstMigrationLoader(connection, ignore_no_migrations=True)
+
+    def _ensure_full_loader(self):
+        # the preflight graph has no operations, the migrations are imported only when a phase needs states;
+        # this is the only full load for the whole command
+        if not isinstance(self.loader, AstMigrationLoader):
+            return
+        loader = self._get_loader(connections[self.database])
+        if not same_graph(self.loader.graph, loader.graph):
+            raise CommandError("Migration files changed while they were checked, run the command again.")
+        loader.applied_migrations = self.loader.applied_migrations  # as checked, e.g. renamed by refactor
+        self.loader = loader
+
+    def _get_loader(self, connection):
+        if self.cache_dir:
+            try:
+                return CachedMigrationLoader(connection, self.cache_dir, ignore_no_migrations=True)
+            except ValueError as error:
+                raise CommandError(error)
+        return MigrationLoader(connection, ignore_no_migrations=True)
 
     def _get_writer(self):
         writer = MakeMigrationCommand()
+        writer.stdout, writer.stderr = self.stdout, self.stderr
         writer.verbosity = self.verbosity
         writer.dry_run = self.dry_run
         return writer
 
-    def _verify_input(self):
+    def _resolve_models(self):
+        # expand glob patterns against models of base_app (migration state) which now live in target_app
+        moved = sorted(
+            model for app_label, model in self.from_state.models
+            if app_label == self.base_app and model in apps.get_app_config(self.target_app).models
+        )
+        models = []
+        for pattern in self.model_patterns:
+            pattern = pattern.lower()
+            if not any(char in pattern for char in '*?['):
+                matched = [pattern]
+            else:
+                matched = fnmatch.filter(moved, pattern)
+                if not matched:
+                    self.stderr.write("No model moved from {} to {} matches '{}'.".format(
+                        self.base_app, self.target_app, pattern
+                    ))
+                    sys.exit(2)
+            models.extend(model for model in matched if model not in models)
+        return models
+
+    def _verify_apps(self):
         # check if provided apps exist
         for app_label in (self.base_app, self.target_app):
             try:
@@ -275,22 +1052,59 @@ class Command(BaseCommand):
                 self.stderr.write("App '%s' could not be found. Is it in INSTALLED_APPS?" % app_label)
                 sys.exit(2)
 
+    def _verify_input(self):
         # check if models have been moved
-        msg = "You must physically move model {} from {} to {} and resolve all imports.".format(
-                    self.model, self.base_app, self.target_app
-                )
-        try:
-            apps.get_model(self.base_app, self.model)
-        except LookupError:
-            pass
-        else:
-            self.stderr.write(msg)
-            sys.exit(2)
-        try:
-            apps.get_model(self.target_app, self.model)
-        except LookupError:
-            self.stderr.write(msg)
-            sys.exit(2)
+        for model in self.models:
+            msg = "You must physically move model {} from {} to {} and resolve all imports.".format(
+                        model, self.base_app, self.target_app
+                    )
+            try:
+                apps.get_model(self.base_app, model)
+            except LookupError:
+                pass
+            else:
+                self.stderr.write(msg)
+                sys.exit(2)
+            try:
+                apps.get_model(self.target_app, model)
+            except LookupError:
+                self.stderr.write(msg)
+                sys.exit(2)
 
     def _write_migration_files(self, changes):
+        for migrations in changes.values():
+            for migration in migrations:  # extra dependencies may repeat the ones set by arrange_for_graph
+                migration.dependencies = list(OrderedDict.fromkeys(migration.dependencies))
+        if self.journal is not None and not self.dry_run:
+            self.journal.expect([(app_label, migration.name)
+                                 for app_label, migrations in changes.items() for migration in migrations])
         self.writer.write_migration_files(changes)
+        if not self.dry_run:
+            self.profiler.count('migration_files', sum(len(migrations) for migrations in changes.values()))
+        self._register_migrations(changes)
+
+    def _register_migrations(self, changes):
+        # add freshly generated migrations to the in-memory graph and state instead of reloading them from disk
+        graph = self.loader.graph
+        for app_label, migrations in changes.items():
+            for migration in migrations:
+                self._unbind_fields(migration.operations)
+                graph.add_node((app_label, migration.name), migration)
+                self.written_nodes.append((app_label, migration.name))
+        for app_label, migrations in changes.items():
+            for migration in migrations:
+                for parent in migration.dependencies:
+                    parent = self.loader.check_key(parent, app_label)
+                    if parent is not None:
+                        graph.add_dependency(migration, (app_label, migration.name), parent)
+                if self.from_state is not None:
+                    self.from_state = migration.mutate_state(self.from_state, preserve=False)
+
+    def _unbind_fields(self, migration_operations):
+        # autodetector takes AddField/AlterField fields from rendered models, states can only hold unbound ones
+        for operation in migration_operations:
+            if isinstance(operation, SeparateDatabaseAndState):
+                self._unbind_fields(operation.state_operations)
+                self._unbind_fields(operation.database_operations)
+            elif hasattr(getattr(operation, 'field', None), 'model'):
+                operation.field = operation.field.clone()
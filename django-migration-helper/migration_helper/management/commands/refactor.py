@@ -0,0 +1,253 @@
+import copy
+import json
+from collections import OrderedDict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from migration_helper.fanout import parse_targets, use_target
+from migration_helper.management.commands.move_model import Command as MoveModelCommand
+from migration_helper.management.commands.rename_app import Command as RenameAppCommand
+from migration_helper.profiling import PhaseProfiler
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# required and optional keys of every step
+STEPS = {
+    'move_model': (('models', 'base_app', 'target_app'), ('zero_ddl', )),
+    'rename_app': (('base_app', 'target_app'), ()),
+}
+
+
+class Command(BaseCommand):
+    """
+    Runs a script of move_model and rename_app steps in one process: the migration graph is loaded and
+    checked once, every move works on the graph and state left by the previous ones.
+
+    :param script: JSON or YAML file, a list of steps (optionally under "steps") like
+        {"rename_app": {"base_app": "shop", "target_app": "store"}} or
+        {"move_model": {"models": ["Order*"], "base_app": "store", "target_app": "orders"}}
+
+    :param --migrate: if passed migrations of all moves are applied after the last step, like move_model --migrate
+        does: models routed to another database are copied first, DDL runs under --lock-timeout
+    :param --dry-run: if passed nothing is written nor changed in the database, every step just shows what it would do
+    :param --database: database alias to perform operation on, unless different than default; with --migrate also
+        comma separated aliases, alias:schema pairs or "all", every one of them is migrated and renamed
+    :param --schemas: comma separated PostgreSQL schemas, the steps are applied in each of them
+    :param --workers: number of databases or schemas migrated at once
+    :param --lock-timeout: seconds every migration and rename waits for its locks before it's tried again
+    :param --lock-retries: number of times a migration or rename aborted by --lock-timeout is tried again
+    :param --lock-backoff: seconds to wait before the first retry, doubled for every further one
+    :param --cache-dir: directory for caching loaded migrations and project state between runs, it must be trusted
+    :param --profile: prints time, memory, loader builds and state renders for every phase, optionally saves them
+    :param --profile-dump: directory for cProfile dumps of every phase
+    """
+
+    help = "Runs a script of move_model and rename_app steps with a single setup."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'script',
+            help='JSON or YAML (.yaml, .yml) file with the list of steps.',
+        )
+        parser.add_argument(
+            '--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
+            help='Nominates a database to modify. Defaults to the "default" database. With --migrate '
+                 'a comma separated list of aliases or alias:schema pairs, or "all", is accepted.',
+        )
+        parser.add_argument(
+            '--schemas', action='store', dest='schemas', default=None,
+            help='Comma separated PostgreSQL schemas, the steps are applied in every one of them.',
+        )
+        parser.add_argument(
+            '--workers', action='store', dest='workers', type=int, default=4,
+            help='Number of databases or schemas migrated at once.',
+        )
+        parser.add_argument(
+            '--lock-timeout', action='store', dest='lock_timeout', type=float, default=None, metavar='SECONDS',
+            help='Aborts DDL waiting longer than this for its locks and tries it again later, so it never queues '
+                 'the queries behind it for long (lock_timeout on PostgreSQL, lock_wait_timeout on MySQL, '
+                 'the busy timeout on SQLite).',
+        )
+        parser.add_argument(
+            '--lock-retries', action='store', dest='lock_retries', type=int, default=5,
+            help='Attempts after the first one for DDL aborted by --lock-timeout.',
+        )
+        parser.add_argument(
+            '--lock-backoff', action='store', dest='lock_backoff', type=float, default=1.0, metavar='SECONDS',
+            help='Wait before the first retry, doubled for every further one and jittered.',
+        )
+        parser.add_argument(
+            '--cache-dir', action='store', dest='cache_dir', default=None,
+            help='Caches loaded migrations and the project state in this directory, '
+                 'only apps with changed migration files are loaded again. The state is pickled, so the '
+                 'directory must be trusted; it is created private to the current user.',
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false', dest='interactive', default=True,
+            help='Tells Django to NOT prompt the user for input of any kind.',
+        )
+        parser.add_argument(
+            '--profile', action='store', dest='profile', nargs='?', const='', default=None, metavar='REPORT',
+            help='Prints a profile of every phase, the report is also saved as JSON if a path is given.',
+        )
+        parser.add_argument(
+            '--profile-dump', action='store', dest='profile_dump', default=None, metavar='DIR',
+            help='Writes a cProfile dump of every phase to this directory.',
+        )
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument(
+            '--dry-run', action='store_true', dest='dry_run', default=False,
+            help="Just show what every step would do; don't write migrations nor change the database.",
+        )
+        group.add_argument(
+            '--migrate', action='store_true', dest='migrate', default=False,
+            help='Applies the migrations generated by all steps after the last one.',
+        )
+
+    def handle(self, *args, **options):
+        self._run(self._read_script(options['script']), options)
+
+    def _run(self, steps, options):
+        # steps as returned by _read_script, discover_moves runs the moves it found through here
+        try:
+            targets = parse_targets(options['database'], options.get('schemas'))
+        except ValueError as error:
+            raise CommandError(error)
+        self.database = targets[0].alias
+        self.migrate = options['migrate']
+        self.verbosity = options['verbosity']
+        self.profiler = PhaseProfiler(enabled=options['profile'] is not None, dump_dir=options['profile_dump'])
+
+        # every step is set up (and its apps verified) before the first one runs
+        self.steps = []
+        for name, step_options in steps:
+            command = (MoveModelCommand if name == 'move_model' else RenameAppCommand)(
+                no_color=options.get('no_color', False),
+            )
+            command.stdout, command.stderr = self.stdout, self.stderr
+            command._setup(dict(
+                step_options,
+                migrate=self.migrate,
+                database=options['database'],
+                schemas=options.get('schemas'),
+                workers=options.get('workers', 4),
+                lock_timeout=options.get('lock_timeout'),
+                lock_retries=options.get('lock_retries', 5),
+                lock_backoff=options.get('lock_backoff', 1.0),
+                cache_dir=options['cache_dir'],
+                zero_ddl=step_options.get('zero_ddl', False),
+                emit_plan=None,
+                from_plan=None,
+                interactive=options['interactive'],
+                verbosity=self.verbosity,
+                dry_run=options['dry_run'],
+            ))
+            command.profiler = self.profiler
+            self.steps.append((name, command))
+
+        with use_target(targets[0]):
+            self._run_steps()
+
+        if any(name == 'rename_app' for name, command in self.steps):
+            ContentType.objects.clear_cache()  # cached instances still carry the old app labels
+        if self.profiler.enabled:
+            self.stdout.write(self.profiler.summary())
+            if options['profile']:
+                self.profiler.write_report(options['profile'])
+        self.stdout.write(self.style.NOTICE("  Done.")) if self.verbosity else None
+
+    def _run_steps(self):
+        moves = [command for name, command in self.steps if name == 'move_model']
+        if moves:
+            self._preflight(moves[0])
+
+        for number, (name, command) in enumerate(self.steps, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING("Step {}/{}: {} {} {}".format(
+                number, len(self.steps), name, command.base_app, command.target_app,
+            ))) if self.verbosity else None
+            if name == 'rename_app':
+                command._rename_targets() if command.fan_out else command._rename()
+                continue
+            # the graph and states carry the migrations of all previous moves
+            for attribute in ('loader', 'from_state', 'to_state', 'old_apps', 'new_apps', 'initial_leaves'):
+                setattr(command, attribute, getattr(moves[0], attribute))
+            with self.profiler.phase('prepare move'):
+                command._prepare_move()
+            command._generate()
+
+        if self.migrate and moves:
+            # the migrations of all moves at once, the way move_model --migrate applies those of one move
+            command = copy.copy(moves[-1])
+            command.written_nodes = [node for move in moves for node in move.written_nodes]
+            command.initial_state = self.initial_state
+            command.copies = OrderedDict(
+                ('{}.{}'.format(move.target_app, model), model_copies)
+                for move in moves for model, model_copies in move.copies.items()
+            )
+            command._migrate([(move.base_app, move.target_app, move.models) for move in moves])
+
+    def _preflight(self, command):
+        # migrations recorded under app labels renamed by the script count as applied under their new labels
+        with self.profiler.phase('check db state'):
+            loader = command._get_preflight_loader(connections[self.database])
+            renames = [(step.base_app, step.target_app) for name, step in self.steps if name == 'rename_app']
+
+            def translate(key):
+                for base_app, target_app in renames:
+                    if key[0] == base_app:
+                        key = (target_app, key[1])
+                return key
+
+            applied = loader.applied_migrations
+            if isinstance(applied, dict):
+                loader.applied_migrations = type(applied)((translate(key), value) for key, value in applied.items())
+            else:
+                loader.applied_migrations = set(translate(key) for key in applied)
+            command._check_db_state(loader)
+        with self.profiler.phase('load state'):
+            command._load_state()
+            moves = [step for name, step in self.steps if name == 'move_model']
+            for step in moves:
+                step.from_state = command.from_state
+                step.models = step._resolve_models()
+            command._scope_states([(step.base_app, step.target_app, step.models) for step in moves])
+            self.initial_state = command.from_state.clone() if self.migrate else None
+
+    def _read_script(self, path):
+        try:
+            with open(path) as script_file:
+                if path.endswith(('.yaml', '.yml')):
+                    if yaml is None:
+                        raise CommandError('PyYAML is required to read {}, install it or use JSON.'.format(path))
+                    script = yaml.safe_load(script_file)
+                else:
+                    script = json.load(script_file)
+        except (IOError, ValueError) as error:
+            raise CommandError(error)
+
+        steps = script.get('steps') if isinstance(script, dict) else script
+        if not isinstance(steps, list) or not steps:
+            raise CommandError('{} has no list of steps.'.format(path))
+        result = []
+        for number, step in enumerate(steps, 1):
+            if not isinstance(step, dict) or len(step) != 1 or next(iter(step)) not in STEPS:
+                raise CommandError('Step {} must be one of {}.'.format(number, ', '.join(sorted(STEPS))))
+            name, step_options = next(iter(step.items()))
+            required, optional = STEPS[name]
+            step_options = dict(step_options or {})
+            missing = set(required) - set(step_options)
+            unknown = set(step_options) - set(required) - set(optional)
+            if missing or unknown:
+                raise CommandError('Step {} ({}) is missing {} or has unknown {}.'.format(
+                    number, name, ', '.join(sorted(missing)) or 'nothing', ', '.join(sorted(unknown)) or 'nothing',
+                ))
+            if name == 'move_model' and not isinstance(step_options['models'], list):
+                step_options['models'] = [step_options['models']]
+            result.append((name, step_options))
+        return result
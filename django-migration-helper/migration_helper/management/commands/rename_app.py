@@ -1,11 +1,23 @@
+import copy
 import sys
+from contextlib import ExitStack
 
 from django.apps import apps
 from django.contrib.contenttypes.models import ContentType
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError, OutputWrapper
 from django.db import DEFAULT_DB_ALIAS, connections
-from django.db.backends.base.schema import BaseDatabaseSchemaEditor
 from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Value
+from django.db.models.functions import Concat, Length, Substr
+
+from migration_helper.costs import format_cost, is_high_cost, rename_costs
+from migration_helper.fanout import failed_targets, parse_targets, run_targets, summary, target_output, use_target
+from migration_helper.locks import LockGuard
+from migration_helper.plan import read_plan, write_plan
+from migration_helper.profiling import PhaseProfiler
+from migration_helper.rehearsal import cloned_database, Rehearsal
+from migration_helper.rename import plan_renames, rename_atomic, rename_sql
+from migration_helper.sqlreport import SQLRecorder
 
 
 class Command(BaseCommand):
@@ -26,56 +38,279 @@ class Command(BaseCommand):
         )
         parser.add_argument(
             '--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
-            help='Nominates a database to modify. Defaults to the "default" database.',
+            help='Nominates a database to modify. Defaults to the "default" database. A comma separated list '
+                 'of aliases or alias:schema pairs, or "all", renames the app in every one of them.',
+        )
+        parser.add_argument(
+            '--schemas', action='store', dest='schemas', default=None,
+            help='Comma separated PostgreSQL schemas, the app is renamed in every one of them.',
+        )
+        parser.add_argument(
+            '--workers', action='store', dest='workers', type=int, default=4,
+            help='Number of databases or schemas renamed at once.',
         )
         parser.add_argument(
             '--noinput', '--no-input',
             action='store_false', dest='interactive', default=True,
             help='Tells Django to NOT prompt the user for input of any kind.',
         )
+        parser.add_argument(
+            '--profile', action='store', dest='profile', nargs='?', const='', default=None, metavar='REPORT',
+            help='Prints a profile of every phase, the report is also saved as JSON if a path is given.',
+        )
+        parser.add_argument(
+            '--profile-dump', action='store', dest='profile_dump', default=None, metavar='DIR',
+            help='Writes a cProfile dump of every phase to this directory.',
+        )
+        parser.add_argument(
+            '--sql-report', action='store', dest='sql_report', nargs='?', const='', default=None, metavar='REPORT',
+            help='Records every SQL statement with its phase, duration, rows and whether it held schema locks, '
+                 'prints the longest ones and saves all of them as JSON if a path is given.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', dest='dry_run', default=False,
+            help="Just show which tables would be renamed; don't change the database.",
+        )
+        parser.add_argument(
+            '--rehearse', action='store_true', dest='rehearse', default=False,
+            help="Renames the app on a throwaway copy of the database (SQLite or PostgreSQL) and reports the "
+                 "time and locks of every step; the database itself isn't changed.",
+        )
+        parser.add_argument(
+            '--lock-timeout', action='store', dest='lock_timeout', type=float, default=None, metavar='SECONDS',
+            help='Aborts DDL waiting longer than this for its locks and tries it again later, so it never queues '
+                 'the queries behind it for long (lock_timeout on PostgreSQL, lock_wait_timeout on MySQL, '
+                 'the busy timeout on SQLite).',
+        )
+        parser.add_argument(
+            '--lock-retries', action='store', dest='lock_retries', type=int, default=5,
+            help='Attempts after the first one for DDL aborted by --lock-timeout.',
+        )
+        parser.add_argument(
+            '--lock-backoff', action='store', dest='lock_backoff', type=float, default=1.0, metavar='SECONDS',
+            help='Wait before the first retry, doubled for every further one and jittered.',
+        )
+        plan_group = parser.add_mutually_exclusive_group()
+        plan_group.add_argument(
+            '--emit-plan', action='store', dest='emit_plan', default=None, metavar='PLAN',
+            help='Saves the table renames and their SQL to this file.',
+        )
+        plan_group.add_argument(
+            '--from-plan', action='store', dest='from_plan', default=None, metavar='PLAN',
+            help='Renames the tables with the SQL of a saved plan instead of planning them again.',
+        )
 
     def handle(self, *args, **options):
+        self._setup(options)
+        self.profiler = PhaseProfiler(enabled=options['profile'] is not None, dump_dir=options['profile_dump'])
+        self.sql_recorder = SQLRecorder(
+            connections[self.database], phase=lambda: self.profiler.name, enabled=options['sql_report'] is not None
+        )
+        if self.fan_out:
+            self._rename_targets()
+        else:
+            with use_target(self.targets[0]), self.sql_recorder.recording():
+                self._rename()
+
+        ContentType.objects.clear_cache()  # cached instances still carry the old app label
+        if self.profiler.enabled:
+            self.stdout.write(self.profiler.summary())
+            if options['profile']:
+                self.profiler.write_report(options['profile'])
+        if self.sql_recorder.enabled:
+            self.stdout.write(self.sql_recorder.summary())
+            if options['sql_report']:
+                self.sql_recorder.write_report(options['sql_report'])
+        self.stdout.write(self.style.NOTICE("  Done.")) if self.verbosity else None
+
+    def _setup(self, options):
         self.base_app = options['base_app']
         self.target_app = options['target_app']
-        self.database = options['database']
+        try:
+            self.targets = parse_targets(options['database'], options.get('schemas'))
+        except ValueError as error:
+            raise CommandError(error)
+        self.database = self.targets[0].alias
+        self.workers = options.get('workers', 4)
+        self.fan_out = len(self.targets) > 1
+        if self.fan_out and (options.get('sql_report') is not None or options['emit_plan']):
+            raise CommandError("--sql-report and --emit-plan work on a single database.")
+        self.dry_run = options['dry_run']
+        self.rehearse = options.get('rehearse', False)
+        if self.rehearse and (self.dry_run or self.fan_out):
+            raise CommandError("--rehearse copies a single database and can't be combined with --dry-run.")
+        self.emit_plan = options['emit_plan']
+        self.from_plan = options['from_plan']
+        self.lock_options = dict(
+            timeout=options.get('lock_timeout'),
+            retries=options.get('lock_retries', 5),
+            backoff=options.get('lock_backoff', 1.0),
+        )
 
         self.verbosity = options['verbosity']
         self.interactive = options['interactive']
 
-        connection = connections[self.database]
-
+    def _rename(self):
         self.stdout.write(self.style.NOTICE("  Renaming {} to {}.".format(self.base_app, self.target_app))
                           ) if self.verbosity else None
         # [0] Perform some checks about apps_labels, apps state, db state and migrations
+        with self.profiler.phase('verify input'):
+            self._verify_input()
+        with self.profiler.phase('plan tables'):
+            if self.from_plan:
+                self._validate_plan()
+            else:
+                connection = connections[self.database]
+                self.tables, self.sequences, self.skipped = plan_renames(connection, self.base_app, self.target_app)
+                self.table_sql = rename_sql(connection, self.tables, self.sequences)
+        if self.emit_plan:
+            write_plan(
+                self.emit_plan, 'rename_app',
+                base_app=self.base_app,
+                target_app=self.target_app,
+                vendor=connections[self.database].vendor,
+                tables=self.tables,
+                sequences=self.sequences,
+                sql=self.table_sql,
+            )
+            self.stdout.write("    Plan saved to {}.".format(self.emit_plan)) if self.verbosity else None
+        if self.dry_run:
+            costs = rename_costs(connections[self.database], self.tables) if self.verbosity else ()
+            for (old_name, new_name), cost in zip(self.tables, costs):
+                self.stdout.write("    Would rename table {} to {}.".format(old_name, new_name))
+                self.stdout.write((self.style.WARNING if is_high_cost(cost) else str)("      " + format_cost(cost)))
+            for old_name, new_name in self.sequences:
+                self.stdout.write("    Would rename sequence {} to {}.".format(old_name, new_name)
+                                  ) if self.verbosity else None
+            for name in self.skipped:
+                self.stdout.write("    Would leave table {}, no model of {} uses it.".format(name, self.target_app)
+                                  ) if self.verbosity else None
+            for statement in self.table_sql if self.verbosity >= 2 else ():
+                self.stdout.write("      " + statement)
+            return
+        if self.rehearse:
+            self.stdout.write(self.style.NOTICE("  Rehearsing on a copy of '{}'.".format(self.database))
+                              ) if self.verbosity else None
+            with self.profiler.phase('rehearse'):
+                self._rehearse()
+            return
+
+        # the whole transaction runs under the lock timeout: a lock which isn't granted in time rolls back
+        # everything, so no lock taken by an earlier step is held while waiting to try again; where steps commit
+        # on their own (see rename_atomic) the ones already done find nothing left to rename on the next attempt
+        lock_guard = LockGuard(connections[self.database], **self.lock_options)
+        lock_guard.run('rename {} to {}'.format(self.base_app, self.target_app),
+                       self.profiler.retried(self._rename_atomic))
+        for line in lock_guard.report() if self.verbosity else ():
+            self.stdout.write(line)
+
+    def _rename_atomic(self):
+        with rename_atomic(connections[self.database]):
+            # [1] Edit django_content_type table, alter <base_app> to <target_app> (also in model) ContentType
+            self.stdout.write(self.style.NOTICE("  Renaming content types.")) if self.verbosity else None
+            with self.profiler.phase('content types'):
+                self._rename_content_types()
+
+            # [2] Rename model tables under <base_app> BaseDatabaseSchemaEditor
+            self.stdout.write(self.style.NOTICE("  Renaming database tables.")) if self.verbosity else None
+            with self.profiler.phase('database tables'):
+                self._rename_tables()
+
+            # [3] Edit django_migrations table, MigrationRecorder.Migration
+            self.stdout.write(self.style.NOTICE("  Renaming migration tables.")) if self.verbosity else None
+            with self.profiler.phase('migrations'):
+                self._rename_migrations()
+
+    def _rename_targets(self):
+        # every target is renamed in its own transaction on its own connection, a failure doesn't stop the rest
+        def rename(target, stdout):
+            command = copy.copy(self)
+            command.stdout = command.stderr = OutputWrapper(stdout)
+            command.database = target.alias
+            command.profiler = PhaseProfiler()
+            command._rename()
+
         self._verify_input()
+        with self.profiler.phase('rename databases'):
+            results = run_targets(self.targets, rename, workers=self.workers, done=lambda result: self.stdout.write(
+                target_output(result)
+            ) if self.verbosity else None)
+        self.stdout.write(summary(results))
+        failed = failed_targets(results)
+        if failed:
+            raise CommandError("{} of {} databases failed, retry them with --database {}".format(
+                len(failed.split(',')), len(results), failed,
+            ))
 
-        # [1] Edit django_content_type table, alter <base_app> to <target_app> (also in model) ContentType
-        self.stdout.write(self.style.NOTICE("  Renaming content types.")) if self.verbosity else None
-        for ctype in ContentType.objects.all():
-            if ctype.app_label == self.base_app:
-                ctype.app_label = self.target_app
-                count = ctype.model.count(self.base_app)
-                if count:
-                    ctype.model = ctype.model[:-len(self.base_app)] + self.target_app
-                ctype.save()
-
-        # [2] Rename model tables under <base_app> BaseDatabaseSchemaEditor
-        self.stdout.write(self.style.NOTICE("  Renaming database tables.")) if self.verbosity else None
-        with connection.schema_editor(atomic=True) as schema_editor:
-            for model, state in apps.get_app_config(self.target_app).models.items():
-                default_old_name = '_'.join((self.base_app, model))
-                if default_old_name == state._meta.db_table:
-                    new_name = '_'.join((self.target_app, model))
-                    schema_editor.alter_db_table(model, default_old_name, new_name)
-
-        # [3] Edit django_migrations table, MigrationRecorder.Migration
-        self.stdout.write(self.style.NOTICE("  Renaming migration tables.")) if self.verbosity else None
-        for migration in MigrationRecorder.Migration.objects.all():
-            if migration.app == self.base_app:
-                migration.app = self.target_app
-                migration.save()
+    def _rehearse(self):
+        # the steps below in one transaction where the backend allows it, like a real rename, on a copy which
+        # is dropped afterwards
+        with ExitStack() as stack:
+            try:
+                alias, seconds = stack.enter_context(cloned_database(self.database))
+            except ValueError as error:
+                raise CommandError(error)
+            rehearsal = Rehearsal(connections[alias])
+            command = copy.copy(self)
+            command.database = alias
+            command.verbosity = 0
+            with rename_atomic(connections[alias]):
+                with rehearsal.step('content types'):
+                    command._rename_content_types()
+                with connections[alias].schema_editor(atomic=True) as schema_editor:
+                    for statement in self.table_sql:
+                        with rehearsal.step(' '.join(statement.split())[:100]):
+                            schema_editor.execute(statement, params=None)
+                with rehearsal.step('migrations'):
+                    command._rename_migrations()
+        for line in rehearsal.report() if self.verbosity else ():
+            self.stdout.write(line)
+        self.stdout.write("    {:.3f}s in total on a copy made in {:.3f}s, the copy was dropped.".format(
+            rehearsal.seconds, seconds,
+        )) if self.verbosity else None
 
-        self.stdout.write(self.style.NOTICE("  Done.")) if self.verbosity else None
+    def _rename_content_types(self):
+        content_types = ContentType.objects.using(self.database).filter(app_label=self.base_app)
+        count = content_types.filter(model__endswith=self.base_app).update(
+            app_label=self.target_app,
+            model=Concat(Substr('model', 1, Length('model') - len(self.base_app)), Value(self.target_app)),
+        )
+        count += content_types.update(app_label=self.target_app)
+        self.stdout.write("    {} content types renamed.".format(count)) if self.verbosity else None
+
+    def _rename_tables(self):
+        # statements are batched by rename_sql, most backends get a single one
+        for cost in rename_costs(connections[self.database], self.tables) if self.verbosity >= 2 else ():
+            self.stdout.write("    " + format_cost(cost))
+        with connections[self.database].schema_editor(atomic=True) as schema_editor:
+            for statement in self.table_sql:
+                schema_editor.execute(statement, params=None)
+        self.stdout.write("    {} tables and {} sequences renamed.".format(len(self.tables), len(self.sequences))
+                          ) if self.verbosity else None
+
+    def _validate_plan(self):
+        try:
+            plan = read_plan(self.from_plan, 'rename_app')
+        except (IOError, ValueError) as error:
+            raise CommandError(error)
+        connection = connections[self.database]
+        if (plan['base_app'], plan['target_app']) != (self.base_app, self.target_app):
+            raise CommandError("{} renames {} to {}.".format(self.from_plan, plan['base_app'], plan['target_app']))
+        if plan['vendor'] != connection.vendor:
+            raise CommandError("{} was made for {}, not {}.".format(self.from_plan, plan['vendor'], connection.vendor))
+        missing = set(old_name for old_name, new_name in plan['tables']) - set(connection.introspection.table_names())
+        if missing:
+            raise CommandError("Tables {} of {} don't exist.".format(', '.join(sorted(missing)), self.from_plan))
+        self.tables = [tuple(names) for names in plan['tables']]
+        self.sequences = [tuple(names) for names in plan.get('sequences', ())]
+        self.skipped = []
+        self.table_sql = plan['sql']
+
+    def _rename_migrations(self):
+        count = MigrationRecorder.Migration.objects.using(self.database).filter(
+            app=self.base_app,
+        ).update(app=self.target_app)
+        self.stdout.write("    {} migrations renamed.".format(count)) if self.verbosity else None
 
     def _verify_input(self):
         # check if provided apps exist and been renamed
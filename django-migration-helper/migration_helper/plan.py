@@ -0,0 +1,78 @@
+import io
+import json
+import os
+
+from django.db.migrations import Migration
+from django.db.migrations.writer import MigrationWriter
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+PLAN_VERSION = 2
+# plans carry migration source which is executed and SQL which is run, they are signed with SECRET_KEY
+SIGNATURE_SALT = 'migration_helper.plan'
+
+
+def migration_entry(migration, sql=()):
+    """
+    Serializes a generated migration: its source as makemigrations writes it, dependencies and target SQL.
+    """
+    source = MigrationWriter(migration).as_string()
+    if isinstance(source, bytes):  # Django < 1.11 returns the encoded file
+        source = source.decode('utf-8')
+    return {
+        'app_label': migration.app_label,
+        'name': migration.name,
+        'dependencies': [list(dependency) for dependency in migration.dependencies],
+        'source': source,
+        'sql': list(sql),
+    }
+
+
+def build_migration(entry):
+    """
+    Instantiates the Migration of a plan entry from its source, the same object the loader gets from the file.
+    The source is executed, entries must come from a plan whose signature read_plan checked.
+    """
+    namespace = {'__name__': '%s.%s' % (entry['app_label'], entry['name'])}
+    exec(compile(entry['source'], entry['name'] + '.py', 'exec'), namespace)
+    return namespace['Migration'](entry['name'], entry['app_label'])
+
+
+def write_migration(entry):
+    # same layout as makemigrations, the migrations package is created when missing
+    path = MigrationWriter(Migration(entry['name'], entry['app_label'])).path
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.mkdir(directory)
+    init_path = os.path.join(directory, '__init__.py')
+    if not os.path.isfile(init_path):
+        open(init_path, 'w').close()
+    with io.open(path, 'w', encoding='utf-8') as migration_file:
+        migration_file.write(entry['source'])
+    return path
+
+
+def write_plan(path, command, **plan):
+    plan.update(version=PLAN_VERSION, command=command)
+    plan['signature'] = _signature(plan)
+    with open(path, 'w') as plan_file:
+        json.dump(plan, plan_file, indent=2)
+
+
+def read_plan(path, command):
+    """
+    Returns the plan saved by write_plan, ValueError if it is of another command or version, or if its signature
+    doesn't match: the plan was changed after it was written or made by a project with another SECRET_KEY.
+    """
+    with open(path) as plan_file:
+        plan = json.load(plan_file)
+    if plan.get('version') != PLAN_VERSION or plan.get('command') != command:
+        raise ValueError('%s is not a %s plan of version %s.' % (path, command, PLAN_VERSION))
+    signature = plan.pop('signature', '')
+    if not constant_time_compare(signature, _signature(plan)):
+        raise ValueError('%s was changed after it was made or made with another SECRET_KEY, '
+                         'it is not replayed.' % path)
+    return plan
+
+
+def _signature(plan):
+    return salted_hmac(SIGNATURE_SALT, json.dumps(plan, sort_keys=True)).hexdigest()
@@ -0,0 +1,170 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import StateApps
+
+
+class PhaseProfiler(object):
+    """
+    Collects wall time, CPU time, peak traced memory, MigrationLoader builds, state renders
+    and written migration files for every phase of a command.
+    A disabled profiler only runs the phases.
+
+    Phases may nest, a nested phase is part of the time of the enclosing one and calls are counted for the
+    innermost phase only.
+
+    :param dump_dir: if set, a cProfile dump is written there for every phase
+    """
+
+    def __init__(self, enabled=False, dump_dir=None):
+        self.enabled = enabled or bool(dump_dir)
+        self.dump_dir = dump_dir
+        self.phases = []
+        self.current = None
+        self.name = None
+        self.depth = 0
+        self.patches = []
+        # set while a retried function runs again: index of its first phase and the attempt
+        self.retried_from = None
+        self.attempt = 1
+
+    @contextmanager
+    def phase(self, name):
+        previous_name, self.name = self.name, name
+        try:
+            with self._measure(name):
+                yield
+        finally:
+            self.name = previous_name
+
+    def retried(self, function):
+        """
+        Wraps a function which may be called again, e.g. by LockGuard.run; the phases of every further call
+        add to the records of the first one instead of being recorded again.
+        """
+        calls = {'first': None, 'attempt': 0}
+
+        def run(*args, **kwargs):
+            calls['attempt'] += 1
+            if calls['first'] is None:
+                calls['first'] = len(self.phases)
+            saved = self.retried_from, self.attempt
+            if calls['attempt'] > 1:
+                self.retried_from, self.attempt = calls['first'], calls['attempt']
+            else:
+                self.retried_from, self.attempt = None, 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.retried_from, self.attempt = saved
+        return run
+
+    @contextmanager
+    def _measure(self, name):
+        if not self.enabled:
+            yield
+            return
+        record = self._record(name)
+        previous, self.current = self.current, record
+        if self.depth == 0:
+            self.patches = self._count_calls()
+        self.depth += 1
+        profile = cProfile.Profile() if self.dump_dir else None
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.clear_traces()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            record['peak_memory'] = max(record['peak_memory'], tracemalloc.get_traced_memory()[1])
+            if started_tracing:
+                tracemalloc.stop()
+            self.depth -= 1
+            if self.depth == 0:
+                for owner, attribute, original in self.patches:
+                    setattr(owner, attribute, original)
+                self.patches = []
+            self.current = previous
+            if previous is not None:
+                # the peak of an enclosing phase was reset by this one
+                previous['peak_memory'] = max(previous['peak_memory'], record['peak_memory'])
+            if profile:
+                os.makedirs(self.dump_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(self.dump_dir, '%02d_%s.prof' % (
+                    self.phases.index(record) + 1, name.replace(' ', '_'),
+                )))
+
+    def _record(self, name):
+        # a phase entered again by a retried attempt adds to the record of the earlier attempt
+        if self.retried_from is not None:
+            for record in self.phases[self.retried_from:]:
+                if record['name'] == name and record['depth'] == self.depth and record['attempts'] < self.attempt:
+                    record['attempts'] += 1
+                    return record
+        record = {'name': name, 'depth': self.depth, 'attempts': 1, 'wall': 0.0, 'cpu': 0.0, 'peak_memory': 0,
+                  'loader_builds': 0, 'state_renders': 0, 'migration_files': 0}
+        self.phases.append(record)
+        return record
+
+    def count(self, key, value=1):
+        if self.current is not None:
+            self.current[key] += value
+
+    def _count_calls(self):
+        # patched once for the outermost phase, every call counts for the innermost phase running
+        def counting(original, key):
+            def counted(*args, **kwargs):
+                self.count(key)
+                return original(*args, **kwargs)
+            return counted
+
+        patches = []
+        for owner, attribute, key in ((MigrationLoader, 'build_graph', 'loader_builds'),
+                                      (StateApps, '__init__', 'state_renders')):
+            original = owner.__dict__[attribute]
+            setattr(owner, attribute, counting(original, key))
+            patches.append((owner, attribute, original))
+        return patches
+
+    def report(self):
+        # time of nested phases is part of the enclosing one, calls are counted for the innermost phase only
+        total = {'name': 'total', 'depth': 0, 'attempts': 1}
+        for key in ('wall', 'cpu'):
+            total[key] = sum(phase[key] for phase in self.phases if phase['depth'] == 0)
+        for key in ('loader_builds', 'state_renders', 'migration_files'):
+            total[key] = sum(phase[key] for phase in self.phases)
+        total['peak_memory'] = max([phase['peak_memory'] for phase in self.phases] or [0])
+        return {'phases': self.phases, 'total': total}
+
+    def write_report(self, path):
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+    def summary(self):
+        rows = ['  {:<24} {:>9} {:>9} {:>11} {:>7} {:>7} {:>6}'.format(
+            'phase', 'wall [s]', 'cpu [s]', 'peak [KiB]', 'loaders', 'renders', 'files'
+        )]
+        report = self.report()
+        for phase in report['phases'] + [report['total']]:
+            label = '  ' * phase['depth'] + phase['name'] + (
+                ' x{}'.format(phase['attempts']) if phase['attempts'] > 1 else ''
+            )
+            rows.append('  {:<24} {wall:>9.3f} {cpu:>9.3f} {memory:>11.1f} {loader_builds:>7} {state_renders:>7} '
+                        '{migration_files:>6}'.format(label, memory=phase['peak_memory'] / 1024.0, **phase))
+        return '\n'.join(rows)
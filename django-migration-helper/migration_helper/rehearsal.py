@@ -0,0 +1,139 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.db import connections, DatabaseError
+
+# granted locks on relations outside the system catalogs, held by the current session
+PG_LOCKS_SQL = """
+    SELECT c.relname, l.mode FROM pg_locks l
+    JOIN pg_class c ON c.oid = l.relation
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE l.pid = pg_backend_pid() AND l.granted AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+"""
+
+
+@contextmanager
+def cloned_database(alias):
+    """
+    Copies the database of the alias into a throwaway one, dropped afterwards, and yields the alias of
+    a connection to the copy and the seconds copying took. SQLite is copied with the backup API into
+    a temporary file (dumped as SQL and loaded into it before Python 3.7), PostgreSQL with
+    CREATE DATABASE ... TEMPLATE, which needs every other session of the source database to be closed.
+    """
+    connection = connections[alias]
+    settings = dict(connection.settings_dict)
+    clone_alias = '%s_rehearsal' % alias
+    start = time.perf_counter()
+    if connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp(prefix='migration_helper_rehearsal_')
+        settings['NAME'] = os.path.join(directory, 'rehearsal.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(settings['NAME'])
+        try:
+            _copy_sqlite(connection.connection, target)
+        finally:
+            target.close()
+
+        def drop():
+            shutil.rmtree(directory, ignore_errors=True)
+    elif connection.vendor == 'postgresql':
+        # database names are limited to 63 characters
+        settings['NAME'] = '%s_rehearsal_%s' % (settings['NAME'][:42], uuid.uuid4().hex[:8])
+        quote_name = connection.ops.quote_name
+        connection.close()  # a template can't have open sessions, this one included
+        try:
+            with _nodb_cursor(connection) as cursor:
+                cursor.execute('CREATE DATABASE %s TEMPLATE %s' % (
+                    quote_name(settings['NAME']), quote_name(connection.settings_dict['NAME']),
+                ))
+        except DatabaseError as error:
+            raise ValueError("Database '%s' can't be copied, no other session may use it meanwhile: %s" % (
+                alias, error,
+            ))
+
+        def drop():
+            with _nodb_cursor(connection) as cursor:
+                cursor.execute('DROP DATABASE %s' % quote_name(settings['NAME']))
+    else:
+        raise ValueError("Database '%s' is %s, only SQLite and PostgreSQL databases can be copied." % (
+            alias, connection.vendor,
+        ))
+
+    connections.databases[clone_alias] = settings
+    try:
+        yield clone_alias, time.perf_counter() - start
+    finally:
+        connections[clone_alias].close()
+        del connections[clone_alias]
+        del connections.databases[clone_alias]
+        drop()
+
+
+def _nodb_cursor(connection):
+    # a cursor on the maintenance database, Django 3.1 replaced _nodb_connection with _nodb_cursor()
+    if hasattr(connection, '_nodb_cursor'):
+        return connection._nodb_cursor()
+    return connection._nodb_connection.cursor()
+
+
+def _copy_sqlite(source, target):
+    if hasattr(source, 'backup'):
+        source.backup(target)
+    else:  # sqlite3 has no backup API before Python 3.7
+        target.executescript('\n'.join(source.iterdump()))
+
+
+def held_locks(connection):
+    """
+    Returns the set of (table, lock mode) held by the session, or None where the backend has no lock view:
+    SQLite locks the whole database for writing until the transaction ends.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(PG_LOCKS_SQL)
+        return set(cursor.fetchall())
+
+
+class Rehearsal(object):
+    """
+    Times the steps run on a cloned database and records the locks every step took, read before the
+    transaction it runs in ends and releases them.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.steps = []  # [(label, seconds, [(table, lock mode)] or None)]
+
+    @contextmanager
+    def step(self, label):
+        before = held_locks(self.connection)
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        after = held_locks(self.connection)
+        self.steps.append((label, seconds, None if after is None else sorted(after - before)))
+
+    @property
+    def seconds(self):
+        return sum(seconds for label, seconds, locks in self.steps)
+
+    def report(self):
+        """
+        Lines with the time and locks of every step, in the order they ran.
+        """
+        lines = []
+        for label, seconds, locks in self.steps:
+            lines.append('    {:>9.4f}s  {}'.format(seconds, label))
+            if locks:
+                lines.append('                locks {}'.format(', '.join(
+                    '{} ({})'.format(table, mode) for table, mode in locks
+                )))
+        if self.connection.vendor == 'sqlite':
+            lines.append('    SQLite locks the whole database for writing until every transaction commits.')
+        return lines
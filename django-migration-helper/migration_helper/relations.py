@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+
+def model_key(reference, app_label):
+    """
+    Normalizes a relation target (model class or "app_label.ModelName" string) to (app_label, model_name).
+    """
+    if isinstance(reference, str):
+        if '.' in reference:
+            reference_app, model_name = reference.split('.', 1)
+        else:
+            reference_app, model_name = app_label, reference
+        return reference_app, model_name.lower()
+    return reference._meta.app_label, reference._meta.model_name
+
+
+def state_fields(model_state):
+    fields = model_state.fields
+    return fields.items() if isinstance(fields, dict) else fields
+
+
+def iter_relations(app_label, model_state):
+    """
+    Yields (field_name, target key) for every FK, O2O and M2M field of the model state,
+    M2M fields with an explicit `through` yield the through model as well.
+    """
+    for name, field in state_fields(model_state):
+        remote_field = getattr(field, 'remote_field', None)
+        if remote_field is None:
+            continue
+        yield name, model_key(remote_field.model, app_label)
+        if getattr(remote_field, 'through', None) is not None:
+            yield name, model_key(remote_field.through, app_label)
+
+
+def iter_bases(app_label, model_state):
+    for base in model_state.bases:
+        if isinstance(base, str) or hasattr(base, '_meta'):
+            yield model_key(base, app_label)
+
+
+def iter_live_relations(model):
+    """
+    Yields the target key of every relation, explicit through model and parent of a registered model.
+    """
+    for field in model._meta.local_fields + model._meta.local_many_to_many:
+        if field.remote_field is None:
+            continue
+        yield model_key(field.remote_field.model, model._meta.app_label)
+        through = getattr(field.remote_field, 'through', None)
+        if through is not None and not (hasattr(through, '_meta') and through._meta.auto_created):
+            yield model_key(through, model._meta.app_label)
+    for parent in model._meta.parents:
+        yield model_key(parent, model._meta.app_label)
+
+
+def relation_closure(state, seeds, live_apps):
+    """
+    Returns the keys of the seed models, of every model with a relation to them or inheriting from them,
+    and of everything all of these point at (related models, explicit through models, parents), transitively.
+    Both the migration state and the live registry are followed, nothing is rendered.
+    """
+    live = dict(
+        ((model._meta.app_label, model._meta.model_name), model) for model in live_apps.get_models(include_swapped=True)
+    )
+    referencing = set(
+        (app_label, model_name) for app_label, model_name, field_name in referencing_fields(
+            build_reverse_index(state), seeds
+        )
+    )
+    for key, model_state in state.models.items():
+        if any(base in seeds for base in iter_bases(key[0], model_state)):
+            referencing.add(key)
+    for key, model in live.items():
+        if key in seeds:
+            referencing.update(
+                model_key(relation.related_model, None) for relation in model._meta.get_fields(include_hidden=True)
+                if relation.auto_created and not relation.concrete and not relation.related_model._meta.auto_created
+            )
+        if any(model_key(parent, None) in seeds for parent in model._meta.parents):
+            referencing.add(key)
+
+    closure, pending = set(), list(set(seeds) | referencing)
+    while pending:
+        key = pending.pop()
+        if key in closure:
+            continue
+        closure.add(key)
+        if key in state.models:
+            pending.extend(target for field_name, target in iter_relations(key[0], state.models[key]))
+            pending.extend(iter_bases(key[0], state.models[key]))
+        if key in live:
+            pending.extend(iter_live_relations(live[key]))
+    return closure
+
+
+def build_reverse_index(*states):
+    """
+    Maps every model key to the set of (app_label, model_name, field_name) which point at it.
+    """
+    index = defaultdict(set)
+    for state in states:
+        for (app_label, model_name), model_state in state.models.items():
+            for field_name, target in iter_relations(app_label, model_state):
+                index[target].add((app_label, model_name, field_name))
+    return index
+
+
+def referencing_fields(index, model_keys):
+    return set().union(*(index.get(key, ()) for key in model_keys))
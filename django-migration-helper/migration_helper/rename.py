@@ -0,0 +1,102 @@
+from contextlib import ExitStack
+
+import django
+from django.apps import apps
+from django.db import transaction
+from django.db.backends.utils import truncate_name
+
+# sequences are separate objects only on these backends, renaming a table leaves their names alone
+SEQUENCES_SQL = {
+    'postgresql': "SELECT c.relname FROM pg_catalog.pg_class c WHERE c.relkind = 'S' AND pg_table_is_visible(c.oid)",
+}
+
+
+def plan_renames(connection, base_app, target_app):
+    """
+    Works out the database objects of base_app which target_app expects under its own name, reading the
+    table (and sequence) list once: model tables, auto-created M2M tables and, on PostgreSQL, their sequences.
+
+    :return: (tables, sequences, skipped), tables and sequences as [(old name, new name)], skipped are
+        tables with the old prefix which no model of target_app expects under the new name
+    """
+    existing = set(connection.introspection.table_names())
+    max_length = connection.ops.max_name_length()
+    owned = set(model._meta.db_table for model in apps.get_models(include_auto_created=True))
+    tables = []
+    for model in apps.get_app_config(target_app).get_models(include_auto_created=True):
+        if model._meta.proxy or not model._meta.managed:
+            continue
+        old_name = _old_name(model, base_app, target_app, max_length)
+        if old_name and old_name in existing and old_name not in owned:
+            tables.append((old_name, model._meta.db_table))
+    tables.sort()
+
+    renamed = set(old_name for old_name, new_name in tables)
+    skipped = sorted(
+        name for name in existing
+        if name.startswith(base_app + '_') and name not in renamed and name not in owned
+    )
+    return tables, _plan_sequences(connection, tables, max_length), skipped
+
+
+def rename_sql(connection, tables, sequences):
+    """
+    Returns the statements renaming tables and sequences, batched as far as the backend allows it: a single
+    multi-table RENAME TABLE on MySQL, one execute of all statements on PostgreSQL, one per table elsewhere.
+    """
+    quote = connection.ops.quote_name
+    if not tables and not sequences:
+        return []
+    if connection.vendor == 'mysql':
+        return ['RENAME TABLE %s' % ', '.join('%s TO %s' % (quote(old), quote(new)) for old, new in tables)]
+    statements = [
+        connection.SchemaEditorClass.sql_rename_table % {'old_table': quote(old), 'new_table': quote(new)}
+        for old, new in tables
+    ] + [
+        'ALTER SEQUENCE %s RENAME TO %s' % (quote(old), quote(new)) for old, new in sequences
+    ]
+    if connection.vendor == 'postgresql':
+        return [';\n'.join(statements)]
+    return statements
+
+
+def rename_atomic(connection):
+    """
+    Returns the transaction a whole rename runs in. Since Django 2.0 the SQLite schema editor refuses to start
+    inside one, foreign key checks can't be turned off there, so on SQLite every step commits on its own.
+    """
+    if connection.vendor == 'sqlite' and django.VERSION >= (2, 0):
+        return ExitStack()
+    return transaction.atomic(using=connection.alias)
+
+
+def _old_name(model, base_app, target_app, max_length):
+    # the name Django gave the table while the model lived in base_app, None for custom names
+    opts = model._meta
+    if opts.auto_created:
+        field = next(field for field in opts.auto_created._meta.local_many_to_many
+                     if field.remote_field.through is model)
+        owner_old_name = _old_name(opts.auto_created, base_app, target_app, max_length)
+        if field.db_table or not owner_old_name:
+            return None
+        return truncate_name('%s_%s' % (owner_old_name, field.name), max_length)
+    if opts.db_table != truncate_name('%s_%s' % (target_app, opts.model_name), max_length):
+        return None
+    return truncate_name('%s_%s' % (base_app, opts.model_name), max_length)
+
+
+def _plan_sequences(connection, tables, max_length):
+    sql = SEQUENCES_SQL.get(connection.vendor)
+    if sql is None or not tables:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        names = [row[0] for row in cursor.fetchall()]
+    sequences = []
+    for name in names:
+        # the longest table prefix wins, base_app_order_id_seq is not a sequence of base_app_order_items
+        matched = [(old, new) for old, new in tables if name.startswith(old + '_')]
+        if matched:
+            old, new = max(matched, key=lambda names: len(names[0]))
+            sequences.append((name, truncate_name(new + name[len(old):], max_length)))
+    return sorted(sequences)
@@ -0,0 +1,27 @@
+def field_db_signature(schema_editor, model, field, table_map=None):
+    """
+    Describes everything the database knows about a field: the column definition SQL, what its
+    foreign key references and, for auto-created M2M, the same for the through table.
+    Two fields with equal signatures need no DDL to turn one into the other.
+
+    :param table_map: physical renames {old_table: new_table} done before the field is altered
+    """
+    table_map = table_map or {}
+
+    def table(related_model):
+        return table_map.get(related_model._meta.db_table, related_model._meta.db_table)
+
+    if field.db_parameters(connection=schema_editor.connection)['type'] is None:
+        through = field.remote_field.through
+        if not through._meta.auto_created:
+            return 'through', table(through)  # explicit through model fields are altered on their own
+        return ('m2m', table(through)) + tuple(
+            field_db_signature(schema_editor, through, through_field, table_map)
+            for through_field in through._meta.local_fields
+        )
+    definition, params = schema_editor.column_sql(model, field)
+    signature = (table(model), field.column, definition, tuple(params or ()), field.db_index)
+    if field.remote_field and field.db_constraint:
+        target_field = field.target_field
+        signature += ('REFERENCES', table(target_field.model), target_field.column)
+    return signature
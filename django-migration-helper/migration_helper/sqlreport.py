@@ -0,0 +1,134 @@
+import json
+import time
+from contextlib import contextmanager
+
+
+class SQLRecorder(object):
+    """
+    Records every statement executed on a connection: the phase it ran in, its duration, affected rows
+    and whether it ran inside an atomic schema editor block, which is the time locks taken by DDL are held.
+    A disabled recorder records nothing.
+
+    :param phase: callable returning the name of the current phase
+    """
+
+    def __init__(self, connection, phase=lambda: None, enabled=False):
+        self.connection = connection
+        self.phase = phase
+        self.enabled = enabled
+        self.statements = []
+        self.schema_editor_depth = 0
+
+    @contextmanager
+    def recording(self):
+        if not self.enabled:
+            yield
+            return
+        patched = ['schema_editor']
+        original_schema_editor = self.connection.schema_editor
+        self.connection.schema_editor = lambda *args, **kwargs: self._track(original_schema_editor(*args, **kwargs))
+        if hasattr(self.connection, 'execute_wrapper'):
+            wrapper = self.connection.execute_wrapper(self)
+        else:
+            # Django < 2.0 has no execute wrappers, every cursor the connection makes is wrapped instead
+            wrapper = None
+            for name in ('make_cursor', 'make_debug_cursor'):
+                make = getattr(self.connection, name)
+                setattr(self.connection, name, lambda cursor, make=make: RecordingCursor(make(cursor), self))
+                patched.append(name)
+        try:
+            if wrapper is not None:
+                with wrapper:
+                    yield
+            else:
+                yield
+        finally:
+            for name in patched:
+                delattr(self.connection, name)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append({
+                'phase': self.phase(),
+                'sql': sql,
+                'many': many,
+                'duration': time.perf_counter() - start,
+                'rows': getattr(context['cursor'], 'rowcount', -1),
+                'atomic': self.connection.in_atomic_block,
+                'schema_editor': self.schema_editor_depth > 0,
+            })
+
+    def _track(self, editor):
+        recorder, base = self, type(editor)
+
+        class TrackedSchemaEditor(base):
+            def __enter__(self):
+                result = super(TrackedSchemaEditor, self).__enter__()
+                recorder.schema_editor_depth += self.atomic_migration
+                return result
+
+            def __exit__(self, *exc_info):
+                try:
+                    return super(TrackedSchemaEditor, self).__exit__(*exc_info)  # deferred SQL still runs here
+                finally:
+                    recorder.schema_editor_depth -= self.atomic_migration
+
+        editor.__class__ = TrackedSchemaEditor
+        return editor
+
+    def write_report(self, path):
+        with open(path, 'w') as report_file:
+            json.dump({'statements': self.statements}, report_file, indent=2)
+
+    def summary(self, longest=10):
+        rows = ['  {} statements, {:.3f}s in total, {:.3f}s inside atomic schema editor blocks.'.format(
+            len(self.statements),
+            sum(statement['duration'] for statement in self.statements),
+            sum(statement['duration'] for statement in self.statements if statement['schema_editor']),
+        )]
+        for statement in sorted(self.statements, key=lambda item: -item['duration'])[:longest]:
+            rows.append('  {duration:>9.4f}s {rows:>8} rows  {lock:<6} {phase:<20} {sql}'.format(
+                lock='locked' if statement['schema_editor'] else '',
+                sql=' '.join(statement['sql'].split())[:100],
+                phase=statement['phase'] or '',
+                duration=statement['duration'],
+                rows=statement['rows'],
+            ))
+        return '\n'.join(rows)
+
+
+class RecordingCursor(object):
+    """
+    Cursor proxy passing execute() and executemany() through the recorder, like an execute wrapper would.
+    """
+
+    def __init__(self, cursor, recorder):
+        self.cursor = cursor
+        self.recorder = recorder
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.cursor.__exit__(*exc_info)
+
+    def execute(self, sql, params=None):
+        return self.recorder(
+            lambda sql, params, many, context: self.cursor.execute(sql, params),
+            sql, params, False, {'cursor': self.cursor, 'connection': self.recorder.connection},
+        )
+
+    def executemany(self, sql, param_list):
+        return self.recorder(
+            lambda sql, params, many, context: self.cursor.executemany(sql, params),
+            sql, param_list, True, {'cursor': self.cursor, 'connection': self.recorder.connection},
+        )
@@ -12,6 +12,7 @@ setup(
     version='0.1.1',
     packages=find_packages(),
     install_requires='django >= 1.7',
+    extras_require={'yaml': ['PyYAML']},
     include_package_data=True,
     license='GNU License',
     description='Django helper for more complicated migrations.',
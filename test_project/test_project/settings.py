@@ -83,7 +83,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # the test apps have no migrations, their tables don't exist to be serialized
+        'TEST': {'SERIALIZE': False},
+    },
+    # models routed elsewhere and several databases migrated at once
+    'other': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'other.sqlite3'),
+        'TEST': {'SERIALIZE': False},
+    },
 }
 
 
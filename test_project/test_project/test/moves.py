@@ -0,0 +1,146 @@
+import importlib
+import os
+import sys
+import tempfile
+
+from django.core.management import call_command
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import TransactionTestCase, override_settings
+
+# apps whose migrations are written by the tests, the models of target_app and rename_app still live in base_app
+APP_LABELS = ('base_app', 'target_app', 'foreign_app', 'rename_app')
+PACKAGE = 'moved_migrations'
+
+ID = "('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'))"
+
+BASE_APP_INITIAL = '''
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel('TestModel', [%(id)s, ('test_field', models.CharField(max_length=1))]),
+        migrations.CreateModel('SecondTestModel', [%(id)s, ('field', models.CharField(max_length=1))]),
+        migrations.CreateModel('TestModelRenamedApp', [%(id)s, ('text', models.CharField(max_length=1))]),
+        migrations.CreateModel('TestSecondModelRenamedApp', [%(id)s]),
+    ]
+''' % {'id': ID}
+
+BASE_APP_M2M = '''
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [('base_app', '0001_initial'), ('foreign_app', '0001_initial')]
+
+    operations = [
+        migrations.AddField('TestSecondModelRenamedApp', 'test_m2m',
+                            models.ManyToManyField(to='foreign_app.TestRenamedModel')),
+    ]
+'''
+
+FOREIGN_APP_INITIAL = '''
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [('base_app', '0001_initial')]
+
+    operations = [
+        migrations.CreateModel('TestFKModel', [
+            %(id)s,
+            ('test_fk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base_app.TestModel')),
+            ('test_second_fk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                 to='base_app.SecondTestModel')),
+        ]),
+        migrations.CreateModel('TestM2MModel', [
+            %(id)s,
+            ('test_m2m', models.ManyToManyField(to='base_app.TestModel')),
+            ('test_second_m2m', models.ManyToManyField(to='base_app.SecondTestModel')),
+        ]),
+        migrations.CreateModel('TestO2OModel', [
+            %(id)s,
+            ('test_o2o', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='base_app.TestModel')),
+            ('test_second_o2o', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                                     to='base_app.SecondTestModel')),
+        ]),
+        migrations.CreateModel('TestRenamedModel', [
+            %(id)s,
+            ('test_m2m', models.ManyToManyField(to='base_app.TestModelRenamedApp')),
+        ]),
+    ]
+''' % {'id': ID}
+
+MIGRATIONS = {
+    'base_app': {'0001_initial': BASE_APP_INITIAL, '0002_testsecondmodelrenamedapp_test_m2m': BASE_APP_M2M},
+    'foreign_app': {'0001_initial': FOREIGN_APP_INITIAL},
+    'target_app': {},
+    'rename_app': {},
+}
+
+
+class MoveTestCase(TransactionTestCase):
+    """
+    Migrations of the test apps written to a temporary package and applied: SecondTestModel was moved to
+    target_app and both models of rename_app were moved there in the code, base_app still has them in the
+    migrations. Everything the tests write or migrate is removed afterwards.
+    """
+    multi_db = True
+    databases = '__all__'
+    migrated_databases = ('default', )
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.package = os.path.join(self.directory.name, PACKAGE)
+        self._write_package(self.package)
+        for app_label, migrations in MIGRATIONS.items():
+            self._write_package(os.path.join(self.package, app_label), migrations)
+        sys.path.insert(0, self.directory.name)
+        self.settings = override_settings(MIGRATION_MODULES=dict(
+            (app_label, '%s.%s' % (PACKAGE, app_label)) for app_label in APP_LABELS
+        ))
+        self.settings.enable()
+        for alias in self.migrated_databases:
+            call_command('migrate', database=alias, verbosity=0)
+
+    def tearDown(self):
+        for alias in connections:
+            connection = connections[alias]
+            tables = [name for name in connection.introspection.table_names()
+                      if name.startswith(tuple(app_label + '_' for app_label in APP_LABELS))]
+            with connection.cursor() as cursor:
+                for table in tables:
+                    cursor.execute('DROP TABLE %s' % connection.ops.quote_name(table))
+            if MigrationRecorder.Migration._meta.db_table in connection.introspection.table_names():
+                MigrationRecorder.Migration.objects.using(alias).filter(app__in=APP_LABELS).delete()
+        self.settings.disable()
+        sys.path.remove(self.directory.name)
+        self.unload_migrations()
+        self.directory.cleanup()
+
+    def migration_names(self, app_label):
+        # files written so far, migrations written by a command are imported from here by the next one
+        importlib.invalidate_caches()
+        return sorted(name[:-3] for name in os.listdir(os.path.join(self.package, app_label))
+                      if name.endswith('.py') and name != '__init__.py')
+
+    @staticmethod
+    def unload_migrations():
+        # the next loader imports the files afresh, like a new process
+        for name in [name for name in sys.modules if name.split('.')[0] == PACKAGE]:
+            del sys.modules[name]
+
+    @staticmethod
+    def _write_package(directory, modules=None):
+        os.mkdir(directory)
+        for name, source in dict(modules or {}, __init__='').items():
+            with open(os.path.join(directory, name + '.py'), 'w') as module_file:
+                module_file.write(source)
@@ -0,0 +1,286 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, connections, migrations, models
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.graph import MigrationGraph
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase
+
+from migration_helper.compact import compacted_graph, find_runs, is_helper_migration, squash_run, _closes_cycle
+from test_project.test.moves import MoveTestCase
+
+
+def migration(app_label, name, operations, dependencies=()):
+    result = migrations.Migration(name, app_label)
+    result.operations = list(operations)
+    result.dependencies = list(dependencies)
+    return result
+
+
+def build_graph(*nodes):
+    graph = MigrationGraph()
+    for node in nodes:
+        graph.add_node((node.app_label, node.name), node)
+    for node in nodes:
+        for dependency in node.dependencies:
+            graph.add_dependency(node, (node.app_label, node.name), dependency)
+    return graph
+
+
+def create(name):
+    return migrations.CreateModel(name, [('id', models.AutoField(primary_key=True))])
+
+
+def state_only(*operations):
+    return migrations.SeparateDatabaseAndState(state_operations=list(operations))
+
+
+class TestCompact(SimpleTestCase):
+    """
+    Here we find and squash runs of the migrations written by moving models out of base_app twice
+    """
+    def setUp(self):
+        relation = models.ForeignKey('target_app.TestModel', models.CASCADE)
+        self.nodes = [
+            migration('base_app', '0001_initial', [create('TestModel'), create('OtherModel')]),
+            migration('foreign_app', '0001_initial', [migrations.CreateModel('TestFKModel', [
+                ('id', models.AutoField(primary_key=True)),
+                ('test_fk', models.ForeignKey('base_app.TestModel', models.CASCADE)),
+            ])], [('base_app', '0001_initial')]),
+            # first move: base_app.TestModel to target_app
+            migration('base_app', '0002_helper_rename_tables', [
+                migrations.AlterModelTable('TestModel', 'target_app_testmodel'),
+            ], [('base_app', '0001_initial')]),
+            migration('target_app', '0001_helper_create_models', [state_only(create('TestModel'))],
+                      [('base_app', '0002_helper_rename_tables')]),
+            migration('foreign_app', '0002_helper_move_relations', [
+                migrations.AlterField('TestFKModel', 'test_fk', relation),
+            ], [('foreign_app', '0001_initial'), ('target_app', '0001_helper_create_models')]),
+            migration('base_app', '0003_helper_delete_models', [state_only(migrations.DeleteModel('TestModel'))],
+                      [('base_app', '0002_helper_rename_tables'), ('foreign_app', '0002_helper_move_relations')]),
+            # second move: base_app.OtherModel to target_app, nothing refers to it
+            migration('base_app', '0004_helper_rename_tables', [
+                migrations.AlterModelTable('OtherModel', 'target_app_othermodel'),
+            ], [('base_app', '0003_helper_delete_models')]),
+            migration('base_app', '0005_helper_delete_models', [state_only(migrations.DeleteModel('OtherModel'))],
+                      [('base_app', '0004_helper_rename_tables')]),
+            migration('target_app', '0002_helper_create_models', [state_only(create('OtherModel'))],
+                      [('target_app', '0001_helper_create_models'), ('base_app', '0005_helper_delete_models')]),
+        ]
+        self.graph = build_graph(*self.nodes)
+
+    def test_is_helper_migration(self):
+        self.assertTrue(all(is_helper_migration(node) for node in self.nodes if 'helper' in node.name))
+        self.assertFalse(is_helper_migration(self.nodes[0]))
+        hand_written = migration('foreign_app', '0003_auto_20170101_1200', [
+            migrations.AlterField('TestFKModel', 'test_fk', models.ForeignKey('target_app.TestModel', models.CASCADE)),
+        ])
+        self.assertFalse(is_helper_migration(hand_written))
+        run_python = migration('base_app', '0006_helper_delete_models', [
+            migrations.RunPython(migrations.RunPython.noop),
+        ])
+        self.assertFalse(is_helper_migration(run_python))
+        # older versions left them auto-named, they are told by their operations
+        auto_named = migration('base_app', '0006_auto_20170101_1200', [state_only(migrations.DeleteModel('TestModel'))])
+        self.assertTrue(is_helper_migration(auto_named))
+        renamed = migration('base_app', '0006_auto_20170101_1200', [
+            migrations.AlterModelTable('TestModel', 'target_app_testmodel'),
+        ])
+        self.assertTrue(is_helper_migration(renamed))
+        renamed.operations = [migrations.AlterModelTable('TestModel', 'legacy_models')]
+        self.assertFalse(is_helper_migration(renamed))
+        run_sql = migration('base_app', '0006_auto_20170101_1200', [migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL('DROP TABLE base_app_testmodel')],
+            state_operations=[migrations.DeleteModel('TestModel')],
+        )])
+        self.assertFalse(is_helper_migration(run_sql))
+
+    def test_closes_cycle(self):
+        # the relations re-pointed in foreign_app sit between the renames and the deletes of the first move
+        parents = {('base_app', '0002_helper_rename_tables'), ('foreign_app', '0002_helper_move_relations')}
+        run = [('base_app', '0002_helper_rename_tables'), ('base_app', '0003_helper_delete_models')]
+        self.assertTrue(_closes_cycle(self.graph, run, parents))
+        run = [('base_app', '0003_helper_delete_models'), ('base_app', '0004_helper_rename_tables')]
+        self.assertFalse(_closes_cycle(self.graph, run, {('base_app', '0003_helper_delete_models')}))
+
+    def test_find_runs(self):
+        self.assertEqual(find_runs(self.graph, ['base_app', 'target_app', 'foreign_app']), [
+            [('base_app', '0003_helper_delete_models'), ('base_app', '0004_helper_rename_tables'),
+             ('base_app', '0005_helper_delete_models')],
+        ])
+
+    def test_find_runs_stops_at_hand_written_migrations(self):
+        hand_written = migration('base_app', '0004_auto_20170101_1200', [
+            migrations.AlterField('OtherModel', 'id', models.AutoField(primary_key=True)),
+        ], [('base_app', '0003_helper_delete_models')])
+        self.nodes[6].dependencies = [('base_app', '0004_auto_20170101_1200')]
+        graph = build_graph(hand_written, *self.nodes)
+        self.assertEqual(find_runs(graph, ['base_app']), [
+            [('base_app', '0004_helper_rename_tables'), ('base_app', '0005_helper_delete_models')],
+        ])
+
+    def test_squash_run(self):
+        run = find_runs(self.graph, ['base_app'])[0]
+        squashed = squash_run(self.graph, run)
+        self.assertEqual(squashed.name, '0003_helper_delete_models_squashed_0005_helper_delete_models')
+        self.assertEqual(squashed.replaces, run)
+        self.assertEqual(squashed.dependencies,
+                         [('base_app', '0002_helper_rename_tables'), ('foreign_app', '0002_helper_move_relations')])
+        self.assertEqual([type(operation) for operation in squashed.operations],
+                         [migrations.SeparateDatabaseAndState, migrations.AlterModelTable,
+                          migrations.SeparateDatabaseAndState])
+
+        compacted = compacted_graph(self.graph, [squashed])
+        key = ('base_app', squashed.name)
+        self.assertEqual(compacted.leaf_nodes('base_app'), [key])
+        self.assertIn(key, compacted.forwards_plan(('target_app', '0002_helper_create_models')))
+
+    def test_squash_state_only_operations(self):
+        # a model created and deleted again within the run folds away
+        nodes = [
+            migration('target_app', '0001_initial', [create('SecondTestModel')]),
+            migration('target_app', '0002_helper_create_models', [state_only(create('TestModel'))],
+                      [('target_app', '0001_initial'), ('base_app', '0001_initial')]),
+            migration('target_app', '0003_helper_create_models', [state_only(create('OtherModel'))],
+                      [('target_app', '0002_helper_create_models')]),
+            migration('target_app', '0004_helper_delete_models', [state_only(migrations.DeleteModel('TestModel'))],
+                      [('target_app', '0003_helper_create_models'), ('base_app', '0001_initial')]),
+        ]
+        graph = build_graph(migration('base_app', '0001_initial', []), *nodes)
+        squashed = squash_run(graph, [(node.app_label, node.name) for node in nodes[1:]])
+        self.assertEqual(squashed.dependencies, [('target_app', '0001_initial'), ('base_app', '0001_initial')])
+        self.assertEqual(len(squashed.operations), 1)
+        self.assertEqual([operation.name for operation in squashed.operations[0].state_operations], ['OtherModel'])
+
+
+class TestCompactAutoNamed(SimpleTestCase):
+    """
+    Here we find and squash runs of the auto-named migrations older versions wrote moving models out of base_app twice
+    """
+    def test_find_runs(self):
+        rename = migrations.SeparateDatabaseAndState(database_operations=[
+            migrations.AlterModelTable('TestModel', 'target_app_testmodel'),
+        ])
+        nodes = [
+            migration('base_app', '0001_initial', [create('TestModel'), create('OtherModel')]),
+            migration('foreign_app', '0001_initial', [migrations.CreateModel('TestFKModel', [
+                ('id', models.AutoField(primary_key=True)),
+                ('test_fk', models.ForeignKey('base_app.TestModel', models.CASCADE)),
+            ])], [('base_app', '0001_initial')]),
+            migration('base_app', '0002_auto_20170101_1200', [rename], [('base_app', '0001_initial')]),
+            migration('target_app', '0001_initial', [state_only(create('TestModel'))],
+                      [('base_app', '0002_auto_20170101_1200')]),
+            migration('foreign_app', '0002_auto_20170101_1201', [
+                migrations.AlterField('TestFKModel', 'test_fk', models.ForeignKey('target_app.TestModel',
+                                                                                  models.CASCADE)),
+            ], [('foreign_app', '0001_initial'), ('base_app', '0002_auto_20170101_1200'),
+                ('target_app', '0001_initial')]),
+            migration('base_app', '0003_auto_20170101_1202', [state_only(migrations.DeleteModel('TestModel'))],
+                      [('base_app', '0002_auto_20170101_1200'), ('foreign_app', '0002_auto_20170101_1201')]),
+            migration('base_app', '0004_auto_20170201_1200', [migrations.SeparateDatabaseAndState(database_operations=[
+                migrations.AlterModelTable('OtherModel', 'target_app_othermodel'),
+            ])], [('base_app', '0003_auto_20170101_1202')]),
+            migration('base_app', '0005_auto_20170201_1201', [state_only(migrations.DeleteModel('OtherModel'))],
+                      [('base_app', '0004_auto_20170201_1200')]),
+            migration('target_app', '0002_auto_20170201_1202', [state_only(create('OtherModel'))],
+                      [('target_app', '0001_initial'), ('base_app', '0005_auto_20170201_1201')]),
+        ]
+        graph = build_graph(*nodes)
+        # the relations re-pointed by the first move alter the database, its renames and deletes stay apart
+        runs = find_runs(graph, ['base_app', 'target_app', 'foreign_app'])
+        self.assertEqual(runs, [[('base_app', '0003_auto_20170101_1202'), ('base_app', '0004_auto_20170201_1200'),
+                                 ('base_app', '0005_auto_20170201_1201')]])
+        squashed = squash_run(graph, runs[0])
+        self.assertEqual(squashed.bridges, {})
+        compacted = compacted_graph(graph, [squashed])
+        self.assertEqual(compacted.make_state(nodes=compacted.leaf_nodes(), at_end=True).models,
+                         graph.make_state(nodes=graph.leaf_nodes(), at_end=True).models)
+
+
+class TestCompactSingleMove(SimpleTestCase):
+    """
+    Here we squash the renames and deletes of a single move whose created models and relations only change the state
+    """
+    def setUp(self):
+        self.nodes = [
+            migration('base_app', '0001_initial', [create('TestModel')]),
+            migration('foreign_app', '0001_initial', [migrations.CreateModel('TestFKModel', [
+                ('id', models.AutoField(primary_key=True)),
+                ('test_fk', models.ForeignKey('base_app.TestModel', models.CASCADE)),
+            ])], [('base_app', '0001_initial')]),
+            migration('base_app', '0002_helper_rename_tables', [migrations.SeparateDatabaseAndState(
+                database_operations=[migrations.AlterModelTable('TestModel', 'target_app_testmodel')],
+            )], [('base_app', '0001_initial')]),
+            migration('target_app', '0001_helper_create_models', [state_only(create('TestModel'))],
+                      [('base_app', '0002_helper_rename_tables')]),
+            migration('foreign_app', '0002_helper_move_relations', [state_only(
+                migrations.AlterField('TestFKModel', 'test_fk', models.ForeignKey('target_app.TestModel',
+                                                                                  models.CASCADE)),
+            )], [('foreign_app', '0001_initial'), ('base_app', '0002_helper_rename_tables'),
+                 ('target_app', '0001_helper_create_models')]),
+            migration('base_app', '0003_helper_delete_models', [state_only(migrations.DeleteModel('TestModel'))],
+                      [('base_app', '0002_helper_rename_tables'), ('foreign_app', '0002_helper_move_relations')]),
+        ]
+        self.graph = build_graph(*self.nodes)
+
+    def test_bridges(self):
+        run = [('base_app', '0002_helper_rename_tables'), ('base_app', '0003_helper_delete_models')]
+        self.assertEqual(find_runs(self.graph, ['base_app', 'target_app', 'foreign_app']), [run])
+        squashed = squash_run(self.graph, run)
+        self.assertEqual(squashed.dependencies,
+                         [('base_app', '0001_initial'), ('foreign_app', '0002_helper_move_relations')])
+        self.assertEqual(squashed.bridges, {
+            ('foreign_app', '0002_helper_move_relations'): [
+                ('foreign_app', '0001_initial'), ('base_app', '0001_initial'),
+                ('target_app', '0001_helper_create_models'),
+            ],
+            ('target_app', '0001_helper_create_models'): [('base_app', '0001_initial')],
+        })
+
+        compacted = compacted_graph(self.graph, [squashed])
+        key = ('base_app', squashed.name)
+        plan = compacted.forwards_plan(key)
+        self.assertEqual(plan[-2:], [('foreign_app', '0002_helper_move_relations'), key])
+        self.assertIn(('target_app', '0001_helper_create_models'), plan)
+        self.assertEqual(compacted.make_state(nodes=compacted.leaf_nodes(), at_end=True).models,
+                         self.graph.make_state(nodes=self.graph.leaf_nodes(), at_end=True).models)
+
+    def test_relations_altering_the_database(self):
+        self.nodes[4].operations = [migrations.AlterField(
+            'TestFKModel', 'test_fk', models.ForeignKey('target_app.TestModel', models.CASCADE),
+        )]
+        self.assertEqual(find_runs(build_graph(*self.nodes), ['base_app']), [])
+
+
+class TestCompactMoves(MoveTestCase):
+    """
+    Here we move a model with --zero-ddl, compact its migrations and migrate a new database with them
+    """
+    def test_compact_moves(self):
+        call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', migrate=True, zero_ddl=True,
+                     stdout=StringIO())
+        out = StringIO()
+        call_command('compact_moves', stdout=out)
+        name = '0003_helper_rename_tables_squashed_0004_helper_delete_models'
+        self.assertIn('base_app.%s' % name, out.getvalue())
+        self.assertIn('re-points foreign_app.0002_helper_move_relations', out.getvalue())
+        self.assertIn(name, self.migration_names('base_app'))
+
+        # the database which applied the moves has the squashed migration applied
+        self.unload_migrations()
+        loader = MigrationLoader(connection)
+        self.assertNotIn(('base_app', '0003_helper_rename_tables'), loader.graph.nodes)
+        self.assertIn(('base_app', name), loader.applied_migrations)
+        self.assertEqual(MigrationExecutor(connection).migration_plan(loader.graph.leaf_nodes()), [])
+        self.assertNotIn(('base_app', '0003_helper_rename_tables'),
+                         loader.graph.nodes['foreign_app', '0002_helper_move_relations'].dependencies)
+
+        # and a new one gets the tables of the moved model from it
+        call_command('migrate', database='other', verbosity=0)
+        tables = connections['other'].introspection.table_names()
+        self.assertIn('target_app_secondtestmodel', tables)
+        self.assertNotIn('base_app_secondtestmodel', tables)
+        out = StringIO()
+        call_command('makemigrations', 'base_app', 'target_app', 'foreign_app', dry_run=True, stdout=out)
+        self.assertNotIn('secondtestmodel', out.getvalue().lower())
@@ -0,0 +1,79 @@
+from django.contrib.admin.models import LogEntry, ADDITION
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from migration_helper.contenttypes import move_content_type, repoint
+
+
+class TestMoveContentType(TestCase):
+    """
+    Here we move the content type of a model from base_app to target_app
+    """
+    def setUp(self):
+        self.old = ContentType.objects.create(app_label='base_app', model='movedmodel')
+        self.user = User.objects.create(username='user')
+        self.log_entries = [
+            LogEntry.objects.create(user=self.user, content_type=self.old, object_id=str(pk), object_repr=str(pk),
+                                    action_flag=ADDITION)
+            for pk in range(5)
+        ]
+
+    def _permission(self, content_type, codename):
+        return Permission.objects.create(content_type=content_type, codename=codename, name=codename)
+
+    def test_rename(self):
+        self.assertEqual(move_content_type('default', 'base_app', 'target_app', 'movedmodel'), 'renamed')
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.app_label, 'target_app')
+
+    def test_missing(self):
+        self.assertIsNone(move_content_type('default', 'foreign_app', 'target_app', 'movedmodel'))
+
+    def test_merge(self):
+        new = ContentType.objects.create(app_label='target_app', model='movedmodel')
+        old_add = self._permission(self.old, 'add_movedmodel')
+        old_custom = self._permission(self.old, 'export_movedmodel')
+        new_add = self._permission(new, 'add_movedmodel')
+        holder = User.objects.create(username='holder')
+        holder.user_permissions.add(old_add)
+        both = User.objects.create(username='both')
+        both.user_permissions.add(old_add, new_add)
+        group = Group.objects.create(name='group')
+        group.permissions.add(old_add, old_custom)
+
+        self.assertEqual(move_content_type('default', 'base_app', 'target_app', 'movedmodel', chunk_size=2),
+                         'merged')
+
+        self.assertFalse(ContentType.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(Permission.objects.filter(pk=old_add.pk).exists())
+        old_custom.refresh_from_db()
+        self.assertEqual(old_custom.content_type, new)
+        self.assertEqual(list(holder.user_permissions.all()), [new_add])
+        self.assertEqual(list(both.user_permissions.all()), [new_add])
+        self.assertEqual(set(group.permissions.all()), {new_add, old_custom})
+        self.assertEqual(LogEntry.objects.filter(content_type=new).count(), 5)
+
+
+class TestRepoint(TestCase):
+    """
+    Here we re-point rows from one content type to another chunk by chunk
+    """
+    def test_repoint_in_chunks(self):
+        old = ContentType.objects.create(app_label='base_app', model='movedmodel')
+        new = ContentType.objects.create(app_label='target_app', model='movedmodel')
+        other = ContentType.objects.create(app_label='base_app', model='othermodel')
+        user = User.objects.create(username='user')
+        for pk, content_type in enumerate([old] * 5 + [other]):
+            LogEntry.objects.create(user=user, content_type=content_type, object_id=str(pk), object_repr=str(pk),
+                                    action_flag=ADDITION)
+        progress = []
+        field = LogEntry._meta.get_field('content_type')
+
+        updated = repoint(LogEntry, field, old.pk, new.pk, 'default', chunk_size=2,
+                          progress=lambda model, field, updated: progress.append(updated))
+
+        self.assertEqual(updated, 5)
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertEqual(LogEntry.objects.filter(content_type=new).count(), 5)
+        self.assertEqual(LogEntry.objects.filter(content_type=other).count(), 1)
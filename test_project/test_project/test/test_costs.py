@@ -0,0 +1,68 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase
+
+from migration_helper.costs import Cost, format_cost, is_high_cost, TableStats
+from test_project.test.moves import MoveTestCase
+
+
+class TestEstimateCosts(MoveTestCase):
+    """
+    Here we estimate the cost of every operation of a move with --dry-run, from the rows of the tables it touches
+    """
+    def setUp(self):
+        super().setUp()
+        with connection.cursor() as cursor:
+            for pk in range(3):
+                cursor.execute("INSERT INTO base_app_secondtestmodel (id, field) VALUES (%s, 'a')", [pk + 1])
+
+    def _dry_run(self):
+        out = StringIO()
+        call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', dry_run=True, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        out = self._dry_run()
+        self.assertIn('Estimated costs.', out)
+        self.assertIn('base_app.0003_helper_rename_tables: Rename table for secondtestmodel to '
+                      'target_app_secondtestmodel', out)
+        self.assertRegex(out, r'base_app_secondtestmodel: 3 rows, [^;]+; renamed in the catalog, no rows read; '
+                              r'database write lock')
+        # SQLite remakes the tables of the altered relations
+        for table in ('foreign_app_testfkmodel', 'foreign_app_testm2mmodel_test_second_m2m',
+                      'foreign_app_testo2omodel'):
+            self.assertRegex(out, r'%s: 0 rows, [^;]+; every row is rewritten; database write lock' % table)
+        self.assertNotIn('HIGH COST', out)
+        # estimating reads the catalog only, nothing is renamed
+        self.assertIn('base_app_secondtestmodel', connection.introspection.table_names())
+
+    def test_high_cost(self):
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO foreign_app_testfkmodel (id, test_fk_id, test_second_fk_id) VALUES (1, 1, 1)')
+        with patch('migration_helper.costs.HIGH_COST_ROWS', 1):
+            out = self._dry_run()
+        self.assertRegex(out, r'HIGH COST foreign_app_testfkmodel: 1 rows')
+        # renames read no rows, whatever the size of the table
+        self.assertRegex(out, r'\n      base_app_secondtestmodel: 3 rows')
+        self.assertIn('1 operation flagged for scanning or rewriting big tables', out)
+
+
+class TestFormatCost(SimpleTestCase):
+    """
+    Here we describe costs by the statistics at hand
+    """
+    def test_format_cost(self):
+        stats = TableStats(1200000, 3 * 1024 ** 3, True, False)
+        cost = Cost('base_app_testmodel', 'scan', 'SHARE ROW EXCLUSIVE', stats)
+        self.assertTrue(is_high_cost(cost))
+        self.assertEqual(format_cost(cost), 'HIGH COST base_app_testmodel: ~1,200,000 rows, 3.0 GB; every row is read; '
+                                            'SHARE ROW EXCLUSIVE')
+        cost = Cost('base_app_testmodel', 'rewrite', 'database write lock', TableStats(1000000, None, False, True))
+        self.assertEqual(format_cost(cost), 'HIGH COST base_app_testmodel: >1,000,000 rows, size unknown; every row '
+                                            'is rewritten; database write lock')
+        cost = Cost('base_app_testmodel', 'rename', None, None)
+        self.assertFalse(is_high_cost(cost))
+        self.assertEqual(format_cost(cost), 'base_app_testmodel: no statistics; renamed in the catalog, no rows read')
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+
+from django.db import connection, models
+from django.db.migrations.state import ModelState, ProjectState
+from django.test import TransactionTestCase
+
+from base_app.models import TestModel
+from migration_helper.datacopy import ModelCopy
+
+
+class TestModelCopy(TransactionTestCase):
+    """
+    Here we copy the rows of base_app.TestModel into a table of the same fields
+    """
+    def setUp(self):
+        state = ProjectState()
+        state.add_model(ModelState('target_app', 'TestModel', [
+            ('id', models.AutoField(primary_key=True)),
+            ('test_field', models.CharField(max_length=1)),
+        ], options={'db_table': 'target_app_copiedmodel'}))
+        self.target_model = state.apps.get_model('target_app', 'TestModel')
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(TestModel)
+        TestModel.objects.bulk_create(TestModel(pk=pk, test_field='abcdefg'[pk % 7]) for pk in range(1, 11))
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.directory.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+        with connection.schema_editor() as schema_editor:
+            for model in (TestModel, self.target_model):
+                if model._meta.db_table in connection.introspection.table_names():
+                    schema_editor.delete_model(model)
+
+    def _copy(self):
+        return ModelCopy(TestModel, self.target_model, 'default', 'default', chunk_size=3,
+                         checkpoint_path=self.checkpoint_path)
+
+    def _target_pks(self):
+        return list(self.target_model.objects.order_by('pk').values_list('pk', flat=True))
+
+    def test_copy_in_chunks(self):
+        copy = self._copy()
+        self.assertTrue(copy.create_table())
+        self.assertFalse(copy.create_table())
+        progress = []
+        self.assertEqual(copy.copy(progress.append), 10)
+        self.assertEqual(progress, [3, 6, 9, 10])
+        self.assertEqual(self._target_pks(), list(range(1, 11)))
+        with open(self.checkpoint_path) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)['last_pk'], 10)
+        source, target = copy.verify()
+        self.assertEqual(source, target)
+        self.assertEqual(source[0], 10)
+
+    def test_resume_after_checkpoint(self):
+        copy = self._copy()
+        copy.create_table()
+        with open(self.checkpoint_path, 'w') as checkpoint_file:
+            json.dump({'last_pk': 4}, checkpoint_file)
+        self.assertEqual(copy.copy(), 6)
+        self.assertEqual(self._target_pks(), list(range(5, 11)))
+
+    def test_resume_after_committed_rows(self):
+        # the checkpoint lags behind rows committed right before an interruption
+        copy = self._copy()
+        copy.create_table()
+        self.target_model.objects.bulk_create(
+            self.target_model(pk=pk, test_field='abcdefg'[pk % 7]) for pk in range(1, 8)
+        )
+        with open(self.checkpoint_path, 'w') as checkpoint_file:
+            json.dump({'last_pk': 3}, checkpoint_file)
+        self.assertEqual(copy.copy(), 3)
+        self.assertEqual(self._target_pks(), list(range(1, 11)))
+
+    def test_checksum_mismatch(self):
+        copy = self._copy()
+        copy.create_table()
+        copy.copy()
+        self.target_model.objects.filter(pk=5).update(test_field='z')
+        (source_count, source_checksum), (target_count, target_checksum) = copy.verify()
+        self.assertEqual(source_count, target_count)
+        self.assertNotEqual(source_checksum, target_checksum)
+
+        self.target_model.objects.filter(pk=10).delete()
+        (source_count, source_checksum), (target_count, target_checksum) = copy.verify()
+        self.assertEqual((source_count, target_count), (10, 9))
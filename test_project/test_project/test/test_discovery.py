@@ -0,0 +1,65 @@
+import json
+import os
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+
+from test_project.test.moves import MoveTestCase
+
+ALTER_FIELD = '''
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [('base_app', '0002_testsecondmodelrenamedapp_test_m2m')]
+
+    operations = [
+        migrations.AlterField('SecondTestModel', 'field', models.CharField(max_length=2)),
+    ]
+'''
+
+
+class TestDiscoverMoves(MoveTestCase):
+    """
+    Here we find the models moved in the code by their field signatures and save or run the moves
+    """
+    def test_moves(self):
+        out = StringIO()
+        script = os.path.join(self.directory.name, 'moves.json')
+        call_command('discover_moves', script=script, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'move_model testmodelrenamedapp testsecondmodelrenamedapp base_app rename_app',
+            'move_model secondtestmodel base_app target_app',
+            'Script saved to {}.'.format(script),
+        ])
+        with open(script) as script_file:
+            self.assertEqual(json.load(script_file), {'steps': [
+                {'move_model': {'models': ['testmodelrenamedapp', 'testsecondmodelrenamedapp'],
+                                'base_app': 'base_app', 'target_app': 'rename_app', 'zero_ddl': False}},
+                {'move_model': {'models': ['secondtestmodel'], 'base_app': 'base_app', 'target_app': 'target_app',
+                                'zero_ddl': False}},
+            ]})
+        # nothing is written unless the moves are run
+        self.assertEqual(self.migration_names('target_app'), [])
+
+    def test_differing_fields(self):
+        with open(os.path.join(self.package, 'base_app', '0003_alter_field.py'), 'w') as migration_file:
+            migration_file.write(ALTER_FIELD)
+        out, err = StringIO(), StringIO()
+        call_command('discover_moves', stdout=out, stderr=err)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'move_model testmodelrenamedapp testsecondmodelrenamedapp base_app rename_app',
+        ])
+        self.assertIn('base_app.secondtestmodel disappeared and target_app.secondtestmodel appeared, '
+                      'but their fields differ.', err.getvalue())
+
+    def test_run(self):
+        call_command('discover_moves', run=True, migrate=True, stdout=StringIO())
+        tables = connection.introspection.table_names()
+        for table in ('rename_app_testmodelrenamedapp', 'rename_app_testsecondmodelrenamedapp',
+                      'target_app_secondtestmodel'):
+            self.assertIn(table, tables)
+        out = StringIO()
+        call_command('discover_moves', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['No moved models found.'])
@@ -0,0 +1,46 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+
+from test_project.test.moves import MoveTestCase
+
+
+class TestFanOut(MoveTestCase):
+    """
+    Here we move a model and apply its migrations on two databases at once
+    """
+    migrated_databases = ('default', 'other')
+
+    def _applied(self, alias):
+        return set(MigrationRecorder(connections[alias]).applied_migrations())
+
+    def test_migrate_databases(self):
+        out = StringIO()
+        call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', migrate=True,
+                     database='default,other', workers=2, stdout=out)
+        self.assertIn('Applying migrations on 2 databases', out.getvalue())
+        written = set((app_label, name) for app_label in ('base_app', 'target_app', 'foreign_app')
+                      for name in self.migration_names(app_label) if '_helper_' in name)
+        self.assertEqual(len(written), 4)
+        for alias in ('default', 'other'):
+            self.assertTrue(written <= self._applied(alias))
+            tables = connections[alias].introspection.table_names()
+            self.assertIn('target_app_secondtestmodel', tables)
+            self.assertNotIn('base_app_secondtestmodel', tables)
+        self.assertRegex(out.getvalue(), r'other\s+ok')
+
+    def test_failed_database(self):
+        # other is behind: a migration applied on default is missing there
+        MigrationRecorder.Migration.objects.using('other').filter(
+            app='base_app', name='0002_testsecondmodelrenamedapp_test_m2m',
+        ).delete()
+        out = StringIO()
+        with self.assertRaisesRegex(CommandError, '1 of 2 databases failed: other'):
+            call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', migrate=True,
+                         database='default,other', stdout=out)
+        self.assertIn('target_app_secondtestmodel', connections['default'].introspection.table_names())
+        self.assertIn('base_app_secondtestmodel', connections['other'].introspection.table_names())
+        self.assertIn('are not applied here', out.getvalue())
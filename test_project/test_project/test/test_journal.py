@@ -0,0 +1,86 @@
+import os
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+
+from migration_helper.journal import Journal
+from migration_helper.management.commands import move_model
+from test_project.test.moves import MoveTestCase
+
+LATER = '''
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [('foreign_app', '0001_initial')]
+'''
+
+
+class TestJournal(MoveTestCase):
+    """
+    Here we interrupt a move in its relations phase and run it again with the same journal
+    """
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.directory.name, 'journal.json')
+        resolve_relations = move_model.Command._resolve_relations
+
+        def interrupted(command):
+            # the files of the phase are written, it fails before it finishes
+            resolve_relations(command)
+            raise RuntimeError('interrupted')
+
+        with patch.object(move_model.Command, '_resolve_relations', interrupted):
+            with self.assertRaisesRegex(RuntimeError, 'interrupted'):
+                self._move()
+        self.unload_migrations()
+
+    def _move(self, **options):
+        out = StringIO()
+        call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', migrate=True, journal=self.path,
+                     stdout=out, **options)
+        return out.getvalue()
+
+    def test_resume(self):
+        journal = Journal(self.path, models=['SecondTestModel'], base_app='base_app', target_app='target_app',
+                          database='default', zero_ddl=False)
+        self.assertEqual(list(journal.phases), ['alter model tables', 'create models'])
+        self.assertEqual(journal.pending, [('foreign_app', '0002_helper_move_relations')])
+        self.assertIn('0002_helper_move_relations', self.migration_names('foreign_app'))
+
+        finished = Mock(side_effect=AssertionError('finished phases are not run again'))
+        with patch.object(move_model.Command, '_alter_model_tables', finished), \
+                patch.object(move_model.Command, '_create_models', finished):
+            out = self._move()
+        self.assertIn("Removed {}, its phase didn't finish.".format(
+            os.path.join(self.package, 'foreign_app', '0002_helper_move_relations.py'),
+        ), out)
+        self.assertIn('Resuming from {}, finished: alter model tables, create models.'.format(self.path), out)
+        self.assertIn('Finished by an earlier run, base_app.0003_helper_rename_tables.', out)
+        self.assertIn('Finished by an earlier run, target_app.0001_helper_create_models.', out)
+
+        self.assertEqual(self.migration_names('base_app')[2:],
+                         ['0003_helper_rename_tables', '0004_helper_delete_models'])
+        self.assertEqual(self.migration_names('target_app'), ['0001_helper_create_models'])
+        self.assertEqual(self.migration_names('foreign_app'), ['0001_initial', '0002_helper_move_relations'])
+        self.assertIn('target_app_secondtestmodel', connection.introspection.table_names())
+        out = StringIO()
+        call_command('makemigrations', 'base_app', 'target_app', 'foreign_app', dry_run=True, stdout=out)
+        self.assertNotIn('secondtestmodel', out.getvalue().lower())
+
+    def test_other_inputs(self):
+        with self.assertRaisesRegex(CommandError, 'records another move'):
+            self._move(zero_ddl=True)
+        self.assertEqual(self.migration_names('base_app')[2:], ['0003_helper_rename_tables'])
+
+    def test_other_leaves(self):
+        with open(os.path.join(self.package, 'foreign_app', '0002_later.py'), 'w') as migration_file:
+            migration_file.write(LATER)
+        MigrationRecorder.Migration.objects.create(app='foreign_app', name='0002_later')
+        with self.assertRaisesRegex(CommandError, 'was started on top of other migrations'):
+            self._move()
+        self.assertEqual(self.migration_names('base_app')[2:], ['0003_helper_rename_tables'])
@@ -0,0 +1,213 @@
+import ast
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase, override_settings
+
+from migration_helper.loader import (
+    AstMigrationLoader, CachedMigration, CachedMigrationLoader, read_migration_file, same_graph, Swappable, _literal,
+)
+
+INITIAL = '''
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Created by hand.
+    """
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel('SecondTestModel', [('id', models.AutoField(primary_key=True))]),
+    ]
+'''
+
+COMPUTED = '''
+from django.db import migrations
+
+BASE = [('target_app', '0001_initial')]
+
+
+class Migration(migrations.Migration):
+    dependencies = BASE + [('auth', '0001_initial')]
+'''
+
+
+class TestReadMigrationFile(SimpleTestCase):
+    """
+    Here we read the graph attributes of migration files without importing them
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _read(self, source):
+        path = os.path.join(self.directory.name, 'migration.py')
+        with open(path, 'w') as migration_file:
+            migration_file.write(textwrap.dedent(source))
+        return read_migration_file(path)
+
+    def test_literal_attributes(self):
+        self.assertEqual(self._read(INITIAL), {
+            'initial': True,
+            'dependencies': [Swappable('AUTH_USER_MODEL'), ['contenttypes', '0002_remove_content_type_name']],
+        })
+        self.assertEqual(self._read('''
+            from django.db.migrations import Migration
+
+
+            class Migration(Migration):
+                replaces = [('target_app', '0001_initial'), ('target_app', '0002_second')]
+                atomic = False
+                run_before = []
+        '''), {'replaces': [['target_app', '0001_initial'], ['target_app', '0002_second']], 'atomic': False,
+               'run_before': []})
+
+    def test_files_to_import(self):
+        self.assertIsNone(self._read(COMPUTED))
+        self.assertIsNone(self._read('class Migration(migrations.Migration:\n    pass\n'))
+        self.assertIsNone(self._read('from django.db import migrations\n'))
+        self.assertIsNone(self._read(INITIAL + "\nMigration.dependencies.append(('auth', '0001_initial'))\n"))
+        self.assertIsNone(self._read(INITIAL + '''
+    def __init__(self, name, app_label):
+        super().__init__(name, app_label)
+'''))
+        self.assertIsNone(self._read('''
+            from django.db import migrations
+
+
+            class Migration(migrations.Migration):
+                dependencies = replaces = []
+                dependencies[0:0] = [('auth', '0001_initial')]
+        '''))
+
+    def test_literal(self):
+        def literal(source):
+            return _literal(ast.parse(source, mode='eval').body)
+        self.assertEqual(literal("[('auth', '0001_initial')]"), [['auth', '0001_initial']])
+        self.assertEqual(literal('swappable_dependency(settings.AUTH_USER_MODEL)'), Swappable('AUTH_USER_MODEL'))
+        self.assertEqual(literal('(True,)'), [True])
+        for source in ('swappable_dependency(AUTH_USER_MODEL)', "swappable_dependency('auth.User')",
+                       'settings.AUTH_USER_MODEL', "[('auth', NAME)]"):
+            with self.assertRaises(ValueError):
+                literal(source)
+
+
+class TestAstMigrationLoader(SimpleTestCase):
+    """
+    Here we compare the graph read from the migration files with the one of the MigrationLoader
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        package = os.path.join(self.directory.name, 'loader_migrations')
+        os.mkdir(package)
+        for name, source in (('__init__', ''), ('0001_initial', INITIAL), ('0002_computed', COMPUTED)):
+            with open(os.path.join(package, name + '.py'), 'w') as migration_file:
+                migration_file.write(source)
+        sys.path.insert(0, self.directory.name)
+        self.settings = override_settings(MIGRATION_MODULES={'target_app': 'loader_migrations'})
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        sys.path.remove(self.directory.name)
+        for name in [name for name in sys.modules if name.startswith('loader_migrations')]:
+            del sys.modules[name]
+        self.directory.cleanup()
+
+    def test_same_graph(self):
+        loader = AstMigrationLoader(None)
+        expected = MigrationLoader(None)
+        self.assertIn(('target_app', '0001_initial'), loader.graph.nodes)
+        self.assertEqual(loader.imported, [('target_app', '0002_computed')])
+        self.assertEqual(loader.graph.nodes['target_app', '0001_initial'].operations, [])
+        self.assertTrue(same_graph(loader.graph, expected.graph))
+        self.assertEqual(loader.unmigrated_apps, expected.unmigrated_apps)
+
+    def test_other_graph(self):
+        loader = AstMigrationLoader(None)
+        expected = MigrationLoader(None)
+        expected.graph.add_dependency(None, ('target_app', '0002_computed'), ('sessions', '0001_initial'))
+        self.assertFalse(same_graph(loader.graph, expected.graph))
+
+    def test_no_project_state(self):
+        with self.assertRaises(ValueError):
+            AstMigrationLoader(None).project_state()
+
+
+class TestCachedMigrationLoader(SimpleTestCase):
+    """
+    Here we load migrations twice through the cache and compare them with the ones of the MigrationLoader
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.package = os.path.join(self.directory.name, 'cached_migrations')
+        os.mkdir(self.package)
+        for name, source in (('__init__', ''), ('0001_initial', INITIAL), ('0002_computed', COMPUTED)):
+            with open(os.path.join(self.package, name + '.py'), 'w') as migration_file:
+                migration_file.write(source)
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+        sys.path.insert(0, self.directory.name)
+        self.settings = override_settings(MIGRATION_MODULES={'target_app': 'cached_migrations'})
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        sys.path.remove(self.directory.name)
+        for name in [name for name in sys.modules if name.startswith('cached_migrations')]:
+            del sys.modules[name]
+        self.directory.cleanup()
+
+    def _unload(self):
+        # a new run imports the migrations afresh
+        for name in [name for name in sys.modules if name.startswith('cached_migrations.')]:
+            del sys.modules[name]
+
+    def test_cached_graph(self):
+        CachedMigrationLoader(None, self.cache_dir)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, 'apps', 'target_app.json')))
+        self._unload()
+
+        loader = CachedMigrationLoader(None, self.cache_dir)
+        migration = loader.graph.nodes['target_app', '0001_initial']
+        self.assertIsInstance(migration, CachedMigration)
+        # operations are imported only once they are used
+        self.assertNotIn('cached_migrations.0001_initial', sys.modules)
+        expected = MigrationLoader(None)
+        self.assertTrue(same_graph(loader.graph, expected.graph))
+        self.assertEqual(migration.dependencies, expected.graph.nodes['target_app', '0001_initial'].dependencies)
+        self.assertEqual(migration.dependencies[0].setting, 'auth.User')
+        self.assertEqual([operation.deconstruct() for operation in migration.operations],
+                         [operation.deconstruct() for operation in
+                          expected.graph.nodes['target_app', '0001_initial'].operations])
+        self.assertEqual(loader.project_state().models, expected.project_state().models)
+
+    def test_changed_file(self):
+        CachedMigrationLoader(None, self.cache_dir)
+        path = os.path.join(self.package, '0002_computed.py')
+        with open(path, 'a') as migration_file:
+            migration_file.write("Migration.dependencies.append(('sessions', '0001_initial'))\n")
+        self._unload()
+        loader = CachedMigrationLoader(None, self.cache_dir)
+        self.assertNotIsInstance(loader.graph.nodes['target_app', '0002_computed'], CachedMigration)
+        self.assertIn(('sessions', '0001_initial'), loader.graph.nodes['target_app', '0002_computed'].dependencies)
+
+    def test_private_directory(self):
+        CachedMigrationLoader(None, self.cache_dir)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_dir).st_mode) & 0o077, 0)
+        os.chmod(self.cache_dir, 0o777)
+        with self.assertRaises(ValueError):
+            CachedMigrationLoader(None, self.cache_dir)
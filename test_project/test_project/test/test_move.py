@@ -0,0 +1,186 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_migrate, pre_migrate
+from django.db.migrations import SeparateDatabaseAndState
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.test.utils import CaptureQueriesContext
+
+from migration_helper.loader import same_graph
+from migration_helper.management.commands import move_model
+from test_project.test.moves import MoveTestCase
+
+
+class TestInMemoryState(MoveTestCase):
+    """
+    Here we move a model and compare the graph and state kept in memory with the ones loaded from the written files
+    """
+    def test_graph_and_state(self):
+        command = move_model.Command()
+        call_command(command, 'SecondTestModel', 'base_app', 'target_app', migrate=True, profile='',
+                     stdout=StringIO())
+
+        loader = MigrationLoader(connection, ignore_no_migrations=True)
+        self.assertTrue(same_graph(command.loader.graph, loader.graph))
+        state = loader.project_state()
+        self.assertTrue(command.from_state.models)
+        for key, model_state in command.from_state.models.items():
+            self.assertEqual(model_state, state.models[key])
+        self.assertNotIn(('base_app', 'secondtestmodel'), command.from_state.models)
+        self.assertEqual(sorted(command.written_nodes), [
+            (app_label, name) for app_label in ('base_app', 'foreign_app', 'target_app')
+            for name in self.migration_names(app_label) if '_helper_' in name
+        ])
+        self.assertTrue(set(command.written_nodes) <= set(MigrationRecorder(connection).applied_migrations()))
+
+        # the preflight graph is read from the files, the migrations are imported once for all phases
+        report = command.profiler.report()
+        self.assertEqual(report['total']['loader_builds'], 2)
+        self.assertEqual([phase['loader_builds'] for phase in report['phases'] if phase['name'] == 'load state'], [1])
+
+
+class TestMoveModels(MoveTestCase):
+    """
+    Here we move both models of rename_app with one pattern and one set of migrations
+    """
+    def test_pattern(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO base_app_testmodelrenamedapp (id, text) VALUES (1, 'a')")
+        out = StringIO()
+        call_command('move_model', 'Test*RenamedApp', 'base_app', 'rename_app', migrate=True, stdout=out)
+        self.assertIn('Moving testmodelrenamedapp, testsecondmodelrenamedapp from base_app to rename_app',
+                      out.getvalue())
+
+        # one migration for every phase, whatever the number of models
+        self.assertEqual(self.migration_names('base_app')[2:],
+                         ['0003_helper_rename_tables', '0004_helper_delete_models'])
+        self.assertEqual(self.migration_names('rename_app'), ['0001_helper_create_models'])
+        self.assertEqual(self.migration_names('foreign_app'), ['0001_initial', '0002_helper_move_relations'])
+
+        tables = connection.introspection.table_names()
+        for table in ('rename_app_testmodelrenamedapp', 'rename_app_testsecondmodelrenamedapp',
+                      'rename_app_testsecondmodelrenamedapp_test_m2m'):
+            self.assertIn(table, tables)
+            self.assertNotIn(table.replace('rename_app', 'base_app', 1), tables)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT text FROM rename_app_testmodelrenamedapp')
+            self.assertEqual(cursor.fetchall(), [('a', )])
+
+        # what's left is SecondTestModel, it wasn't moved
+        out = StringIO()
+        call_command('makemigrations', 'base_app', 'rename_app', 'foreign_app', dry_run=True, stdout=out)
+        self.assertNotIn('renamedapp', out.getvalue().lower())
+        self.assertIn('Delete model SecondTestModel', out.getvalue())
+
+
+class TestZeroDDL(MoveTestCase):
+    """
+    Here we move a model with --zero-ddl, only its tables are renamed
+    """
+    def test_state_only_relations(self):
+        command = move_model.Command()
+        with CaptureQueriesContext(connection) as queries:
+            call_command(command, 'SecondTestModel', 'base_app', 'target_app', migrate=True, zero_ddl=True,
+                         stdout=StringIO())
+
+        migration = command.loader.graph.nodes['foreign_app', '0002_helper_move_relations']
+        self.assertEqual(len(migration.operations), 1)
+        self.assertIsInstance(migration.operations[0], SeparateDatabaseAndState)
+        self.assertEqual(migration.operations[0].database_operations, [])
+        self.assertEqual(sorted(operation.name for operation in migration.operations[0].state_operations),
+                         ['test_second_fk', 'test_second_m2m', 'test_second_o2o'])
+        # the tables of foreign_app are neither altered nor rebuilt
+        self.assertEqual([query['sql'] for query in queries if 'foreign_app_' in query['sql'] and
+                          query['sql'].split()[0].upper() in ('ALTER', 'CREATE', 'DROP', 'INSERT')], [])
+        self.assertIn('target_app_secondtestmodel', connection.introspection.table_names())
+
+        out = StringIO()
+        call_command('makemigrations', 'foreign_app', dry_run=True, stdout=out)
+        self.assertNotIn('test_second', out.getvalue())
+
+
+class TestApplyInProcess(MoveTestCase):
+    """
+    Here we apply the migrations of a move in the same process, on the graph and state already loaded
+    """
+    def test_only_written_migrations(self):
+        signals = []
+
+        def receiver(**kwargs):
+            signals.append(kwargs['app_config'].label)
+
+        applied = set(MigrationRecorder(connection).applied_migrations())
+        command = move_model.Command()
+        pre_migrate.connect(receiver)
+        post_migrate.connect(receiver)
+        try:
+            call_command(command, 'SecondTestModel', 'base_app', 'target_app', migrate=True, profile='',
+                         stdout=StringIO())
+        finally:
+            pre_migrate.disconnect(receiver)
+            post_migrate.disconnect(receiver)
+
+        self.assertEqual(set(MigrationRecorder(connection).applied_migrations()) - applied, set(command.written_nodes))
+        self.assertEqual(signals, [])
+        phase = next(phase for phase in command.profiler.phases if phase['name'] == 'apply migrations')
+        self.assertEqual((phase['loader_builds'], phase['migration_files']), (0, 0))
+        with connection.cursor() as cursor:
+            relations = connection.introspection.get_relations(cursor, 'foreign_app_testfkmodel')
+        self.assertEqual(relations['test_second_fk_id'], ('id', 'target_app_secondtestmodel'))
+
+
+class TestRelationClosure(MoveTestCase):
+    """
+    Here we check that only the moved model and the models related to it are kept in the states
+    """
+    def test_closure(self):
+        command = move_model.Command()
+        call_command(command, 'SecondTestModel', 'base_app', 'target_app', dry_run=True, stdout=StringIO())
+
+        closure = {
+            ('base_app', 'secondtestmodel'), ('target_app', 'secondtestmodel'), ('base_app', 'testmodel'),
+            ('foreign_app', 'testfkmodel'), ('foreign_app', 'testm2mmodel'), ('foreign_app', 'testo2omodel'),
+        }
+        # the dry run doesn't move the state past the written migrations
+        self.assertEqual(set(command.initial_state.models), closure - {('target_app', 'secondtestmodel')})
+        self.assertEqual(set(command.to_state.models), closure - {('base_app', 'secondtestmodel')})
+        # rendered once and reloaded model by model as the phases move the state forward
+        rendered = set((model._meta.app_label, model._meta.model_name) for model in command.old_apps.get_models())
+        self.assertLess(rendered, closure)
+        self.assertNotIn(('foreign_app', 'testrenamedmodel'), command.from_state.models)
+        self.assertFalse(any(app_label in ('auth', 'contenttypes') for app_label, model in command.from_state.models))
+
+
+class TestThroughTables(MoveTestCase):
+    """
+    Here we move a model with a ManyToManyField, its auto-created through table is renamed in place
+    """
+    m2m_table = 'testsecondmodelrenamedapp_test_m2m'
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('move_model', 'TestSecondModelRenamedApp', 'base_app', 'rename_app', dry_run=True, stdout=out)
+        self.assertIn('Would rename table base_app_{0} to rename_app_{0}.'.format(self.m2m_table), out.getvalue())
+
+    def test_renamed_in_place(self):
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO base_app_testsecondmodelrenamedapp (id) VALUES (1)')
+            cursor.execute('INSERT INTO foreign_app_testrenamedmodel (id) VALUES (2)')
+            cursor.execute('INSERT INTO base_app_%s (testsecondmodelrenamedapp_id, testrenamedmodel_id) '
+                           'VALUES (1, 2)' % self.m2m_table)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('move_model', 'TestSecondModelRenamedApp', 'base_app', 'rename_app', migrate=True,
+                         stdout=StringIO())
+
+        tables = connection.introspection.table_names()
+        self.assertIn('rename_app_' + self.m2m_table, tables)
+        self.assertNotIn('base_app_' + self.m2m_table, tables)
+        # neither created anew nor copied, whatever the rows
+        self.assertEqual([query['sql'] for query in queries if self.m2m_table in query['sql'] and
+                          query['sql'].split()[0].upper() in ('CREATE', 'INSERT', 'DROP')], [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT testsecondmodelrenamedapp_id, testrenamedmodel_id FROM rename_app_%s'
+                           % self.m2m_table)
+            self.assertEqual(cursor.fetchall(), [(1, 2)])
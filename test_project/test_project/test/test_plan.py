@@ -0,0 +1,91 @@
+import json
+import os
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import override_settings
+
+from migration_helper.plan import write_plan
+from test_project.test.moves import MoveTestCase
+
+
+class TestPlan(MoveTestCase):
+    """
+    Here we save the plan of a move and replay it
+    """
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.directory.name, 'plan.json')
+        call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', dry_run=True, emit_plan=self.path,
+                     stdout=StringIO())
+        with open(self.path) as plan_file:
+            self.plan = json.load(plan_file)
+
+    def _replay(self, **options):
+        call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', from_plan=self.path,
+                     stdout=StringIO(), **options)
+
+    def _rewrite(self, **changes):
+        plan = dict(self.plan, **changes)
+        for key in ('version', 'command', 'signature'):
+            del plan[key]
+        write_plan(self.path, 'move_model', **plan)
+
+    def test_round_trip(self):
+        self.assertEqual(self.migration_names('target_app'), [])
+        self.assertEqual([(entry['app_label'], entry['name']) for entry in self.plan['migrations']], [
+            ('base_app', '0003_helper_rename_tables'), ('target_app', '0001_helper_create_models'),
+            ('foreign_app', '0002_helper_move_relations'), ('base_app', '0004_helper_delete_models'),
+        ])
+        self.assertEqual(self.plan['tables'], ['base_app_secondtestmodel'])
+
+        self._replay(migrate=True)
+        for entry in self.plan['migrations']:
+            self.assertIn(entry['name'], self.migration_names(entry['app_label']))
+            with open(os.path.join(self.package, entry['app_label'], entry['name'] + '.py')) as migration_file:
+                self.assertEqual(migration_file.read(), entry['source'])
+        applied = set(MigrationRecorder(connection).applied_migrations())
+        self.assertTrue(set((entry['app_label'], entry['name']) for entry in self.plan['migrations']) <= applied)
+        self.assertIn('target_app_secondtestmodel', connection.introspection.table_names())
+        out = StringIO()
+        call_command('makemigrations', 'base_app', 'target_app', 'foreign_app', dry_run=True, stdout=out)
+        self.assertNotIn('secondtestmodel', out.getvalue().lower())
+
+        # replayed once, its tables are renamed
+        with self.assertRaisesRegex(CommandError, "Tables base_app_secondtestmodel of .* don't exist"):
+            self._replay()
+
+    def test_changed_source(self):
+        migrations = self.plan['migrations']
+        migrations[0]['source'] += "\nimport os\nos.remove('/')\n"
+        with open(self.path, 'w') as plan_file:
+            json.dump(dict(self.plan, migrations=migrations), plan_file)
+        with self.assertRaisesRegex(CommandError, 'changed after it was made'):
+            self._replay()
+        self.assertEqual(self.migration_names('target_app'), [])
+
+    def test_other_secret_key(self):
+        with override_settings(SECRET_KEY='another key'):
+            with self.assertRaisesRegex(CommandError, 'another SECRET_KEY'):
+                self._replay()
+
+    def test_vendor(self):
+        self._rewrite(vendor='oracle')
+        with self.assertRaisesRegex(CommandError, 'made for oracle, not sqlite'):
+            self._replay()
+
+    def test_missing_table(self):
+        self._rewrite(tables=['base_app_secondtestmodel', 'base_app_gone'])
+        with self.assertRaisesRegex(CommandError, "Tables base_app_gone of .* don't exist"):
+            self._replay()
+
+    def test_other_leaves(self):
+        with open(os.path.join(self.package, 'base_app', '0003_later.py'), 'w') as migration_file:
+            migration_file.write('from django.db import migrations\n\n\nclass Migration(migrations.Migration):\n'
+                                 "    dependencies = [('base_app', '0002_testsecondmodelrenamedapp_test_m2m')]\n")
+        MigrationRecorder.Migration.objects.create(app='base_app', name='0003_later')
+        with self.assertRaisesRegex(CommandError, 'Make a new plan'):
+            self._replay()
@@ -0,0 +1,70 @@
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import StateApps
+from django.test import SimpleTestCase
+
+from migration_helper.profiling import PhaseProfiler
+
+
+class TestPhaseProfiler(SimpleTestCase):
+    """
+    Here we profile nested and retried phases
+    """
+    def setUp(self):
+        self.profiler = PhaseProfiler(enabled=True)
+
+    def _phases(self):
+        return dict((phase['name'], phase) for phase in self.profiler.report()['phases'])
+
+    def test_nested_phases(self):
+        build_graph, init = MigrationLoader.__dict__['build_graph'], StateApps.__dict__['__init__']
+        with self.profiler.phase('prepare move'):
+            with self.profiler.phase('load state'):
+                MigrationLoader(None)
+                self.assertEqual(self.profiler.name, 'load state')
+            MigrationLoader(None)
+        self.assertIs(MigrationLoader.__dict__['build_graph'], build_graph)
+        self.assertIs(StateApps.__dict__['__init__'], init)
+
+        phases = self._phases()
+        self.assertEqual(phases['prepare move']['loader_builds'], 1)
+        self.assertEqual(phases['load state']['loader_builds'], 1)
+        self.assertEqual(phases['load state']['depth'], 1)
+        self.assertGreaterEqual(phases['prepare move']['peak_memory'], phases['load state']['peak_memory'])
+        total = self.profiler.report()['total']
+        self.assertEqual(total['loader_builds'], 2)
+        self.assertEqual(total['wall'], phases['prepare move']['wall'])
+
+    def test_retried_phases(self):
+        attempts = []
+
+        def rename():
+            with self.profiler.phase('content types'):
+                MigrationLoader(None)
+            with self.profiler.phase('database tables'):
+                attempts.append(len(attempts) + 1)
+                if len(attempts) < 3:
+                    raise RuntimeError('locked')
+
+        function = self.profiler.retried(rename)
+        for attempt in range(2):
+            with self.assertRaises(RuntimeError):
+                function()
+        function()
+
+        self.assertEqual([phase['name'] for phase in self.profiler.phases], ['content types', 'database tables'])
+        phases = self._phases()
+        self.assertEqual(phases['content types']['attempts'], 3)
+        self.assertEqual(phases['content types']['loader_builds'], 3)
+        self.assertIn('content types x3', self.profiler.summary())
+
+        # a phase run again outside the retried function is a phase of its own
+        with self.profiler.phase('content types'):
+            pass
+        self.assertEqual(len(self.profiler.phases), 3)
+
+    def test_disabled(self):
+        profiler = PhaseProfiler()
+        with profiler.phase('load state'):
+            self.assertEqual(profiler.name, 'load state')
+            profiler.count('migration_files')
+        self.assertEqual(profiler.phases, [])
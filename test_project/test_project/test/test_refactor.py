@@ -0,0 +1,83 @@
+import json
+import os
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import override_settings
+
+from test_project.test.moves import MoveTestCase
+
+
+class OtherDatabaseRouter(object):
+    # the moved SecondTestModel lives on the other database
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower == 'target_app.secondtestmodel':
+            return 'other'
+        return None
+
+    db_for_write = db_for_read
+
+
+class TestRefactor(MoveTestCase):
+    """
+    Here we run a script of two moves and apply their migrations at once
+    """
+    steps = [
+        {'move_model': {'models': ['Test*RenamedApp'], 'base_app': 'base_app', 'target_app': 'rename_app'}},
+        {'move_model': {'models': ['SecondTestModel'], 'base_app': 'base_app', 'target_app': 'target_app'}},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.script = os.path.join(self.directory.name, 'script.json')
+        with open(self.script, 'w') as script_file:
+            json.dump({'steps': self.steps}, script_file)
+
+    def _assert_applied(self):
+        applied = set(MigrationRecorder(connection).applied_migrations())
+        for app_label in ('base_app', 'rename_app', 'target_app', 'foreign_app'):
+            for name in self.migration_names(app_label):
+                self.assertIn((app_label, name), applied)
+
+    def test_migrate(self):
+        out = StringIO()
+        call_command('refactor', self.script, migrate=True, lock_timeout=5, stdout=out)
+
+        self.assertEqual(self.migration_names('base_app')[2:], [
+            '0003_helper_rename_tables', '0004_helper_delete_models',
+            '0005_helper_rename_tables', '0006_helper_delete_models',
+        ])
+        self._assert_applied()
+        tables = connection.introspection.table_names()
+        self.assertIn('rename_app_testmodelrenamedapp', tables)
+        self.assertIn('target_app_secondtestmodel', tables)
+        # applied under the lock timeout, one attempt each
+        self.assertIn('Applied base_app.0006_helper_delete_models in', out.getvalue())
+        self.assertIn('1 attempt', out.getvalue())
+        self.assertEqual(sorted(ContentType.objects.filter(
+            app_label__in=('rename_app', 'target_app'),
+        ).values_list('app_label', 'model')), [
+            ('rename_app', 'testmodelrenamedapp'), ('rename_app', 'testsecondmodelrenamedapp'),
+            ('target_app', 'secondtestmodel'),
+        ])
+
+    @override_settings(DATABASE_ROUTERS=[OtherDatabaseRouter()])
+    def test_migrate_routed_model(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO base_app_secondtestmodel (id, field) VALUES (1, 'a'), (2, 'b')")
+        out = StringIO()
+        call_command('refactor', self.script, migrate=True, stdout=out)
+
+        self.assertIn('2 rows copied to target_app_secondtestmodel', out.getvalue())
+        with connections['other'].cursor() as cursor:
+            cursor.execute('SELECT id, field FROM target_app_secondtestmodel ORDER BY id')
+            self.assertEqual(cursor.fetchall(), [(1, 'a'), (2, 'b')])
+        # the copied model keeps its table on the default database, the other one is renamed
+        tables = connection.introspection.table_names()
+        self.assertIn('base_app_secondtestmodel', tables)
+        self.assertIn('rename_app_testmodelrenamedapp', tables)
+        self.assertNotIn('0006_helper_delete_models', self.migration_names('base_app'))
+        self._assert_applied()
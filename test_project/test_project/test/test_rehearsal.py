@@ -0,0 +1,52 @@
+from io import StringIO
+from unittest.mock import Mock
+
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import SimpleTestCase
+
+from migration_helper.rehearsal import _nodb_cursor
+from test_project.test.moves import MoveTestCase
+
+
+class TestRehearsal(MoveTestCase):
+    """
+    Here we rehearse a move on a copy of the database and check the database itself is left as it was
+    """
+    def test_move_model(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO base_app_secondtestmodel (id, field) VALUES (1, 'a')")
+        applied = set(MigrationRecorder(connection).applied_migrations())
+        out = StringIO()
+        call_command('move_model', 'SecondTestModel', 'base_app', 'target_app', rehearse=True, stdout=out)
+
+        self.assertIn("Rehearsing on a copy of 'default'.", out.getvalue())
+        for name in ('base_app.0003_helper_rename_tables', 'target_app.0001_helper_create_models',
+                     'foreign_app.0002_helper_move_relations', 'base_app.0004_helper_delete_models'):
+            self.assertIn(name, out.getvalue())
+        self.assertIn('SQLite locks the whole database for writing', out.getvalue())
+        self.assertIn('the copy was dropped.', out.getvalue())
+
+        # no file is written and nothing is applied, the copy is gone
+        self.assertEqual(self.migration_names('target_app'), [])
+        self.assertEqual(self.migration_names('base_app'), ['0001_initial', '0002_testsecondmodelrenamedapp_test_m2m'])
+        self.assertEqual(set(MigrationRecorder(connection).applied_migrations()), applied)
+        tables = connection.introspection.table_names()
+        self.assertIn('base_app_secondtestmodel', tables)
+        self.assertNotIn('target_app_secondtestmodel', tables)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT field FROM base_app_secondtestmodel')
+            self.assertEqual(cursor.fetchall(), [('a', )])
+        self.assertNotIn('default_rehearsal', connections.databases)
+
+
+class TestNoDBCursor(SimpleTestCase):
+    """
+    Here we open a cursor on the maintenance database the way the Django version at hand allows it
+    """
+    def test_nodb_cursor(self):
+        connection = Mock(spec=['_nodb_cursor', '_nodb_connection'])
+        self.assertIs(_nodb_cursor(connection), connection._nodb_cursor.return_value)
+        connection = Mock(spec=['_nodb_connection'])
+        self.assertIs(_nodb_cursor(connection), connection._nodb_connection.cursor.return_value)
@@ -0,0 +1,165 @@
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, models, OperationalError
+from django.db.backends.utils import truncate_name
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.migrations.state import ModelState, ProjectState
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from rename_app.models import TestSecondModelRenamedApp
+from target_app.models import SecondTestModel
+from migration_helper.management.commands import rename_app
+from migration_helper.rename import _old_name, _plan_sequences
+
+
+class TestOldName(SimpleTestCase):
+    """
+    Here we work out the names tables of target_app had while their models lived in base_app
+    """
+    def test_model_table(self):
+        self.assertEqual(_old_name(SecondTestModel, 'base_app', 'target_app', 200), 'base_app_secondtestmodel')
+
+    def test_custom_table(self):
+        state = ProjectState()
+        state.add_model(ModelState('target_app', 'CustomTable', [
+            ('id', models.AutoField(primary_key=True)),
+        ], options={'db_table': 'custom_table'}))
+        self.assertIsNone(_old_name(state.apps.get_model('target_app', 'CustomTable'), 'base_app', 'target_app', 200))
+
+    def test_auto_created_m2m_table(self):
+        through = TestSecondModelRenamedApp._meta.get_field('test_m2m').remote_field.through
+        self.assertEqual(_old_name(through, 'old_app', 'rename_app', 200),
+                         'old_app_testsecondmodelrenamedapp_test_m2m')
+
+    def test_m2m_table_of_another_app(self):
+        through = TestSecondModelRenamedApp._meta.get_field('test_m2m').remote_field.through
+        self.assertIsNone(_old_name(through, 'old_app', 'target_app', 200))
+
+
+class TestPlanSequences(SimpleTestCase):
+    """
+    Here we match sequences to the tables they belong to by prefix
+    """
+    def _connection(self, vendor, names):
+        connection = MagicMock(vendor=vendor)
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [(name,) for name in names]
+        return connection
+
+    def test_longest_prefix(self):
+        connection = self._connection('postgresql', [
+            'base_app_order_items_id_seq', 'base_app_order_id_seq', 'base_app_orderline_id_seq', 'other_id_seq',
+        ])
+        tables = [('base_app_order', 'target_app_order'), ('base_app_order_items', 'target_app_order_items')]
+        self.assertEqual(_plan_sequences(connection, tables, 63), [
+            ('base_app_order_id_seq', 'target_app_order_id_seq'),
+            ('base_app_order_items_id_seq', 'target_app_order_items_id_seq'),
+        ])
+
+    def test_truncated_names(self):
+        connection = self._connection('postgresql', ['base_app_order_id_seq'])
+        sequences = _plan_sequences(connection, [('base_app_order', 'target_application_order')], 20)
+        self.assertEqual(sequences, [('base_app_order_id_seq', truncate_name('target_application_order_id_seq', 20))])
+
+    def test_no_sequences(self):
+        connection = self._connection('sqlite', ['base_app_order_id_seq'])
+        self.assertEqual(_plan_sequences(connection, [('base_app_order', 'target_app_order')], 63), [])
+        self.assertFalse(connection.cursor.called)
+        connection = self._connection('postgresql', ['base_app_order_id_seq'])
+        self.assertEqual(_plan_sequences(connection, [], 63), [])
+
+
+class TestRenameApp(TransactionTestCase):
+    """
+    Here we rename old_app, whose tables, content types and migrations are left in the database, to rename_app
+    """
+    tables = ('testmodelrenamedapp', 'testsecondmodelrenamedapp', 'testsecondmodelrenamedapp_test_m2m')
+    models = ('testmodelrenamedapp', 'testsecondmodelrenamedapp', 'historicalold_app', 'otherold_app')
+
+    def setUp(self):
+        ContentType.objects.filter(app_label__in=('old_app', 'rename_app')).delete()
+        ContentType.objects.bulk_create([ContentType(app_label='old_app', model=model) for model in self.models])
+        MigrationRecorder.Migration.objects.bulk_create([
+            MigrationRecorder.Migration(app='old_app', name=name) for name in ('0001_initial', '0002_second')
+        ])
+        with connection.cursor() as cursor:
+            for table in self.tables:
+                cursor.execute('CREATE TABLE old_app_%s (id integer PRIMARY KEY)' % table)
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for name in connection.introspection.table_names():
+                if name.startswith(('old_app_', 'rename_app_')):
+                    cursor.execute('DROP TABLE %s' % connection.ops.quote_name(name))
+        MigrationRecorder.Migration.objects.filter(app__in=('old_app', 'rename_app')).delete()
+
+    def _updates(self, queries, table):
+        return [query['sql'] for query in queries if query['sql'].startswith('UPDATE "%s"' % table)]
+
+    def test_rename(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('rename_app', 'old_app', 'rename_app', stdout=out)
+        self.assertIn('4 content types renamed', out.getvalue())
+        self.assertIn('3 tables and 0 sequences renamed', out.getvalue())
+        self.assertIn('2 migrations renamed', out.getvalue())
+
+        # set-based: one UPDATE for the model names carrying the app label and one for the rest, whatever the rows
+        self.assertEqual(len(self._updates(queries, 'django_content_type')), 2)
+        self.assertEqual(len(self._updates(queries, 'django_migrations')), 1)
+        self.assertEqual(sorted(ContentType.objects.filter(app_label='rename_app').values_list('model', flat=True)),
+                         ['historicalrename_app', 'otherrename_app', 'testmodelrenamedapp',
+                          'testsecondmodelrenamedapp'])
+        self.assertFalse(ContentType.objects.filter(app_label='old_app').exists())
+        self.assertEqual(sorted(MigrationRecorder.Migration.objects.filter(app='rename_app').values_list(
+            'name', flat=True
+        )), ['0001_initial', '0002_second'])
+        tables = connection.introspection.table_names()
+        for table in self.tables:
+            self.assertIn('rename_app_' + table, tables)
+            self.assertNotIn('old_app_' + table, tables)
+
+    def test_lock_retry(self):
+        rename_tables = rename_app.Command._rename_tables
+        attempts = []
+
+        def locked(command):
+            attempts.append(command)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            rename_tables(command)
+
+        out = StringIO()
+        with patch.object(rename_app.Command, '_rename_tables', locked):
+            call_command('rename_app', 'old_app', 'rename_app', lock_timeout=1, lock_backoff=0.01, profile='',
+                         stdout=out)
+        self.assertEqual(len(attempts), 2)
+        self.assertIn('2 attempts', out.getvalue())
+        self.assertIn('content types x2', out.getvalue())
+        self.assertEqual(ContentType.objects.filter(app_label='rename_app').count(), 4)
+        self.assertFalse(ContentType.objects.filter(app_label='old_app').exists())
+        self.assertEqual(MigrationRecorder.Migration.objects.filter(app='rename_app').count(), 2)
+        tables = connection.introspection.table_names()
+        for table in self.tables:
+            self.assertIn('rename_app_' + table, tables)
+
+    def test_rehearse(self):
+        out = StringIO()
+        call_command('rename_app', 'old_app', 'rename_app', rehearse=True, stdout=out)
+        self.assertIn("Rehearsing on a copy of 'default'.", out.getvalue())
+        self.assertIn('content types', out.getvalue())
+        self.assertIn('migrations', out.getvalue())
+        self.assertIn('the copy was dropped.', out.getvalue())
+
+        # renamed on the copy only
+        self.assertEqual(ContentType.objects.filter(app_label='old_app').count(), 4)
+        self.assertFalse(ContentType.objects.filter(app_label='rename_app').exists())
+        self.assertEqual(MigrationRecorder.Migration.objects.filter(app='old_app').count(), 2)
+        tables = connection.introspection.table_names()
+        for table in self.tables:
+            self.assertIn('old_app_' + table, tables)
+            self.assertNotIn('rename_app_' + table, tables)